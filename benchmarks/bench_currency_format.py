@@ -0,0 +1,67 @@
+# benchmarks/bench_currency_format.py
+# Compares the scalar format_indian_currency (applied per cell, as the tables used to)
+# with the vectorized format_indian_currency_series on a million values, and checks that
+# both give the same text for those and for edge cases (exits with an error otherwise).
+# Run from the project root: python -m benchmarks.bench_currency_format
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.utils import format_indian_currency, format_indian_currency_series
+
+NUMBER_OF_VALUES = 1_000_000
+REPEATS = 3
+# Values each dtype path must format exactly like the scalar function (object input keeps
+# Python integers beyond 2**53 and beyond int64, which a float would round)
+EDGE_CASES = [
+    pd.Series([0, 999, 1000, -1000, 12345678901234567, 2**53 + 1, -(2**60) - 3, 2**63 - 1, -(2**63), 2**64 + 5,
+               10**30, 1.5, -2.7, True, None, np.nan, 'text', np.int64(123456789)], dtype=object),
+    pd.Series([2**63 - 1, -(2**63), 0, -1234567, 2**53 + 1], dtype='int64'),
+    pd.Series([2**64 - 1, 12345], dtype='uint64'),
+    pd.Series([1e20, -3.3e10, 2.0**53 + 2, 0.9, np.nan]),
+]
+
+
+def make_values(count, seed=42):
+    """Builds a mix of revenue-like values: distinct floats, repeated prices, negatives and NaNs."""
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([
+        rng.lognormal(mean=12, sigma=2, size=count // 2),          # distinct amounts
+        rng.choice([350, 450, 650, 800, 900, 1500, 3800], count // 4).astype(float),  # repeated product prices
+        -rng.lognormal(mean=10, sigma=2, size=count // 4),         # negative net profits
+    ])
+    values[rng.choice(len(values), count // 100, replace=False)] = np.nan
+    return pd.Series(rng.permutation(values))
+
+
+def best_of(function, repeats=REPEATS):
+    """Returns the result and the best wall time of a few runs."""
+    best, result = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    values = make_values(NUMBER_OF_VALUES)
+    print(f"--- Indian currency formatting: {len(values):,} values ---")
+
+    scalar, scalar_time = best_of(lambda: values.apply(lambda x: f"₹{format_indian_currency(x)}"), repeats=1)
+    vectorized, vectorized_time = best_of(lambda: format_indian_currency_series(values, prefix='₹'))
+
+    mismatches = int((scalar != vectorized).sum())
+    for values in EDGE_CASES:
+        expected = values.apply(lambda x: f"₹{format_indian_currency(x)}")
+        mismatches += int((expected != format_indian_currency_series(values, prefix='₹')).sum())
+    print(f"scalar .apply:        {scalar_time:8.3f} s")
+    print(f"vectorized series:    {vectorized_time:8.3f} s  ({scalar_time / vectorized_time:.1f}x faster)")
+    print(f"parity mismatches:    {mismatches}")
+    if mismatches:
+        raise SystemExit("Vectorized formatter does not match the scalar formatter.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# benchmarks/bench_reruns.py
+# End-to-end rerun latency of dashboard.py, driven headlessly with Streamlit's AppTest
+# on a generated dataset. Scripted interactions, in rotation:
+#   - date_range: the sidebar date range moves between the full range, the last 30 days and a middle month
+#   - brand_toggle: one brand is deselected, then selected again
+#   - platform_deselect: 'Organic' (orders without a platform) and a paid platform are
+#     deselected and selected again
+#   - tab_switch: the next dashboard tab is opened
+# Each interaction is timed from widget change to the end of the full rerun it triggers
+# (the server side of what a user waits for; the browser's own rendering is not included).
+# Reports p50/p95/p99 per interaction type. The results file uses the same format as
+# bench_suite.py (p50 as median_ms), so its --compare/--baseline mode works on it.
+#
+# Run from the project root:
+#   python -m benchmarks.bench_reruns                       # scale 1, 30 rounds
+#   python -m benchmarks.bench_reruns --scale 2 --rounds 50 --output logs/benchmarks/reruns.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+
+import create_sql_marts
+import generate_data
+from benchmarks.bench_suite import APPTEST_TIMEOUT, RESULTS_DIR, SEED, TABS, git_commit, quiet
+from constants import DB_PATH, ROOT_DIR
+
+DEFAULT_SCALE = 1
+ROUNDS = 30 # Interactions of each type
+WARMUP_ROUNDS = 1 # Unmeasured rounds that fill the caches (data, time index, chart payloads)
+INTERACTIONS = ["date_range", "brand_toggle", "platform_deselect", "tab_switch"]
+
+
+def generate_dataset(scale):
+    """Generates the raw tables and marts into DB_PATH at the given scale of generate_data.py."""
+    random.seed(SEED)
+    with quiet():
+        influencers = generate_data.create_influencers(max(1, round(generate_data.NUMBER_OF_INFLUENCERS * scale)))
+        posts = generate_data.create_posts(influencers, max(1, round(generate_data.NUMBER_OF_POSTS * scale)))
+        tracking = generate_data.create_tracking_data(posts)
+        payouts = generate_data.create_payouts(influencers, posts, tracking)
+        for table_name, data in [("raw_influencers", influencers), ("raw_posts", posts), ("raw_tracking_data", tracking), ("raw_payouts", payouts)]:
+            generate_data.load_data_into_sqlite(data, table_name)
+        create_sql_marts.main()
+
+
+class Session:
+    """A headless dashboard session and the scripted interactions on it."""
+
+    def __init__(self):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(str(ROOT_DIR / "dashboard.py"), default_timeout=APPTEST_TIMEOUT)
+        self.run()
+        self.tab = 0
+        date_input = self.at.sidebar.date_input[0]
+        min_date, max_date = date_input.min, date_input.max
+        middle = min_date + (max_date - min_date) / 2
+        self.date_ranges = [
+            (max(min_date, max_date - datetime.timedelta(days=29)), max_date),
+            (middle, min(max_date, middle + datetime.timedelta(days=30))),
+            (min_date, max_date),
+        ]
+        self.brands = list(self.multiselect("Select Brand").options)
+        platforms = list(self.multiselect("Select Platform").options)
+        self.platforms = ['Organic'] + [name for name in platforms if name != 'Organic'][:1]
+
+    def run(self):
+        with quiet():
+            self.at.run()
+        if self.at.exception:
+            raise SystemExit(f"Dashboard raised during the benchmark: {self.at.exception[0].message}")
+
+    def multiselect(self, label):
+        return next(widget for widget in self.at.sidebar.multiselect if widget.label == label)
+
+    # Each interaction changes a widget (step = how many times it ran before); the rerun is timed separately.
+    def date_range(self, step):
+        self.at.sidebar.date_input[0].set_value(self.date_ranges[step % len(self.date_ranges)])
+
+    def brand_toggle(self, step):
+        brand = self.brands[(step // 2) % len(self.brands)]
+        widget = self.multiselect("Select Brand")
+        if step % 2 == 0:
+            widget.unselect(brand)
+        else:
+            widget.select(brand)
+
+    def platform_deselect(self, step):
+        platform = self.platforms[(step // 2) % len(self.platforms)]
+        widget = self.multiselect("Select Platform")
+        if step % 2 == 0:
+            widget.unselect(platform)
+        else:
+            widget.select(platform)
+
+    def tab_switch(self, step):
+        self.tab = (self.tab + 1) % len(TABS)
+        self.at.session_state["dashboard_tab"] = TABS[self.tab]
+
+    def timed_interaction(self, interaction, step):
+        """Applies one interaction and returns the latency of the rerun it triggers, in ms."""
+        getattr(self, interaction)(step)
+        start = time.perf_counter()
+        self.run()
+        return (time.perf_counter() - start) * 1000
+
+
+def run_worker(scale, rounds, output):
+    """Generates the dataset into DASHBOARD_DB_PATH and records rerun latencies."""
+    if DB_PATH == ROOT_DIR / 'data.db':
+        raise SystemExit("The benchmark worker regenerates its database; set DASHBOARD_DB_PATH to a scratch file.")
+    st.logger.set_log_level("error")
+    print(f"Generating dataset at scale {scale}...")
+    generate_dataset(scale)
+
+    session = Session()
+    latencies = defaultdict(list)
+    for step in range(WARMUP_ROUNDS + rounds):
+        for interaction in INTERACTIONS:
+            latency_ms = session.timed_interaction(interaction, step)
+            if step >= WARMUP_ROUNDS:
+                latencies[interaction].append(latency_ms)
+
+    results = []
+    print(f"\n{'interaction':<20} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for interaction in INTERACTIONS:
+        p50, p95, p99 = np.percentile(latencies[interaction], [50, 95, 99])
+        results.append({
+            "name": f"rerun.{interaction}",
+            "scale": scale,
+            "repeats": len(latencies[interaction]),
+            "median_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "min_ms": round(min(latencies[interaction]), 3),
+            "max_ms": round(max(latencies[interaction]), 3),
+            "rows": None,
+        })
+        print(f"{interaction:<20} {p50:10.1f} {p95:10.1f} {p99:10.1f} {max(latencies[interaction]):10.1f}")
+    Path(output).write_text(json.dumps(results), encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure end-to-end rerun latency of the dashboard per interaction type.")
+    parser.add_argument("--scale", type=float, default=DEFAULT_SCALE, help="dataset scale (1 = the size generate_data.py produces)")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="measured interactions of each type")
+    parser.add_argument("--output", help="results file (default: logs/benchmarks/reruns_<timestamp>.json)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.scale, args.rounds, args.output)
+        return
+
+    # The dashboard reads its database from DASHBOARD_DB_PATH, so the session runs in a worker process
+    with tempfile.TemporaryDirectory(prefix="bench_reruns_") as workdir:
+        worker_output = Path(workdir) / "results.json"
+        env = {**os.environ, "DASHBOARD_DB_PATH": str(Path(workdir) / "data.db"), "DASHBOARD_PERF_LOG": "0"}
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_reruns", "--worker", "--scale", str(args.scale),
+             "--rounds", str(args.rounds), "--output", str(worker_output)],
+            cwd=ROOT_DIR, env=env, check=True
+        )
+        results = json.loads(worker_output.read_text(encoding="utf-8"))
+
+    document = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "scales": [args.scale],
+        "rounds": args.rounds,
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"reruns_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
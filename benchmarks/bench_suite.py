@@ -0,0 +1,303 @@
+# benchmarks/bench_suite.py
+# Benchmarks the data pipeline and the dashboard at several dataset scales:
+#   - generate: each step of generate_data.py (influencers, posts, tracking data, payouts, SQLite loads)
+#   - marts: create_sql_marts.main() and a full read of each mart (the marts are views,
+#     so reading one is what builds it)
+#   - load: load_all_data cold (shared dataset cleared) and warm (views of the shared dataset), and the time index build
+#   - filter: filter_dataframes for a few typical sidebar selections
+#   - kpis: the exact-mode KPI block of dashboard.py (utils/kpis.overview_kpis) for the same selections
+#   - render: every chart/table render step of each tab (data preparation and chart options),
+#     taken from the instrumentation records of a headless AppTest run
+# Each scale runs in its own process against its own generated database (DASHBOARD_DB_PATH),
+# so the first load of a scale is cold. Scale 1 is the size generate_data.py produces.
+# Results are written as JSON; --baseline flags regressions against an earlier results file.
+#
+# Run from the project root:
+#   python -m benchmarks.bench_suite                                   # scales 0.5, 1, 2
+#   python -m benchmarks.bench_suite --scales 1 --output logs/benchmarks/baseline.json
+#   python -m benchmarks.bench_suite --baseline logs/benchmarks/baseline.json
+#   python -m benchmarks.bench_suite --compare new.json --baseline logs/benchmarks/baseline.json
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import create_sql_marts
+import generate_data
+from constants import DB_PATH, ROOT_DIR
+from utils.data_loader import current_dataset_version, load_shared_data, load_all_data, filter_dataframes
+from utils.instrumentation import count_rows
+from utils.kpis import overview_kpis
+from utils.time_index import TimeIndex
+
+DEFAULT_SCALES = [0.5, 1, 2]
+REPEATS = 5
+HEAVY_REPEATS = 3 # For steps that take seconds (mart reads, cold loads, tab renders)
+SEED = 42
+RESULTS_DIR = ROOT_DIR / "logs" / "benchmarks"
+
+# A benchmark regresses when its median is this much slower than the baseline (and by more than REGRESSION_MIN_MS)
+REGRESSION_TOLERANCE = 0.20
+REGRESSION_MIN_MS = 5.0
+
+MARTS = ["payments_log", "enriched_orders", "influencer_performance"]
+TABS = ["📈 Overview", "📄 Detailed Analysis", "🧑‍💻 Influencer Analysis"]
+APPTEST_TIMEOUT = 300 # Seconds per AppTest run
+
+
+class Recorder:
+    """Collects the timings of one scale."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.results = []
+
+    def add(self, name, times_ms, rows=None):
+        self.results.append({
+            "name": name,
+            "scale": self.scale,
+            "repeats": len(times_ms),
+            "median_ms": round(statistics.median(times_ms), 3),
+            "min_ms": round(min(times_ms), 3),
+            "max_ms": round(max(times_ms), 3),
+            "rows": rows,
+        })
+        print(f"  {name:<60} {statistics.median(times_ms):10.1f} ms")
+
+    def measure(self, name, function, repeats=REPEATS, rows=None):
+        """Times function() a few times, records the timings and returns the last result."""
+        times_ms, result = [], None
+        for _ in range(repeats):
+            with quiet():
+                start = time.perf_counter()
+                result = function()
+                times_ms.append((time.perf_counter() - start) * 1000)
+        if rows is None:
+            rows = len(result) if isinstance(result, list) else count_rows(result) or None
+        self.add(name, times_ms, rows)
+        return result
+
+
+def quiet():
+    """Silences the progress prints of the ETL scripts, the data loader and the app."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+# --- Stages (run in the worker process of one scale) ---
+
+def bench_generate(recorder, scale):
+    random.seed(SEED)
+    influencers = recorder.measure(
+        "generate.create_influencers",
+        partial(generate_data.create_influencers, max(1, round(generate_data.NUMBER_OF_INFLUENCERS * scale))), repeats=1
+    )
+    posts = recorder.measure(
+        "generate.create_posts",
+        partial(generate_data.create_posts, influencers, max(1, round(generate_data.NUMBER_OF_POSTS * scale))), repeats=1
+    )
+    tracking = recorder.measure("generate.create_tracking_data", partial(generate_data.create_tracking_data, posts), repeats=1)
+    payouts = recorder.measure("generate.create_payouts", partial(generate_data.create_payouts, influencers, posts, tracking), repeats=1)
+    for table_name, data in [("raw_influencers", influencers), ("raw_posts", posts), ("raw_tracking_data", tracking), ("raw_payouts", payouts)]:
+        recorder.measure(
+            f"generate.load_data_into_sqlite.{table_name}",
+            partial(generate_data.load_data_into_sqlite, data, table_name), repeats=1, rows=len(data)
+        )
+
+
+def read_mart(conn, mart):
+    return conn.execute(f"SELECT * FROM {mart}").fetchall()
+
+
+def bench_marts(recorder):
+    recorder.measure("marts.create_sql_marts", create_sql_marts.main, repeats=1)
+    with contextlib.closing(sqlite3.connect(DB_PATH)) as conn:
+        for mart in MARTS:
+            recorder.measure(f"marts.{mart}", partial(read_mart, conn, mart), repeats=HEAVY_REPEATS)
+
+
+def load_all_data_cold():
+    load_shared_data.clear()
+    return load_all_data(current_dataset_version())
+
+
+def bench_load(recorder):
+    # After the first repeat the database file may be in the OS page cache; the shared dataset is always cleared.
+    recorder.measure("load.load_all_data.cold", load_all_data_cold, repeats=HEAVY_REPEATS)
+    performance_df, orders_df, payment_log_df = recorder.measure("load.load_all_data.warm", partial(load_all_data, current_dataset_version()))
+    time_index = recorder.measure("load.time_index", partial(TimeIndex, orders_df, payment_log_df), repeats=HEAVY_REPEATS, rows=len(orders_df))
+    return performance_df, orders_df, payment_log_df, time_index
+
+
+def typical_selections(orders_df):
+    """A few typical sidebar selections, built from the data the way the sidebar builds its defaults."""
+    min_date = orders_df['order_date'].min().date()
+    max_date = orders_df['order_date'].max().date()
+    brands = list(orders_df['brand'].unique())
+    products = list(orders_df['product'].unique())
+    platforms = list(orders_df['platform'].fillna('Organic').unique())
+    last_30_days = max(min_date, max_date - datetime.timedelta(days=29))
+    everything = {"start_date": min_date, "end_date": max_date, "brand": brands, "product": products, "platform": platforms}
+    return {
+        "all": everything,
+        "last_30_days": {**everything, "start_date": last_30_days},
+        "one_brand": {**everything, "brand": brands[:1]},
+        "one_platform": {**everything, "platform": [p for p in platforms if p != 'Organic'][:1]},
+        "organic_only": {**everything, "platform": ['Organic']},
+        "one_product_last_30_days": {**everything, "product": products[:1], "start_date": last_30_days},
+    }
+
+
+def bench_filters_and_kpis(recorder, performance_df, orders_df, payment_log_df, time_index):
+    for name, selection in typical_selections(orders_df).items():
+        filtered = recorder.measure(
+            f"filter.filter_dataframes.{name}",
+            partial(filter_dataframes, performance_df, orders_df, payment_log_df, **selection)
+        )
+        # As dashboard.py builds it: payments are restricted to the influencers of the filtered orders
+        kpi_selection = {**selection, "influencer_keys": filtered[1]['influencer_key'].unique()}
+        recorder.measure(f"kpis.{name}", partial(overview_kpis, time_index, filtered[1], kpi_selection), rows=len(filtered[1]))
+
+
+def bench_render(recorder, repeats=HEAVY_REPEATS):
+    """Renders every tab headlessly and records the render_* steps of the instrumentation."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(ROOT_DIR / "dashboard.py"), default_timeout=APPTEST_TIMEOUT)
+    timings, rows = defaultdict(list), {}
+    for label in TABS:
+        at.session_state["dashboard_tab"] = label
+        for _ in range(repeats):
+            with quiet():
+                at.run()
+            if at.exception:
+                raise SystemExit(f"Dashboard raised while rendering {label}: {at.exception[0].message}")
+            for record in at.session_state["_perf_records"]:
+                if record["component"].startswith("render_") and "wall_ms" in record:
+                    timings[record["component"]].append(record["wall_ms"])
+                    rows[record["component"]] = record["rows_in"]
+    for component, times_ms in timings.items():
+        recorder.add(f"render.{component}", times_ms, rows[component])
+
+
+def run_worker(scale, output):
+    """Runs every stage for one scale against the database in DASHBOARD_DB_PATH."""
+    if DB_PATH == ROOT_DIR / 'data.db':
+        raise SystemExit("The benchmark worker regenerates its database; set DASHBOARD_DB_PATH to a scratch file.")
+    st.logger.set_log_level("error") # Bare-mode cache warnings
+    recorder = Recorder(scale)
+    bench_generate(recorder, scale)
+    bench_marts(recorder)
+    performance_df, orders_df, payment_log_df, time_index = bench_load(recorder)
+    bench_filters_and_kpis(recorder, performance_df, orders_df, payment_log_df, time_index)
+    bench_render(recorder)
+    Path(output).write_text(json.dumps(recorder.results), encoding="utf-8")
+
+
+# --- Driver ---
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(scales):
+    """Runs each scale in its own worker process and returns the results document."""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_suite_") as workdir:
+        for scale in scales:
+            print(f"--- Scale {scale} ---")
+            output = Path(workdir) / f"results_scale_{scale}.json"
+            env = {**os.environ, "DASHBOARD_DB_PATH": str(Path(workdir) / f"data_scale_{scale}.db"), "DASHBOARD_PERF_LOG": "0"}
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_suite", "--worker", "--scales", str(scale), "--output", str(output)],
+                cwd=ROOT_DIR, env=env, check=True
+            )
+            results.extend(json.loads(output.read_text(encoding="utf-8")))
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "streamlit": st.__version__,
+        "scales": scales,
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=REGRESSION_TOLERANCE, min_ms=REGRESSION_MIN_MS):
+    """Prints the change of every benchmark present in both runs and returns the regressions."""
+    previous_results = {(result["name"], result["scale"]): result for result in baseline["results"]}
+    regressions = []
+    print(f"\n{'benchmark':<60} {'scale':>5} {'base ms':>10} {'now ms':>10} {'change':>8}")
+    for result in current["results"]:
+        previous = previous_results.get((result["name"], result["scale"]))
+        if previous is None:
+            continue
+        delta = result["median_ms"] - previous["median_ms"]
+        change = delta / previous["median_ms"] if previous["median_ms"] > 0 else float('inf')
+        regressed = delta > min_ms and change > tolerance
+        if regressed:
+            regressions.append(result)
+        print(f"{result['name']:<60} {result['scale']:>5} {previous['median_ms']:10.1f} {result['median_ms']:10.1f} "
+              f"{change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline and dashboard at several dataset scales.")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES),
+                        help="comma-separated dataset scales (1 = the size generate_data.py produces)")
+    parser.add_argument("--output", help="results file (default: logs/benchmarks/bench_<timestamp>.json)")
+    parser.add_argument("--baseline", help="results file to compare against; regressions make the run fail")
+    parser.add_argument("--compare", help="compare this results file with --baseline instead of running")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="allowed slowdown of the median (0.2 = 20%%)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scales = [float(scale) for scale in args.scales.split(",")]
+
+    if args.worker:
+        run_worker(scales[0], args.output)
+        return
+
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare needs --baseline")
+        current = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+    else:
+        current = run_suite(scales)
+        output = Path(args.output) if args.output else RESULTS_DIR / f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(current, indent=2), encoding="utf-8")
+        print(f"\nResults written to {output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%} against {args.baseline}.")
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
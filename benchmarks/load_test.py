@@ -0,0 +1,271 @@
+# benchmarks/load_test.py
+# Concurrent-session load test: how many analysts one dashboard process can serve.
+# For each session count N, a fresh worker process runs N headless AppTest sessions of
+# dashboard.py against one generated dataset. Each session replays randomized filter
+# interactions (date ranges, brand and platform toggles including 'Organic', tab switches)
+# with a random think time between them, and reports:
+#   - throughput: reruns per second served by the process
+#   - latency: p50/p95/p99 from an interaction to the end of its rerun, including the
+#     time spent waiting for other sessions' reruns
+#   - process RSS: after a warm-up session (which loads the shared dataset and builds the
+#     process-wide indexes), peak, at the end, and the growth per session
+#   - cache hit rates: shared dataset, section results and chart payloads (see
+#     count_cache_lookup in utils/instrumentation.py)
+# AppTest installs a process-wide runtime for each run, so the reruns of the N sessions are
+# serialized through a lock. That is close to a real server, whose script threads share the
+# GIL, but it does not capture the parallelism of code that releases it.
+#
+# Run from the project root:
+#   python -m benchmarks.load_test                                 # 1, 2, 4, 8 sessions
+#   python -m benchmarks.load_test --sessions 1,4,16 --interactions 30 --think-ms 500
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+
+from benchmarks.bench_reruns import Session, generate_dataset
+from benchmarks.bench_suite import RESULTS_DIR, SEED, TABS, git_commit, quiet
+from constants import DB_PATH, ROOT_DIR
+from utils.instrumentation import cache_stats
+
+DEFAULT_SESSIONS = [1, 2, 4, 8]
+DEFAULT_SCALE = 1
+INTERACTIONS_PER_SESSION = 20
+THINK_MS = 1000 # Upper bound of the random pause between a session's interactions
+RSS_SAMPLE_SECONDS = 0.1
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler(threading.Thread):
+    """Samples the process RSS in the background and keeps the peak."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class LoadSession(Session):
+    """A dashboard session whose reruns take turns on the process-wide lock, driven by random interactions."""
+
+    def __init__(self, lock, rng):
+        self.lock = lock
+        self.rng = rng
+        super().__init__()
+        self.platforms = list(self.multiselect("Select Platform").options)
+
+    def run(self):
+        with self.lock:
+            super().run()
+
+    def toggle(self, label, option):
+        """Deselects an option, or selects it again; at least one option always stays selected."""
+        widget = self.multiselect(label)
+        if option in widget.value and len(widget.value) > 1:
+            widget.unselect(option)
+        else:
+            widget.select(option)
+
+    def random_interaction(self):
+        """Applies a random interaction and returns its type."""
+        interaction = self.rng.choice(["date_range", "brand_toggle", "platform_deselect", "tab_switch"])
+        if interaction == "date_range":
+            self.date_range(self.rng.randrange(len(self.date_ranges)))
+        elif interaction == "brand_toggle":
+            self.toggle("Select Brand", self.rng.choice(self.brands))
+        elif interaction == "platform_deselect":
+            self.toggle("Select Platform", self.rng.choice(self.platforms))
+        else:
+            self.tab = self.rng.randrange(len(TABS))
+            self.at.session_state["dashboard_tab"] = TABS[self.tab]
+        return interaction
+
+
+def replay(index, lock, interactions, think_ms, latencies, errors):
+    """One simulated analyst: opens the dashboard, then replays random interactions."""
+    rng = random.Random(SEED + index)
+    try:
+        start = time.perf_counter()
+        session = LoadSession(lock, rng)
+        latencies["session_start"].append((time.perf_counter() - start) * 1000)
+        for _ in range(interactions):
+            time.sleep(rng.uniform(0, think_ms) / 1000)
+            interaction = session.random_interaction()
+            start = time.perf_counter()
+            session.run()
+            latencies[interaction].append((time.perf_counter() - start) * 1000)
+    except (SystemExit, Exception) as e:
+        errors.append(f"session {index}: {e}")
+
+
+def percentiles(values):
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values else (np.nan,) * 3
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def warm_up(lock):
+    """Opens every tab once in a throwaway session, so process-wide data and indexes are built before measuring."""
+    with quiet():
+        session = LoadSession(lock, random.Random(SEED - 1))
+        for label in TABS[1:]:
+            session.at.session_state["dashboard_tab"] = label
+            session.run()
+    del session
+    gc.collect()
+
+
+def cache_hit_rates(before, after):
+    """Cache statistics of the lookups between two cache_stats() results."""
+    rates = {}
+    for name, stats in after.items():
+        lookups = stats["lookups"] - before.get(name, {}).get("lookups", 0)
+        hits = stats["hits"] - before.get(name, {}).get("hits", 0)
+        rates[name] = {"lookups": lookups, "hits": hits, "hit_rate": round(hits / lookups, 4) if lookups else None}
+    return rates
+
+
+def run_worker(sessions, interactions, think_ms, output):
+    """Runs N concurrent sessions in this process and writes one level of the report."""
+    if DB_PATH == ROOT_DIR / 'data.db':
+        raise SystemExit("The load test worker expects a scratch database in DASHBOARD_DB_PATH.")
+    st.logger.set_log_level("error")
+    lock = threading.Lock()
+    warm_up(lock)
+    rss_baseline = current_rss()
+    cache_before = cache_stats()
+
+    latencies, errors = defaultdict(list), []
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=replay, args=(index, lock, interactions, think_ms, latencies, errors))
+        for index in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - started
+    sampler.stop()
+    rss_end = current_rss()
+
+    interaction_latencies = [latency for name, values in latencies.items() if name != "session_start" for latency in values]
+    reruns = len(interaction_latencies) + len(latencies["session_start"])
+    level = {
+        "sessions": sessions,
+        "reruns": reruns,
+        "errors": errors,
+        "wall_s": round(wall_s, 3),
+        "throughput_per_s": round(reruns / wall_s, 3),
+        **percentiles(interaction_latencies),
+        "by_interaction": {name: {"count": len(values), **percentiles(values)} for name, values in sorted(latencies.items())},
+        "rss_baseline_mb": round(rss_baseline / 2**20, 1),
+        "rss_peak_mb": round(sampler.peak / 2**20, 1),
+        "rss_end_mb": round(rss_end / 2**20, 1),
+        "rss_per_session_mb": round((rss_end - rss_baseline) / 2**20 / sessions, 2),
+        "cache": cache_hit_rates(cache_before, cache_stats()),
+    }
+    Path(output).write_text(json.dumps(level), encoding="utf-8")
+
+
+def print_report(levels):
+    print(f"\n{'sessions':>8} {'reruns':>7} {'rerun/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'RSS MB':>8} {'peak MB':>8} {'MB/sess':>8}  cache hit rates")
+    for level in levels:
+        hit_rates = ", ".join(
+            f"{name} {stats['hit_rate']:.0%}" for name, stats in sorted(level["cache"].items()) if stats["hit_rate"] is not None
+        )
+        print(f"{level['sessions']:>8} {level['reruns']:>7} {level['throughput_per_s']:>8.2f} {level['p50_ms']:>9.1f} "
+              f"{level['p95_ms']:>9.1f} {level['p99_ms']:>9.1f} {level['rss_end_mb']:>8.1f} {level['rss_peak_mb']:>8.1f} "
+              f"{level['rss_per_session_mb']:>8.2f}  {hit_rates}")
+        for error in level["errors"]:
+            print(f"         error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent dashboard sessions and report throughput, latency, memory and cache hit rates.")
+    parser.add_argument("--sessions", default=",".join(str(count) for count in DEFAULT_SESSIONS), help="comma-separated session counts")
+    parser.add_argument("--interactions", type=int, default=INTERACTIONS_PER_SESSION, help="interactions per session")
+    parser.add_argument("--think-ms", type=float, default=THINK_MS, help="upper bound of the random pause between interactions")
+    parser.add_argument("--scale", type=float, default=DEFAULT_SCALE, help="dataset scale (1 = the size generate_data.py produces)")
+    parser.add_argument("--output", help="results file (default: logs/benchmarks/load_<timestamp>.json)")
+    parser.add_argument("--worker", choices=["generate", "sessions"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    session_counts = [int(count) for count in args.sessions.split(",")]
+
+    if args.worker == "generate":
+        generate_dataset(args.scale)
+        return
+    if args.worker == "sessions":
+        run_worker(session_counts[0], args.interactions, args.think_ms, args.output)
+        return
+
+    levels = []
+    with tempfile.TemporaryDirectory(prefix="load_test_") as workdir:
+        env = {**os.environ, "DASHBOARD_DB_PATH": str(Path(workdir) / "data.db"), "DASHBOARD_PERF_LOG": "0"}
+        print(f"Generating dataset at scale {args.scale}...")
+        subprocess.run([sys.executable, "-m", "benchmarks.load_test", "--worker", "generate", "--scale", str(args.scale)],
+                       cwd=ROOT_DIR, env=env, check=True)
+        for sessions in session_counts:
+            print(f"Running {sessions} concurrent session(s)...")
+            output = Path(workdir) / f"sessions_{sessions}.json"
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.load_test", "--worker", "sessions", "--sessions", str(sessions),
+                 "--interactions", str(args.interactions), "--think-ms", str(args.think_ms), "--output", str(output)],
+                cwd=ROOT_DIR, env=env, check=True
+            )
+            levels.append(json.loads(output.read_text(encoding="utf-8")))
+    print_report(levels)
+
+    document = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "scale": args.scale,
+        "interactions_per_session": args.interactions,
+        "think_ms": args.think_ms,
+        "levels": levels,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
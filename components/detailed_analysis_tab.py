@@ -2,12 +2,19 @@
 import streamlit as st
 from streamlit_echarts import st_echarts
 import pandas as pd
-from utils.utils import format_indian_currency
-from constants import CHART_COLORS
-
-def render_detailed_analysis_tab(filtered_orders_df, kpis):
+from functools import partial
+from utils.utils import format_indian_currency, format_indian_currency_series
+from utils.sketches import estimate_breakdown
+from utils.instrumentation import timed
+from utils.chart_builders import cached_options, donut_options
+
+@st.fragment
+@timed()
+def render_detailed_analysis_tab(filtered_orders_df, kpis, filtered_sample_df=None):
     """
     Renders the content for the 'Detailed Analysis' tab.
+    In approximate mode, filtered_sample_df is the filtered stratified order sample
+    and the revenue breakdowns are estimated from it.
     """
     st.markdown("<h3 style='text-align: center;'>Product Analysis</h3>", unsafe_allow_html=True)
 
@@ -15,14 +22,14 @@ def render_detailed_analysis_tab(filtered_orders_df, kpis):
     spacer_left_prod, col1, col2, col3, spacer_right_prod = st.columns([0.5, 3, 3, 3, 0.5]) # Adjust spacer ratios as needed
 
     with col1:
-        render_product_revenue_donut_chart(filtered_orders_df)
+        render_product_revenue_donut_chart(filtered_orders_df, filtered_sample_df)
 
     with col2:
         
         # Add spacing to push the table down to align its center with the donut chart
         for _ in range(3): # Start with a guess, then adjust this number
             st.write("")
-        render_product_revenue_table(filtered_orders_df, kpis['overall_net_profit_percentage'])
+        render_product_revenue_table(filtered_orders_df, kpis['overall_net_profit_percentage'], filtered_sample_df)
 
     with col3:
         # Add even more spacing for the shorter summary text
@@ -41,13 +48,13 @@ def render_detailed_analysis_tab(filtered_orders_df, kpis):
     spacer_left_brand, col_brand1, col_brand2, col_brand3, spacer_right_brand = st.columns([0.5, 3, 3, 3, 0.5]) # Adjust spacer ratios as needed
 
     with col_brand1:
-        render_brand_revenue_donut_chart(filtered_orders_df)
+        render_brand_revenue_donut_chart(filtered_orders_df, filtered_sample_df)
 
     with col_brand2:
         # Add spacing to push the table down
         for _ in range(11): # Start with a guess, then adjust
             st.write("")
-        render_brand_revenue_table(filtered_orders_df, kpis['overall_net_profit_percentage'])
+        render_brand_revenue_table(filtered_orders_df, kpis['overall_net_profit_percentage'], filtered_sample_df)
 
     with col_brand3:
         # Add even more spacing for the shorter summary text
@@ -66,13 +73,13 @@ def render_detailed_analysis_tab(filtered_orders_df, kpis):
     spacer_left_campaign, col_campaign1, col_campaign2, col_campaign3, spacer_right_campaign = st.columns([0.5, 3, 3, 3, 0.5]) # Adjust spacer ratios as needed
 
     with col_campaign1:
-        render_campaign_revenue_donut_chart(filtered_orders_df)
+        render_campaign_revenue_donut_chart(filtered_orders_df, filtered_sample_df)
 
     with col_campaign2:
         # Add spacing to push the table down (adjust numbers based on visual alignment)
         for _ in range(8): # Example number, tune this
             st.write("")
-        render_campaign_revenue_table(filtered_orders_df, kpis['overall_net_profit_percentage'])
+        render_campaign_revenue_table(filtered_orders_df, kpis['overall_net_profit_percentage'], filtered_sample_df)
 
     with col_campaign3:
         # Add even more spacing for the shorter summary text (adjust numbers based on visual alignment)
@@ -86,147 +93,89 @@ def render_detailed_analysis_tab(filtered_orders_df, kpis):
 
 # --- Existing Chart and Table Rendering Functions (remain unchanged) ---
 
-def render_product_revenue_donut_chart(filtered_orders_df):
+def revenue_by(filtered_orders_df, dimension, filtered_sample_df=None):
+    """
+    Returns total revenue per value of a dimension. In approximate mode the totals
+    are estimated from the filtered stratified sample and also carry order-count
+    estimates and 95% confidence half-widths ('revenue_ci', 'orders', 'orders_ci').
+    """
+    if filtered_sample_df is None:
+        return filtered_orders_df.groupby(dimension)['revenue_generated'].sum().reset_index()
+    estimates = estimate_breakdown(filtered_sample_df, dimension)
+    return estimates.rename(columns={'revenue_generated_ci': 'revenue_ci'}).reset_index()
+
+def add_confidence_column(table_data, ci_values):
+    """Adds a formatted '± (95% CI)' revenue column to a breakdown table in approximate mode."""
+    table_data['Revenue ± (95% CI)'] = format_indian_currency_series(ci_values.round(), prefix='₹').to_numpy()
+    return table_data
+
+@timed()
+def render_product_revenue_donut_chart(filtered_orders_df, filtered_sample_df=None):
     """Renders the Product Revenue Donut Chart."""
-    product_revenue = filtered_orders_df.groupby('product')['revenue_generated'].sum().reset_index()
+    product_revenue = revenue_by(filtered_orders_df, 'product', filtered_sample_df)
     product_revenue = product_revenue.sort_values(by='revenue_generated', ascending=False)
 
-    donut_data = []
-    for _, row in product_revenue.iterrows():
-        donut_data.append({
-            "value": round(row['revenue_generated'], 2),
-            "name": row['product']
-        })
-
-    if not donut_data:
+    if product_revenue.empty:
         st.info("No product revenue data available for the selected filters.")
         return
 
-    donut_options = {
-        "tooltip": {"trigger": 'item', "formatter": "{a} <br/>{b} : ₹{c} ({d}%)"},
-        "toolbox": {
-            "show": True,
-            "feature": {
-                "mark": {"show": True},
-                "dataView": {"show": True, "readOnly": False},
-                "restore": {"show": True},
-                "saveAsImage": {"show": True}
-            }
-        },
-        "color": CHART_COLORS,
-        "series": [
-            {
-                "name": 'Revenue',
-                "type": 'pie',
-                "radius": ['35%', '60%'],
-                "center": ['50%', '50%'],
-                "avoidLabelOverlap": True,
-                "borderRadius": 10,
-                "itemStyle": {
-                    "borderRadius": 10,
-                    "borderColor": '#fff',
-                    "borderWidth": 2
-                },
-                "label": {
-                    "show": True,
-                    "position": 'outside',
-                    "formatter": '{b}: {d}%',
-                    "fontSize": 11
-                },
-                "emphasis": {
-                    "label": {
-                        "show": True,
-                        "fontSize": 14,
-                        "fontWeight": 'bold'
-                    }
-                },
-                "labelLine": {
-                    "show": True
-                },
-                "data": donut_data
-            }
-        ]
-    }
-    st_echarts(options=donut_options, height="500px", key="product_revenue_donut_chart")
-
-def render_product_revenue_table(filtered_orders_df, overall_net_profit_percentage):
+    product_donut_options = cached_options(
+        "product_revenue_donut_chart", partial(donut_options, 'Revenue', toolbox=True),
+        product_revenue['product'], product_revenue['revenue_generated'].round(2)
+    )
+    st_echarts(options=product_donut_options, height="500px", key="product_revenue_donut_chart")
+
+@timed()
+def render_product_revenue_table(filtered_orders_df, overall_net_profit_percentage, filtered_sample_df=None):
     """Renders the Product Revenue Table using Streamlit's default dataframe."""
-    product_revenue = filtered_orders_df.groupby('product')['revenue_generated'].sum().reset_index()
+    product_revenue = revenue_by(filtered_orders_df, 'product', filtered_sample_df)
     product_revenue = product_revenue.sort_values(by='revenue_generated', ascending=False)
 
-    product_table_data = product_revenue.copy()
+    product_table_data = product_revenue[['product', 'revenue_generated']].copy()
     product_table_data['net_profit'] = product_table_data['revenue_generated'] * overall_net_profit_percentage
 
-    product_table_data['revenue_generated'] = product_table_data['revenue_generated'].apply(lambda x: f"₹{format_indian_currency(x)}")
-    product_table_data['net_profit'] = product_table_data['net_profit'].apply(lambda x: f"₹{format_indian_currency(x)}")
+    product_table_data['revenue_generated'] = format_indian_currency_series(product_table_data['revenue_generated'], prefix='₹')
+    product_table_data['net_profit'] = format_indian_currency_series(product_table_data['net_profit'], prefix='₹')
     
     product_table_data = product_table_data.rename(columns={
         'product': 'Product',
         'revenue_generated': 'Revenue',
         'net_profit': 'Net Profit'
     })
+    if filtered_sample_df is not None:
+        product_table_data = add_confidence_column(product_table_data, product_revenue['revenue_ci'])
 
     st.dataframe(product_table_data, use_container_width=True)
 
 
-def render_brand_revenue_donut_chart(filtered_orders_df):
+@timed()
+def render_brand_revenue_donut_chart(filtered_orders_df, filtered_sample_df=None):
     """Renders the Brand Revenue Donut Chart."""
-    brand_revenue = filtered_orders_df.groupby('brand')['revenue_generated'].sum().reset_index()
+    brand_revenue = revenue_by(filtered_orders_df, 'brand', filtered_sample_df)
     brand_revenue = brand_revenue.sort_values(by='revenue_generated', ascending=False)
 
-    brand_donut_data = [
-        {"value": row['revenue_generated'], "name": row['brand']}
-        for _, row in brand_revenue.iterrows()
-    ]
-
-    brand_donut_options = {
-        "tooltip": {"trigger": 'item', "formatter": "{a} <br/>{b} : ₹{c} ({d}%)"},
-        "series": [
-            {
-                "name": 'Brand Revenue',
-                "type": 'pie',
-                "radius": ['35%', '60%'],
-                "center": ['50%', '50%'],
-                "avoidLabelOverlap": True,
-                "borderRadius": 10,
-                "itemStyle": {
-                    "borderRadius": 10,
-                    "borderColor": '#fff',
-                    "borderWidth": 2
-                },
-                "label": {
-                    "show": True,
-                    "position": 'outside',
-                    "formatter": '{b}: {d}%',
-                    "fontSize": 11
-                },
-                "emphasis": {
-                    "label": {
-                        "show": True,
-                        "fontSize": 14,
-                        "fontWeight": 'bold'
-                    }
-                },
-                "labelLine": {
-                    "show": True
-                },
-                "data": brand_donut_data
-            }
-        ]
-    }
+    brand_donut_options = cached_options(
+        "brand_revenue_donut_chart", partial(donut_options, 'Brand Revenue'),
+        brand_revenue['brand'], brand_revenue['revenue_generated']
+    )
     st_echarts(options=brand_donut_options, height="500px", key="brand_revenue_donut_chart")
 
-def render_brand_revenue_table(filtered_orders_df, overall_net_profit_percentage):
+@timed()
+def render_brand_revenue_table(filtered_orders_df, overall_net_profit_percentage, filtered_sample_df=None):
     """Renders the Brand Revenue Table using Streamlit's default dataframe."""
-    brand_revenue = filtered_orders_df.groupby('brand')['revenue_generated'].sum().reset_index()
-    brand_table_data = brand_revenue.copy()
+    brand_revenue = revenue_by(filtered_orders_df, 'brand', filtered_sample_df)
+    brand_table_data = brand_revenue[['brand', 'revenue_generated']].copy()
     brand_table_data['net_profit'] = brand_table_data['revenue_generated'] * overall_net_profit_percentage
     
-    brand_table_data['revenue_generated'] = brand_table_data['revenue_generated'].apply(lambda x: f"₹{format_indian_currency(x)}")
-    brand_table_data['net_profit'] = brand_table_data['net_profit'].apply(lambda x: f"₹{format_indian_currency(x)}")
-
-    order_counts = filtered_orders_df['brand'].value_counts().reset_index()
-    order_counts.columns = ['brand', 'Number of Orders']
+    brand_table_data['revenue_generated'] = format_indian_currency_series(brand_table_data['revenue_generated'], prefix='₹')
+    brand_table_data['net_profit'] = format_indian_currency_series(brand_table_data['net_profit'], prefix='₹')
+
+    if filtered_sample_df is not None:
+        # Estimated order counts from the stratified sample
+        order_counts = pd.DataFrame({'brand': brand_revenue['brand'], 'Number of Orders': brand_revenue['orders'].round().astype(int)})
+    else:
+        order_counts = filtered_orders_df['brand'].value_counts().reset_index()
+        order_counts.columns = ['brand', 'Number of Orders']
     brand_table_data = pd.merge(brand_table_data, order_counts, on='brand', how='left')
     
     brand_table_data = brand_table_data.rename(columns={
@@ -235,83 +184,54 @@ def render_brand_revenue_table(filtered_orders_df, overall_net_profit_percentage
         'net_profit': 'Net Profit',
         'Number of Orders': 'No. of Orders'
     })
+    if filtered_sample_df is not None:
+        brand_table_data = add_confidence_column(brand_table_data, brand_revenue['revenue_ci'])
 
     st.dataframe(brand_table_data, use_container_width=True)
 
 
 # --- NEW FUNCTIONS FOR CAMPAIGN ANALYSIS ---
 
-def render_campaign_revenue_donut_chart(filtered_orders_df):
+@timed()
+def render_campaign_revenue_donut_chart(filtered_orders_df, filtered_sample_df=None):
     """Renders the Campaign Revenue Donut Chart."""
     # Group by 'campaign', sum revenue. Fill NaN campaigns for consistent display.
-    campaign_revenue = filtered_orders_df.groupby('campaign')['revenue_generated'].sum().reset_index()
+    campaign_revenue = revenue_by(filtered_orders_df, 'campaign', filtered_sample_df)
     campaign_revenue['campaign'] = campaign_revenue['campaign'].fillna('No Campaign')
     campaign_revenue = campaign_revenue.sort_values(by='revenue_generated', ascending=False)
 
-    campaign_donut_data = [
-        {"value": row['revenue_generated'], "name": row['campaign']}
-        for _, row in campaign_revenue.iterrows()
-    ]
-
-    if not campaign_donut_data:
+    if campaign_revenue.empty:
         st.info("No campaign revenue data available for the selected filters.")
         return
 
-    campaign_donut_options = {
-        "tooltip": {"trigger": 'item', "formatter": "{a} <br/>{b} : ₹{c} ({d}%)"},
-        "series": [
-            {
-                "name": 'Campaign Revenue',
-                "type": 'pie',
-                "radius": ['35%', '60%'],
-                "center": ['50%', '50%'],
-                "avoidLabelOverlap": True,
-                "borderRadius": 10,
-                "itemStyle": {
-                    "borderRadius": 10,
-                    "borderColor": '#fff',
-                    "borderWidth": 2
-                },
-                "label": {
-                    "show": True,
-                    "position": 'outside',
-                    "formatter": '{b}: {d}%',
-                    "fontSize": 11
-                },
-                "emphasis": {
-                    "label": {
-                        "show": True,
-                        "fontSize": 14,
-                        "fontWeight": 'bold'
-                    }
-                },
-                "labelLine": {
-                    "show": True
-                },
-                "data": campaign_donut_data
-            }
-        ]
-    }
+    campaign_donut_options = cached_options(
+        "campaign_revenue_donut_chart", partial(donut_options, 'Campaign Revenue'),
+        campaign_revenue['campaign'], campaign_revenue['revenue_generated']
+    )
     st_echarts(options=campaign_donut_options, height="500px", key="campaign_revenue_donut_chart")
 
 
-def render_campaign_revenue_table(filtered_orders_df, overall_net_profit_percentage):
+@timed()
+def render_campaign_revenue_table(filtered_orders_df, overall_net_profit_percentage, filtered_sample_df=None):
     """Renders the Campaign Revenue Table using Streamlit's default dataframe."""
     # Group by 'campaign', sum revenue. Fill NaN campaigns for consistent display.
-    campaign_revenue = filtered_orders_df.groupby('campaign')['revenue_generated'].sum().reset_index()
-    campaign_table_data = campaign_revenue.copy()
+    campaign_revenue = revenue_by(filtered_orders_df, 'campaign', filtered_sample_df)
+    campaign_table_data = campaign_revenue[['campaign', 'revenue_generated']].copy()
     campaign_table_data['net_profit'] = campaign_table_data['revenue_generated'] * overall_net_profit_percentage
 
     # Fill NaN campaigns in the table data itself
     campaign_table_data['campaign'] = campaign_table_data['campaign'].fillna('No Campaign')
 
     # Format for display
-    campaign_table_data['revenue_generated'] = campaign_table_data['revenue_generated'].apply(lambda x: f"₹{format_indian_currency(x)}")
-    campaign_table_data['net_profit'] = campaign_table_data['net_profit'].apply(lambda x: f"₹{format_indian_currency(x)}")
-
-    # Calculate order counts for each campaign
-    campaign_order_counts = filtered_orders_df['campaign'].value_counts().reset_index()
-    campaign_order_counts.columns = ['campaign', 'Number of Orders']
+    campaign_table_data['revenue_generated'] = format_indian_currency_series(campaign_table_data['revenue_generated'], prefix='₹')
+    campaign_table_data['net_profit'] = format_indian_currency_series(campaign_table_data['net_profit'], prefix='₹')
+
+    # Calculate order counts for each campaign (estimated from the sample in approximate mode)
+    if filtered_sample_df is not None:
+        campaign_order_counts = pd.DataFrame({'campaign': campaign_revenue['campaign'], 'Number of Orders': campaign_revenue['orders'].round().astype(int)})
+    else:
+        campaign_order_counts = filtered_orders_df['campaign'].value_counts().reset_index()
+        campaign_order_counts.columns = ['campaign', 'Number of Orders']
     # Ensure 'campaign' column in order counts is also filled for merging
     campaign_order_counts['campaign'] = campaign_order_counts['campaign'].fillna('No Campaign')
 
@@ -327,5 +247,7 @@ def render_campaign_revenue_table(filtered_orders_df, overall_net_profit_percent
         'net_profit': 'Net Profit',
         'Number of Orders': 'No. of Orders'
     })
+    if filtered_sample_df is not None:
+        campaign_table_data = add_confidence_column(campaign_table_data, campaign_revenue['revenue_ci'])
 
     st.dataframe(campaign_table_data, use_container_width=True)
\ No newline at end of file
@@ -1,113 +1,77 @@
 # components/influencer_analysis_tab.py
 import streamlit as st
 import pandas as pd
-from streamlit_echarts import st_echarts, JsCode
-from utils.utils import format_indian_currency
-from constants import PROFIT_MARGIN_FACTOR, CHART_COLORS, LIGHT_COLORS
+import math
+from streamlit_echarts import st_echarts
+from functools import partial
+from utils.utils import format_indian_currency, format_indian_currency_series, format_confidence_interval
+from utils.instrumentation import timed
+from utils.kpis import revenue_by_cells
+from utils.chart_builders import cached_options, pie_options, top_revenue_bar_options, worst_roi_bar_options
+from utils.influencer_table import TABLE_SORT_COLUMNS
+from constants import PROFIT_MARGIN_FACTOR, LIGHT_COLORS, INFLUENCER_TABLE_PAGE_SIZES
 import random
 
 # --- Helper function for Platform Revenue Pie Chart (adapted for this tab) ---
-def render_platform_revenue_pie_chart_influencer_tab(filtered_orders_df):
+@timed()
+def render_platform_revenue_pie_chart_influencer_tab(filtered_orders_df, time_index=None, selection=None):
     """Renders the Platform Revenue Pie Chart for the Influencer Analysis tab."""
 
     
-    # Ensure platform column is clean for grouping
-    platform_revenue = filtered_orders_df.copy()
-    platform_revenue['platform'] = platform_revenue['platform'].fillna('Organic Sales').replace('', 'Organic Sales')
-    platform_revenue = platform_revenue.groupby('platform')['revenue_generated'].sum().reset_index()
-    
-    platform_revenue_data = [
-        {"value": row['revenue_generated'], "name": row['platform']}
-        for index, row in platform_revenue.iterrows()
-    ]
+    if filtered_orders_df is None: # Approximate mode: from the time index's cells
+        platform_revenue = revenue_by_cells(time_index, selection, 'platform')
+    else:
+        # Clean platform labels for grouping (the filtered orders are not copied)
+        platforms = filtered_orders_df['platform'].fillna('Organic Sales').replace('', 'Organic Sales')
+        platform_revenue = filtered_orders_df.groupby(platforms)['revenue_generated'].sum()
 
-    if not platform_revenue_data:
+    if platform_revenue.empty:
         st.info("No platform revenue data available for the selected filters.")
         return
 
-    platform_pie_chart_options = {
-        "tooltip": {"trigger": 'item', "formatter": "{a} <br/>{b} : ₹{c} ({d}%)"},
-
-        "series": [
-            {
-                "name": 'Platform Revenue',
-                "type": 'pie',
-                "radius": '50%',
-                "data": platform_revenue_data,
-                "emphasis": {
-                    "itemStyle": {
-                        "shadowBlur": 10,
-                        "shadowOffsetX": 0,
-                        "shadowColor": 'rgba(0, 0, 0, 0.5)'
-                    }
-                }
-            }
-        ]
-    }
+    platform_pie_chart_options = cached_options(
+        "platform_revenue_pie_chart_influencer_tab",
+        partial(pie_options, 'Platform Revenue', legend=False, currency_tooltip=True),
+        platform_revenue.index, platform_revenue.to_numpy()
+    )
     st_echarts(options=platform_pie_chart_options, height="400px", width="100%", key="platform_revenue_pie_chart_influencer_tab")
 
 
 # --- NEW FUNCTION: Top N Influencers by Revenue Generated Bar Chart ---
-def render_top_influencers_by_revenue_chart(filtered_performance_df):
-    """Renders a horizontal bar chart for Top N Influencers by Revenue Generated."""
+@timed()
+def render_top_influencers_by_revenue_chart(filtered_performance_df, leaderboard):
+    """
+    Renders a horizontal bar chart for Top N Influencers by Revenue Generated.
+    The ranking is read from the leaderboard's presorted Revenue ordering.
+    """
     st.markdown("<h3 style='text-align: center;'>Top Influencers by Revenue Generated</h3>", unsafe_allow_html=True)
 
-    filtered_performance_df['Revenue'] = pd.to_numeric(filtered_performance_df['Revenue'], errors='coerce').fillna(0)
-    top_influencers = filtered_performance_df[filtered_performance_df['Revenue'] > 0].sort_values(by='Revenue', ascending=False).head(10).copy()
+    top_influencers = leaderboard.top_k('Revenue', k=10, rows=filtered_performance_df.index, above=0)
 
     if top_influencers.empty:
         st.info("No influencers with positive Revenue in the selected period.")
     else:
         chart_data = top_influencers[['Influencer', 'Revenue']].copy()
-        chart_data['revenue_formatted'] = chart_data['Revenue'].apply(lambda x: f"₹{format_indian_currency(x)}")
-
-        bar_chart_options = {
-            "tooltip": {
-                "trigger": 'axis',
-                "axisPointer": {"type": 'shadow'},
-                "formatter": JsCode("function (params) { return params[0].name + '<br/>Revenue: ' + params[0].data.revenue_formatted; }").js_code
-            },
-            "grid": {"left": '3%', "right": '4%', "bottom": '3%', "containLabel": True},
-            "xAxis": {
-                "type": 'value',
-                "axisLabel": {
-                    "formatter": JsCode("function (value) { return '₹' + new Intl.NumberFormat('en-IN').format(value); }").js_code
-                }
-            },
-            "yAxis": {
-                "type": 'category',
-                "data": chart_data['Influencer'].tolist(),
-                "axisLabel": {"interval": 0, "rotate": 0}
-            },
-            "series": [
-                {
-                    "name": 'Revenue',
-                    "type": 'bar',
-                    "encode": {"x": 'Revenue', "y": 'Influencer'},
-                    "data": [
-                        {"value": row['Revenue'], "revenue_formatted": row['revenue_formatted']}
-                        for _, row in chart_data.iterrows()
-                    ],
-                    "itemStyle": {
-                        "color": CHART_COLORS[2]
-                    },
-                    "barWidth": "20%"
-                }
-            ]
-        }
+        chart_data['revenue_formatted'] = format_indian_currency_series(chart_data['Revenue'], prefix='₹')
+
+        bar_chart_options = cached_options(
+            "top_influencers_revenue_chart", top_revenue_bar_options,
+            chart_data['Influencer'], chart_data['Revenue'], chart_data['revenue_formatted']
+        )
         st_echarts(options=bar_chart_options, height="400px", width="100%", key="top_influencers_revenue_chart")
 
 
 # --- NEW FUNCTION: Worst 10 Influencers by ROI Chart ---
-def render_worst_influencers_by_roi_chart(filtered_performance_df):
-    """Renders a horizontal bar chart for Worst 10 Influencers by ROI (only negative ROI)."""
+@timed()
+def render_worst_influencers_by_roi_chart(filtered_performance_df, leaderboard):
+    """
+    Renders a horizontal bar chart for Worst 10 Influencers by ROI (only negative ROI).
+    The ranking is read from the leaderboard's presorted ROI ordering.
+    """
     st.subheader("Worst 10 Influencers by ROI")
 
-    # Ensure 'ROI' column is numeric before filtering and sorting
-    filtered_performance_df['ROI'] = pd.to_numeric(filtered_performance_df['ROI'], errors='coerce').fillna(0)
-    
-    # Filter for influencers with NEGATIVE ROI only
-    worst_influencers = filtered_performance_df[filtered_performance_df['ROI'] < 0].sort_values(by='ROI', ascending=True).head(10).copy()
+    # Influencers with NEGATIVE ROI only, lowest first
+    worst_influencers = leaderboard.bottom_k('ROI', k=10, rows=filtered_performance_df.index, below=0)
 
     if worst_influencers.empty:
         st.info("No influencers with negative ROI in the selected period.")
@@ -116,63 +80,159 @@ def render_worst_influencers_by_roi_chart(filtered_performance_df):
         # Format for tooltip display
         chart_data['roi_formatted'] = chart_data['ROI'].apply(lambda x: f"{x:.2f}%")
 
-        min_roi = chart_data['ROI'].min()
-        max_roi = chart_data['ROI'].max() # This will still be negative, but closer to 0
-
-        bar_chart_options = {
-            "tooltip": {
-                "trigger": 'axis',
-                "axisPointer": {"type": 'shadow'},
-                "formatter": JsCode("function (params) { return params[0].name + '<br/>ROI: ' + params[0].data.roi_formatted; }").js_code
-            },
-            "grid": {"left": '3%', "right": '4%', "bottom": '3%', "containLabel": True},
-            "xAxis": {
-                "type": 'value',
-                "axisLabel": {
-                    "formatter": JsCode("function (value) { return value.toFixed(2) + '%'; }").js_code
-                }
-            },
-            "yAxis": {
-                "type": 'category',
-                "data": chart_data['Influencer'].tolist(),
-                "axisLabel": {"interval": 0, "rotate": 0}
-            },
-            "visualMap": { # Visual map for color gradient
-                "orient": 'horizontal',
-                "left": 'center',
-                "bottom": '0',
-                "min": min_roi,
-                "max": max_roi,
-                "text": ['High Negative ROI', 'Low Negative ROI'], # Labels for the gradient
-                "inRange": {
-                    "color": ['#FF0000', "#FFB09D"] # Red to DarkOrange gradient (adjust as needed)
-                }
-            },
-            "series": [
-                {
-                    "name": 'ROI',
-                    "type": 'bar',
-                    "encode": {"x": 'ROI', "y": 'Influencer'},
-                    "data": [
-                        {"value": row['ROI'], "roi_formatted": row['roi_formatted']}
-                        for _, row in chart_data.iterrows()
-                    ],
-                    "itemStyle": {
-                        # Color will be determined by visualMap, but setting a default here won't hurt
-                        "color": '#FF0000'
-                    },
-                    "barWidth": "20%"
-                }
-            ]
-        }
+        bar_chart_options = cached_options(
+            "worst_influencers_roi_chart", worst_roi_bar_options,
+            chart_data['Influencer'], chart_data['ROI'], chart_data['roi_formatted']
+        )
         st_echarts(options=bar_chart_options, height="250px", width="100%", key="worst_influencers_roi_chart")
 
 
+# Display names of the influencer_performance columns in the metrics table
+TABLE_DISPLAY_NAMES = {
+    'Influencer': 'Influencer Name',
+    'Payout Type': 'Payment Basis',
+    'Posts': 'Total Posts',
+    'Orders': 'Total Orders',
+    'Reach': 'Total Reach',
+    'Likes': 'Total Likes',
+    'Comments': 'Total Comments',
+    'Engagement Rate': 'Engagement Rate', # Keep as original for numerical sort
+    'Revenue': 'Total Revenue', # Keep as original for numerical sort
+    'Gross Profit': 'Gross Profit', # Keep as original for numerical sort
+    'Net Profit': 'Net Profit', # Keep as original for numerical sort
+    'Payout': 'Total Payout', # Keep as original for numerical sort
+    'ROAS': 'ROAS', # Keep as original for numerical sort
+    'ROI': 'ROI' # Keep as original for numerical sort
+}
+
+
+# --- Paginated Detailed Influencer Metrics Table ---
+@st.fragment
+@timed()
+def render_influencer_metrics_table(filtered_performance_df, influencer_table):
+    """
+    Renders the Detailed Influencer Metrics table one page at a time.
+    Search, sorting and paging run on the server (utils/influencer_table.py);
+    only the visible page is formatted and sent to the browser.
+    Rendered as a fragment, so the table controls rerun only the table.
+    """
+    st.subheader("Detailed Influencer Metrics")
+
+    sort_labels = {TABLE_DISPLAY_NAMES[column]: column for column in TABLE_SORT_COLUMNS}
+    col_search, col_sort, col_direction, col_page_size = st.columns([2, 1.5, 1, 1])
+    with col_search:
+        search = st.text_input("Search influencer", key="influencer_table_search", placeholder="Influencer name")
+    with col_sort:
+        sort_label = st.selectbox("Sort by", options=["Default"] + list(sort_labels), key="influencer_table_sort")
+    with col_direction:
+        descending = st.radio("Order", options=["Descending", "Ascending"], key="influencer_table_order", horizontal=True) == "Descending"
+    with col_page_size:
+        page_size = st.selectbox("Rows per page", options=INFLUENCER_TABLE_PAGE_SIZES, key="influencer_table_page_size")
+
+    # A search or a narrower filter can leave the stored page past the end; page() clamps it
+    requested_page = st.session_state.get("influencer_table_page", 1)
+    display_df, total_rows, page_number = influencer_table.page(
+        rows=filtered_performance_df.index,
+        sort_column=sort_labels.get(sort_label),
+        descending=descending,
+        search=search,
+        page_number=requested_page,
+        page_size=page_size
+    )
+    if page_number != requested_page:
+        st.session_state["influencer_table_page"] = page_number
+    page_count = max(math.ceil(total_rows / page_size), 1)
+
+    if total_rows == 0:
+        st.info("No influencers match the search.")
+        return
+
+    # --- Ensure numerical columns are truly numerical FIRST ---
+    numeric_cols_for_table = [
+        'Revenue', 'Gross Profit', 'Net Profit', 'Payout',
+        'Engagement Rate', 'ROAS', 'ROI',
+        'Posts', 'Orders', 'Reach', 'Likes', 'Comments'
+    ]
+    for col in numeric_cols_for_table:
+        if col in display_df.columns:
+            display_df[col] = pd.to_numeric(display_df[col], errors='coerce')
+
+
+    # --- REMOVED MANUAL STRING FORMATTING FOR TABLE ---
+    # We are now relying on st.column_config for formatting, which keeps data numerical.
+    # The format_indian_currency will NOT be used for the table.
+
+    # Rename columns for user-friendly display (these are now NUMERICAL again)
+    display_df = display_df.rename(columns=TABLE_DISPLAY_NAMES)
+
+    cols_to_drop_from_display = ['influencer_key', 'Gross Profit', 'ROAS', 'ROI']
+    for col in cols_to_drop_from_display:
+        if col in display_df.columns:
+            display_df = display_df.drop(columns=[col])
+
+    # --- Define column_config using basic 'format' parameter ---
+    column_configuration = {
+        "Influencer Name": st.column_config.TextColumn("Influencer Name"),
+        "Payment Basis": st.column_config.TextColumn("Payment Basis"),
+
+        "Total Revenue": st.column_config.NumberColumn(
+            "Total Revenue (₹)",
+            format="%.2f", # Basic float format with 2 decimal places
+        ),
+        "Net Profit": st.column_config.NumberColumn(
+            "Net Profit (₹)",
+            format="%.2f",
+        ),
+        "Total Payout": st.column_config.NumberColumn(
+            "Total Payout (₹)",
+            format="%.2f",
+        ),
+        "Total Posts": st.column_config.NumberColumn(
+            "Total Posts",
+            format="%d", # Basic integer format
+        ),
+        "Total Orders": st.column_config.NumberColumn(
+            "Total Orders",
+            format="%d",
+        ),
+        "Total Reach": st.column_config.NumberColumn(
+            "Total Reach",
+            format="%d",
+        ),
+        "Total Likes": st.column_config.NumberColumn(
+            "Total Likes",
+            format="%d",
+        ),
+        "Total Comments": st.column_config.NumberColumn(
+            "Total Comments",
+            format="%d",
+        ),
+        "Engagement Rate": st.column_config.NumberColumn(
+            "Engagement Rate (%)",
+            format="%.2f", # Basic float format for percentage
+        )
+    }
+
+    st.dataframe(display_df, use_container_width=True, height=300, column_config=column_configuration)
+
+    col_page_info, col_page_number = st.columns([3, 1])
+    with col_page_info:
+        first_row = (page_number - 1) * page_size + 1
+        st.caption(f"Showing {first_row:,}–{first_row + len(display_df) - 1:,} of {total_rows:,} influencers")
+    with col_page_number:
+        st.number_input("Page", min_value=1, max_value=page_count, step=1, key="influencer_table_page")
+
+
 # --- Main tab rendering function ---
-def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df, filtered_payment_log_df, kpis):
+@st.fragment
+@timed()
+def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df, filtered_payment_log_df, kpis, leaderboard, influencer_table,
+                                   time_index=None, selection=None):
     """
     Renders the content for the 'Influencer Analysis' tab,
     showing detailed metrics directly from influencer_performance.csv.
+    In approximate mode filtered_orders_df is None and the platform revenue comes from
+    the time index for the sidebar selection.
     """
 
 
@@ -183,17 +243,19 @@ def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df,
     # --- Specific KPI Cards for Influencer Analysis ---
 
     
-    # Ensure columns are numeric for aggregation
-    temp_perf_df = filtered_performance_df.copy()
-    temp_perf_df['Revenue'] = pd.to_numeric(temp_perf_df['Revenue'], errors='coerce').fillna(0)
-    temp_perf_df['Payout'] = pd.to_numeric(temp_perf_df['Payout'], errors='coerce').fillna(0)
-    temp_perf_df['Posts'] = pd.to_numeric(temp_perf_df['Posts'], errors='coerce').fillna(0)
-    temp_perf_df['Engagement Rate'] = pd.to_numeric(temp_perf_df['Engagement Rate'], errors='coerce').fillna(0)
-    temp_perf_df['Reach'] = pd.to_numeric(temp_perf_df['Reach'], errors='coerce').fillna(0)
+    # Ensure columns are numeric for aggregation (only the converted columns, not a copy of the frame)
+    temp_perf_df = pd.DataFrame({
+        column: pd.to_numeric(filtered_performance_df[column], errors='coerce').fillna(0)
+        for column in ['Revenue', 'Payout', 'Posts', 'Engagement Rate', 'Reach']
+    })
 
 
     # Calculate the 7 selected KPIs
-    total_unique_influencers = temp_perf_df['influencer_id'].nunique()
+    # In approximate mode the active-influencer count comes from the daily HyperLogLog sketches
+    if kpis.get('active_influencers') is not None:
+        total_unique_influencers = kpis['active_influencers']
+    else:
+        total_unique_influencers = filtered_performance_df['influencer_key'].nunique()
     total_posts_generated = temp_perf_df['Posts'].sum()
     avg_posts_per_influencer = temp_perf_df['Posts'].mean()
     avg_revenue_per_influencer = temp_perf_df['Revenue'].mean()
@@ -205,7 +267,7 @@ def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df,
     spacer_kpi_row1_left, col_kpi1, col_kpi2, col_kpi3, col_kpi4, spacer_kpi_row1_right = st.columns([1, 1, 1, 1, 1, 1])
 
     with col_kpi1:
-        st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Total Active Influencers</h3><p>{total_unique_influencers}</p></div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Total Active Influencers</h3><p>{total_unique_influencers}</p>{format_confidence_interval(kpis.get('active_influencers_ci'))}</div>", unsafe_allow_html=True)
     with col_kpi2:
         st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Total Generated Posts</h3><p>{int(total_posts_generated):,}</p></div>", unsafe_allow_html=True)
     with col_kpi3:
@@ -233,7 +295,7 @@ def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df,
     col_platform_chart, col_platform_kpis = st.columns(2)
 
     with col_platform_chart:
-        render_platform_revenue_pie_chart_influencer_tab(filtered_orders_df) # Use filtered_orders_df for platform revenue
+        render_platform_revenue_pie_chart_influencer_tab(filtered_orders_df, time_index, selection) # Use filtered_orders_df for platform revenue
 
     with col_platform_kpis:
         
@@ -260,14 +322,14 @@ def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df,
         
 
     # --- Top N Influencers by Revenue Generated Bar Chart ---
-    render_top_influencers_by_revenue_chart(filtered_performance_df)
+    render_top_influencers_by_revenue_chart(filtered_performance_df, leaderboard)
 
 
     # --- NEW: Worst 10 Influencers by ROI Chart & 2 Blank KPIs ---
     col_roi_chart, col_roi_kpis = st.columns([2, 1])
 
     with col_roi_chart:
-        render_worst_influencers_by_roi_chart(filtered_performance_df)
+        render_worst_influencers_by_roi_chart(filtered_performance_df, leaderboard)
 
     with col_roi_kpis:
         st.markdown("<h4 style='text-align: center;'>ROI Insights</h4>", unsafe_allow_html=True)
@@ -278,89 +340,4 @@ def render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df,
     
 
     # --- MOVED: Detailed Influencer Metrics Table ---
-    st.subheader("Detailed Influencer Metrics")
-
-    display_df = filtered_performance_df.copy()
-
-    # --- Ensure numerical columns are truly numerical FIRST ---
-    numeric_cols_for_table = [
-        'Revenue', 'Gross Profit', 'Net Profit', 'Payout',
-        'Engagement Rate', 'ROAS', 'ROI',
-        'Posts', 'Orders', 'Reach', 'Likes', 'Comments'
-    ]
-    for col in numeric_cols_for_table:
-        if col in display_df.columns:
-            display_df[col] = pd.to_numeric(display_df[col], errors='coerce')
-
-
-    # --- REMOVED MANUAL STRING FORMATTING FOR TABLE ---
-    # We are now relying on st.column_config for formatting, which keeps data numerical.
-    # The format_indian_currency will NOT be used for the table.
-
-    # Rename columns for user-friendly display (these are now NUMERICAL again)
-    display_df = display_df.rename(columns={
-        'Influencer': 'Influencer Name',
-        'Payout Type': 'Payment Basis',
-        'Posts': 'Total Posts',
-        'Orders': 'Total Orders',
-        'Reach': 'Total Reach',
-        'Likes': 'Total Likes',
-        'Comments': 'Total Comments',
-        'Engagement Rate': 'Engagement Rate', # Keep as original for numerical sort
-        'Revenue': 'Total Revenue', # Keep as original for numerical sort
-        'Gross Profit': 'Gross Profit', # Keep as original for numerical sort
-        'Net Profit': 'Net Profit', # Keep as original for numerical sort
-        'Payout': 'Total Payout', # Keep as original for numerical sort
-        'ROAS': 'ROAS', # Keep as original for numerical sort
-        'ROI': 'ROI' # Keep as original for numerical sort
-    })
-
-    cols_to_drop_from_display = ['influencer_id', 'Gross Profit', 'ROAS', 'ROI']
-    for col in cols_to_drop_from_display:
-        if col in display_df.columns:
-            display_df = display_df.drop(columns=[col])
-
-    # --- Define column_config using basic 'format' parameter ---
-    column_configuration = {
-        "Influencer Name": st.column_config.TextColumn("Influencer Name"),
-        "Payment Basis": st.column_config.TextColumn("Payment Basis"),
-
-        "Total Revenue": st.column_config.NumberColumn(
-            "Total Revenue (₹)",
-            format="%.2f", # Basic float format with 2 decimal places
-        ),
-        "Net Profit": st.column_config.NumberColumn(
-            "Net Profit (₹)",
-            format="%.2f",
-        ),
-        "Total Payout": st.column_config.NumberColumn(
-            "Total Payout (₹)",
-            format="%.2f",
-        ),
-        "Total Posts": st.column_config.NumberColumn(
-            "Total Posts",
-            format="%d", # Basic integer format
-        ),
-        "Total Orders": st.column_config.NumberColumn(
-            "Total Orders",
-            format="%d",
-        ),
-        "Total Reach": st.column_config.NumberColumn(
-            "Total Reach",
-            format="%d",
-        ),
-        "Total Likes": st.column_config.NumberColumn(
-            "Total Likes",
-            format="%d",
-        ),
-        "Total Comments": st.column_config.NumberColumn(
-            "Total Comments",
-            format="%d",
-        ),
-        "Engagement Rate": st.column_config.NumberColumn(
-            "Engagement Rate (%)",
-            format="%.2f", # Basic float format for percentage
-        )
-    }
-
-    st.dataframe(display_df, use_container_width=True, height=300, column_config=column_configuration)
\ No newline at end of file
+    render_influencer_metrics_table(filtered_performance_df, influencer_table)
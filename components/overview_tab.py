@@ -2,13 +2,28 @@
 import streamlit as st
 from streamlit_echarts import st_echarts
 import random
+from functools import partial
 import pandas as pd
-from utils.utils import format_indian_currency
-from constants import LIGHT_COLORS, PROFIT_MARGIN_FACTOR
-
-def render_overview_tab(kpis, filtered_orders_df, filtered_payment_log_df):
+from utils.utils import format_indian_currency, format_confidence_interval
+from utils.time_series import downsample_series
+from utils.instrumentation import timed
+from utils.kpis import revenue_by_cells
+from utils.chart_builders import cached_options, pie_options, stacked_bar_options, time_series_options
+from constants import LIGHT_COLORS, PROFIT_MARGIN_FACTOR, TIME_CHART_MAX_POINTS
+
+# Granularity options for the time chart, mapped to the calendar dimension's buckets
+TIME_CHART_GRANULARITIES = {"Daily": "day", "Weekly": "week", "Monthly": "month", "Quarterly": "quarter"}
+
+@st.fragment
+@timed()
+def render_overview_tab(kpis, filtered_orders_df, filtered_payment_log_df, time_index, selection):
     """
     Renders the content for the 'Overview' tab, including KPI cards and charts.
+    The time chart is served from the time index's calendar buckets for the sidebar selection.
+    In approximate mode filtered_orders_df is None and the revenue charts are served from
+    the time index's cells as well (exact).
+    Rendered as a fragment; the time chart is a nested fragment, so changing its
+    granularity reruns only the chart.
     """
     st.markdown("<h3 style='text-align: center;'>Overview</h3>", unsafe_allow_html=True)
 
@@ -25,7 +40,7 @@ def render_overview_tab(kpis, filtered_orders_df, filtered_payment_log_df):
 
     col5, col6, col7, col8, col9 = st.columns(5)
     with col5:
-        st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Number of Campaigns</h3><p>{kpis['num_campaigns']}</p></div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Number of Campaigns</h3><p>{kpis['num_campaigns']}</p>{format_confidence_interval(kpis.get('num_campaigns_ci'))}</div>", unsafe_allow_html=True)
     with col6:
         st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Organic Revenue</h3><p>₹{format_indian_currency(kpis['baseline_revenue'])}</p></div>", unsafe_allow_html=True)
     with col7:
@@ -35,6 +50,12 @@ def render_overview_tab(kpis, filtered_orders_df, filtered_payment_log_df):
     with col9:
         st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Incremental ROAS</h3><p>{kpis['incremental_roas']:.2f}x</p></div>", unsafe_allow_html=True)
 
+    # Distinct customers are only counted in approximate mode (from the daily sketches)
+    if kpis.get('unique_customers') is not None:
+        spacer_left, col10, spacer_right = st.columns([2, 1, 2])
+        with col10:
+            st.markdown(f"<div class='kpi-card' style='background-color: {random.choice(LIGHT_COLORS)};'><h3>Unique Customers</h3><p>{format_indian_currency(kpis['unique_customers'])}</p>{format_confidence_interval(kpis.get('unique_customers_ci'))}</div>", unsafe_allow_html=True)
+
     st.markdown("---", unsafe_allow_html=True)
 
     # --- This is the key change ---
@@ -44,198 +65,108 @@ def render_overview_tab(kpis, filtered_orders_df, filtered_payment_log_df):
     # Pass these column objects to the respective chart rendering functions
     # The chart functions will then use these provided columns as their context
     render_order_source_pie_chart(chart_col1, filtered_orders_df, kpis) # Pass kpis too for consistency
-    render_brand_revenue_pie_chart(chart_col2, filtered_orders_df)
-    render_platform_revenue_pie_chart(chart_col3, filtered_orders_df)
+    render_brand_revenue_pie_chart(chart_col2, filtered_orders_df, time_index, selection)
+    render_platform_revenue_pie_chart(chart_col3, filtered_orders_df, time_index, selection)
     # --- End of key change ---
 
     st.markdown("<br>", unsafe_allow_html=True)
 
     # This chart is already in a single column, so it's fine
-    render_product_revenue_by_platform_chart(filtered_orders_df)
+    render_product_revenue_by_platform_chart(filtered_orders_df, time_index, selection)
 
-    render_revenue_payout_profit_time_chart(filtered_orders_df, filtered_payment_log_df)
+    render_revenue_payout_profit_time_chart(time_index, selection)
 
 # --- Updated chart functions to accept a column object ---
+# Option payloads come from utils/chart_builders.py and are cached by their aggregated input.
 
+@timed()
 def render_order_source_pie_chart(target_column, filtered_orders_df, kpis): # Added target_column and kpis
     """Renders the Influenced vs. Organic Orders Pie Chart."""
     with target_column: # Use the provided column context
         st.markdown("<h4 style='text-align: center;'>Order Source</h4>", unsafe_allow_html=True)
         # Use the KPI counts directly
-        influenced_orders = kpis['influenced_orders_count']
-        organic_orders = kpis['organic_orders_count']
-
-        pie_chart_options = {
-            "tooltip": {"trigger": 'item'},
-            "legend": {"orient": 'vertical', "left": 'left', "textStyle": {"fontSize": 10}},
-            "series": [
-                {
-                    "name": 'Order Source',
-                    "type": 'pie',
-                    "radius": '50%',
-                    "data": [
-                        {"value": influenced_orders, "name": 'Influenced Orders'},
-                        {"value": organic_orders, "name": 'Organic Orders'}
-                    ],
-                    "emphasis": {
-                        "itemStyle": {
-                            "shadowBlur": 10,
-                            "shadowOffsetX": 0,
-                            "shadowColor": 'rgba(0, 0, 0, 0.5)'
-                        }
-                    }
-                }
-            ]
-        }
+        names = ['Influenced Orders', 'Organic Orders']
+        values = [kpis['influenced_orders_count'], kpis['organic_orders_count']]
+
+        pie_chart_options = cached_options("order_source_pie_chart", partial(pie_options, 'Order Source'), names, values)
         st_echarts(options=pie_chart_options, height="250px", width="100%", key="order_source_pie_chart")
 
-def render_brand_revenue_pie_chart(target_column, filtered_orders_df): # Added target_column
+@timed()
+def render_brand_revenue_pie_chart(target_column, filtered_orders_df, time_index=None, selection=None): # Added target_column
     """Renders the Brand Revenue Pie Chart."""
     with target_column: # Use the provided column context
         st.markdown("<h4 style='text-align: center;'>Brand Revenue</h4>", unsafe_allow_html=True)
-        brand_revenue = filtered_orders_df.groupby('brand')['revenue_generated'].sum().reset_index()
-        brand_revenue_data = [{"value": row['revenue_generated'], "name": row['brand']} for _, row in brand_revenue.iterrows()]
-
-        brand_pie_chart_options = {
-            "tooltip": {"trigger": 'item'},
-            "legend": {"orient": 'vertical', "left": 'left', "textStyle": {"fontSize": 10}},
-            "series": [
-                {
-                    "name": 'Brand Revenue',
-                    "type": 'pie',
-                    "radius": '50%',
-                    "data": brand_revenue_data,
-                    "emphasis": {
-                        "itemStyle": {
-                            "shadowBlur": 10,
-                            "shadowOffsetX": 0,
-                            "shadowColor": 'rgba(0, 0, 0, 0.5)'
-                        }
-                    }
-                }
-            ]
-        }
+        if filtered_orders_df is None: # Approximate mode
+            brand_revenue = revenue_by_cells(time_index, selection, 'brand')
+        else:
+            brand_revenue = filtered_orders_df.groupby('brand')['revenue_generated'].sum()
+
+        brand_pie_chart_options = cached_options(
+            "brand_revenue_pie_chart", partial(pie_options, 'Brand Revenue'), brand_revenue.index, brand_revenue.to_numpy()
+        )
         st_echarts(options=brand_pie_chart_options, height="250px", width="100%", key="brand_revenue_pie_chart")
 
-def render_platform_revenue_pie_chart(target_column, filtered_orders_df): # Added target_column
+@timed()
+def render_platform_revenue_pie_chart(target_column, filtered_orders_df, time_index=None, selection=None): # Added target_column
     """Renders the Platform Revenue Pie Chart."""
     with target_column: # Use the provided column context
         st.markdown("<h4 style='text-align: center;'>Platform Revenue</h4>", unsafe_allow_html=True)
-        platform_revenue = filtered_orders_df.copy()
-        platform_revenue['platform'] = platform_revenue['platform'].fillna('Organic Sales').replace('', 'Organic Sales')
-        platform_revenue = platform_revenue.groupby('platform')['revenue_generated'].sum().reset_index()
-        platform_revenue_data = [{"value": row['revenue_generated'], "name": row['platform']} for _, row in platform_revenue.iterrows()]
-
-        platform_pie_chart_options = {
-            "tooltip": {"trigger": 'item'},
-            "legend": {"orient": 'vertical', "left": 'left', "textStyle": {"fontSize": 10}},
-            "series": [
-                {
-                    "name": 'Platform Revenue',
-                    "type": 'pie',
-                    "radius": '50%',
-                    "data": platform_revenue_data,
-                    "emphasis": {
-                        "itemStyle": {
-                            "shadowBlur": 10,
-                            "shadowOffsetX": 0,
-                            "shadowColor": 'rgba(0, 0, 0, 0.5)'
-                        }
-                    }
-                }
-            ]
-        }
+        if filtered_orders_df is None: # Approximate mode
+            platform_revenue = revenue_by_cells(time_index, selection, 'platform')
+        else:
+            # Grouped by the cleaned platform labels, without copying the filtered orders
+            platforms = filtered_orders_df['platform'].fillna('Organic Sales').replace('', 'Organic Sales')
+            platform_revenue = filtered_orders_df.groupby(platforms)['revenue_generated'].sum()
+
+        platform_pie_chart_options = cached_options(
+            "platform_revenue_pie_chart", partial(pie_options, 'Platform Revenue'), platform_revenue.index, platform_revenue.to_numpy()
+        )
         st_echarts(options=platform_pie_chart_options, height="250px", width="100%", key="platform_revenue_pie_chart")
 
 # The rest of the functions (render_product_revenue_by_platform_chart, render_revenue_payout_profit_time_chart)
 # remain unchanged as they already correctly use st.columns(1) or no columns within their own scope.
-def render_product_revenue_by_platform_chart(filtered_orders_df):
+@timed()
+def render_product_revenue_by_platform_chart(filtered_orders_df, time_index=None, selection=None):
     """Renders the Product Revenue by Platform Stacked Bar Chart."""
     chart_col4_row = st.columns(1) # This is okay, it creates a new full-width row
     with chart_col4_row[0]:
         st.markdown("<h4 style='text-align: center;'>Product Revenue by Platform</h4>", unsafe_allow_html=True)
-        product_platform_revenue = filtered_orders_df.copy()
-        product_platform_revenue['platform'] = product_platform_revenue['platform'].fillna('Organic Sales').replace('', 'Organic Sales')
-        product_platform_revenue = product_platform_revenue.groupby(['product', 'platform'])['revenue_generated'].sum().unstack().fillna(0)
-
-        products = product_platform_revenue.index.tolist()
-        platforms = product_platform_revenue.columns.tolist()
-
-        series_data = []
-        for platform in platforms:
-            series_data.append({
-                "name": platform,
-                "type": 'bar',
-                "stack": 'total',
-                "emphasis": {"focus": 'series'},
-                "data": product_platform_revenue[platform].tolist(),
-                "barWidth": 15
-            })
-
-        stacked_bar_options = {
-            "tooltip": {"trigger": 'axis', "axisPointer": {"type": 'shadow'}},
-            "legend": {"data": platforms, "textStyle": {"fontSize": 10}},
-            "grid": {"left": '10%', "right": '4%', "bottom": '3%', "containLabel": True},
-            "xAxis": {"type": 'value', "axisLabel": {"textStyle": {"fontSize": 8}}},
-            "yAxis": {"type": 'category', "data": products, "axisLabel": {"textStyle": {"fontSize": 10}}},
-            "series": series_data
-        }
-        st_echarts(options=stacked_bar_options, height="400px", width="100%", key="product_revenue_bar_chart")
-
-def render_revenue_payout_profit_time_chart(filtered_orders_df, filtered_payment_log_df):
-    """Renders the Revenue, Payout & Net Profit Over Time Chart."""
+        if filtered_orders_df is None: # Approximate mode
+            product_platform_revenue = revenue_by_cells(time_index, selection, ['product', 'platform']).unstack().fillna(0)
+        else:
+            platforms = filtered_orders_df['platform'].fillna('Organic Sales').replace('', 'Organic Sales')
+            product_platform_revenue = filtered_orders_df.groupby(['product', platforms])['revenue_generated'].sum().unstack().fillna(0)
+
+        stacked_bar_chart_options = cached_options(
+            "product_revenue_bar_chart", stacked_bar_options,
+            product_platform_revenue.index, product_platform_revenue.columns, product_platform_revenue.to_numpy()
+        )
+        st_echarts(options=stacked_bar_chart_options, height="400px", width="100%", key="product_revenue_bar_chart")
+
+@st.fragment
+@timed()
+def render_revenue_payout_profit_time_chart(time_index, selection):
+    """
+    Renders the Revenue, Payout & Net Profit Over Time Chart.
+    Series come from pre-aggregated calendar buckets; long series are downsampled with LTTB.
+    """
     st.markdown("<h4 style='text-align: center;'>Revenue, Payout & Net Profit Over Time</h4>", unsafe_allow_html=True)
 
-    revenue_over_time = filtered_orders_df.set_index('order_date').resample('W')['revenue_generated'].sum().rename('Revenue')
-    payout_over_time = filtered_payment_log_df.set_index('invoice_date').resample('W')['payment_amount'].sum().rename('Payout')
-    chart_data = pd.concat([revenue_over_time, payout_over_time], axis=1).fillna(0)
+    granularity = st.radio(
+        "Granularity",
+        options=list(TIME_CHART_GRANULARITIES),
+        index=1, # Weekly, as before
+        horizontal=True,
+        key="time_chart_granularity",
+        label_visibility="collapsed"
+    )
+    chart_data = time_index.bucketed_series(TIME_CHART_GRANULARITIES[granularity], **selection)
     chart_data['Net Profit'] = (PROFIT_MARGIN_FACTOR * chart_data['Revenue']) - chart_data['Payout']
-    chart_data = chart_data.reset_index()
-    chart_data = chart_data.rename(columns={'index': 'date'})
-
-    options = {
-        "tooltip": {
-            "trigger": 'axis',
-            "axisPointer": {"type": 'shadow'},
-            "formatter": "function (params) { let tooltipContent = params[0].name + '<br/>'; params.forEach(function (item) { let value = item.value; if (value === 0) value = '0'; let parts = value.toString().split('.'); let integer = parts[0]; let decimal = parts.length > 1 ? '.' + parts[1] : ''; let lastThree = integer.substring(integer.length - 3); let otherNumbers = integer.substring(0, integer.length - 3); if (otherNumbers != '') { lastThree = ',' + lastThree; } let formatted = otherNumbers.replace(/\\B(?=(\\d{2})+(?!\\d))/g, \",\") + lastThree; tooltipContent += item.marker + item.seriesName + ': ₹' + formatted + decimal + '<br/>'; }); return tooltipContent; }"
-        },
-        "legend": {"data": ['Revenue', 'Payout', 'Net Profit']},
-        "xAxis": {
-            "type": 'category',
-            "data": [d.strftime('%Y-%m-%d') for d in chart_data['date']],
-        },
-        "yAxis": {"type": 'value'},
-        "series": [
-            {
-                "name": 'Revenue',
-                "data": chart_data['Revenue'].tolist(),
-                "type": 'line',
-                "smooth": True,
-            },
-            {
-                "name": 'Payout',
-                "data": chart_data['Payout'].tolist(),
-                "type": 'line',
-                "smooth": True,
-                "itemStyle": {"color": '#FF0000'}
-            },
-            {
-                "name": 'Net Profit',
-                "data": chart_data['Net Profit'].tolist(),
-                "type": 'line',
-                "smooth": True,
-                "itemStyle": {"color": '#008000'}
-            }
-        ],
-        "dataZoom": [{
-            "type": 'inside',
-            "start": 0,
-            "end": 100
-        }, {
-            "start": 0,
-            "end": 10,
-            "bottom": 0, # Add bottom to the scrollbar to prevent overlap
-            "height": 20 # Add height to the scrollbar for better visibility
-        }]
-    }
-    st_echarts(options=options, height="400px", width="100%", key="revenue_payout_net_profit_chart")
\ No newline at end of file
+    # Cap the points sent to the browser (e.g. daily granularity over multi-year ranges)
+    chart_data = downsample_series(chart_data, ['Revenue', 'Payout', 'Net Profit'], TIME_CHART_MAX_POINTS)
+
+    options = cached_options(
+        "revenue_payout_net_profit_chart", time_series_options,
+        chart_data['date'], chart_data['Revenue'], chart_data['Payout'], chart_data['Net Profit']
+    )
+    st_echarts(options=options, height="400px", width="100%", key="revenue_payout_net_profit_chart")
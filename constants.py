@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # --- Define Project Root ---
@@ -28,11 +29,35 @@ CHART_COLORS = [
 # Your original profit margin factor remains unchanged.
 PROFIT_MARGIN_FACTOR = 0.45 # Assumes 45% of total revenue is gross profit (1 - 0.55 COGS)
 
+# --- Payout Logic Constants (Needed for SQL calculations) ---
+# These constants are embedded directly into the SQL marts (create_sql_marts.py, utils/partitions.py).
+# They must match the constants defined in your generate_data.py script.
+COMMISSION_RATE = 0.08
+PAYOUT_SEGMENTATION_THRESHOLD = 500000
+POST_PAYOUT_BASE_MULTIPLIER = 0.05
+POST_PAYOUT_PROGRESSIVE_INCREMENT = 0.01
+POST_PAYOUT_TIER_SIZE = 300000
+
+# --- Cost of Goods Constant (Used in SQL Calculations) ---
+# This constant is used for calculating Gross Profit in the influencer_performance view.
+COST_OF_GOODS_PERCENTAGE = 0.55 # 55% of revenue generated
+
 # --- File Paths & Database Configuration (Corrected for Deployment) ---
 # The file paths are now built from the ROOT_DIR to be absolute and reliable.
 
-# Path to the SQLite database file.
-DB_PATH = ROOT_DIR / 'data.db'
+# Path to the SQLite database file. DASHBOARD_DB_PATH points the app and the ETL
+# scripts at another database (e.g. the scaled datasets of the benchmark suite).
+DB_PATH = Path(os.environ.get("DASHBOARD_DB_PATH", ROOT_DIR / 'data.db'))
+# Name used by the ETL scripts (generate_data.py, create_sql_marts.py)
+DB_NAME = DB_PATH
+# Memory-mapped columnar snapshot of the marts, written by create_sql_marts.py next to the database
+SNAPSHOT_DIR = DB_PATH.parent / f"{DB_PATH.stem}_snapshot"
+# Staging database the ETL scripts build into before swapping it into place (utils/staging.py)
+STAGING_DB_PATH = DB_PATH.with_name(f"{DB_PATH.stem}.staging{DB_PATH.suffix}")
+# Archived monthly partitions of raw_tracking_data, one SQLite file each (utils/partitions.py)
+PARTITION_ARCHIVE_DIR = DB_PATH.parent / f"{DB_PATH.stem}_archive"
+# Sidecar SQLite file of computed aggregate results, kept across restarts (utils/result_cache.py)
+RESULT_CACHE_PATH = DB_PATH.parent / f"{DB_PATH.stem}_cache.db"
 
 # Path to the static assets folder
 STATIC_DIR = ROOT_DIR / 'static'
@@ -51,3 +76,99 @@ TABLE_BASE_STYLES = [
     {'selector': 'th', 'props': [('font-weight', 'bold')]}
 ]
 TABLE_HEADER_CENTER_STYLE = [{'selector': 'th', 'props': [('text-align', 'center')]}]
+
+# --- Approximate Query Mode (opt-in from the sidebar) ---
+# HyperLogLog precision: 2^p registers per daily sketch. p=10 gives ~3.3% standard error.
+APPROX_HLL_PRECISION = 10
+# Stratified order sample used for revenue breakdowns in approximate mode.
+APPROX_SAMPLE_FRACTION = 0.05
+APPROX_MIN_STRATUM_SAMPLE = 30 # Strata smaller than this are kept whole
+APPROX_CONFIDENCE_Z = 1.96 # z-score for the 95% confidence intervals shown on KPI cards
+
+# --- Time Chart ---
+# Maximum number of points sent to ECharts for the Revenue, Payout & Net Profit chart.
+# Longer series are downsampled server-side with LTTB.
+TIME_CHART_MAX_POINTS = 500
+
+# --- Chart Payload Cache ---
+# Maximum number of finished ECharts option payloads kept in memory (see utils/chart_builders.py).
+CHART_CACHE_MAX_ENTRIES = 256
+
+# --- Influencer Metrics Table ---
+# Rows per page offered by the paginated Detailed Influencer Metrics table.
+INFLUENCER_TABLE_PAGE_SIZES = [25, 50, 100]
+
+# --- Performance Instrumentation ---
+# Per-step timings (wall time, rows in, bytes out) are shown in the sidebar panel (toggled
+# in the app); see utils/instrumentation.py. DASHBOARD_PERF_LOG=1 also appends them to this
+# JSON-lines log on every rerun, for aggregation across sessions. Once the log reaches
+# PERF_LOG_MAX_BYTES it is renamed to perf.jsonl.1 (replacing the previous one) and restarted.
+PERF_LOG_ENABLED = os.environ.get("DASHBOARD_PERF_LOG") == "1"
+PERF_LOG_PATH = ROOT_DIR / "logs" / "perf.jsonl"
+PERF_LOG_MAX_BYTES = 50 * 2**20
+
+# --- CSV Import ---
+# import_csv.py splits each CSV file into byte ranges of IMPORT_CHUNK_BYTES, parses them in
+# IMPORT_WORKERS processes (one per CPU by default) and inserts them from a single writer.
+IMPORT_CHUNK_BYTES = 32 * 1024 * 1024
+IMPORT_WORKERS = int(os.environ.get("IMPORT_WORKERS", os.cpu_count() or 1))
+
+# --- Live Refresh ---
+# Open dashboards check the dataset version every DATASET_POLL_S seconds and rerun when a
+# new one was published, so data ingested by ingest_daemon.py shows up without a click.
+DATASET_POLL_S = 5
+
+# --- KPI Service ---
+# kpi_service.py serves the dashboard's KPIs and breakdowns as JSON over HTTP, for use
+# without Streamlit. Responses are cached per dataset version and normalized filters.
+KPI_SERVICE_HOST = "127.0.0.1" # Local only; put a reverse proxy in front to expose it
+KPI_SERVICE_PORT = 8502 # Next to Streamlit's default 8501
+KPI_CACHE_MAX_ENTRIES = 512 # Cached JSON responses, least recently used evicted first
+
+# --- Data Export ---
+# Filtered orders, payments and influencer metrics are exported as CSV or Parquet by
+# kpi_service.py, streamed in chunks of EXPORT_CHUNK_ROWS rows (see utils/export.py). The
+# dashboard's export links point at EXPORT_SERVICE_URL, as seen from the user's browser.
+EXPORT_CHUNK_ROWS = 20000
+EXPORT_SERVICE_URL = os.environ.get("DASHBOARD_EXPORT_URL", f"http://{KPI_SERVICE_HOST}:{KPI_SERVICE_PORT}")
+
+# --- Persistent Result Cache ---
+# The KPI service's JSON results are also kept in RESULT_CACHE_PATH, so they survive
+# restarts and are shared by every process. Entries older than RESULT_CACHE_MAX_AGE_S are
+# evicted, then the least recently used ones while the cache is over RESULT_CACHE_MAX_BYTES.
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_MAX_AGE_S = 7 * 24 * 3600
+# DASHBOARD_CACHE_WARM_UP=1 precomputes the RESULT_CACHE_WARM_UP_TOP most requested
+# selections after every refresh (rebuilds, scheduler publishes, partition archive/restore).
+RESULT_CACHE_WARM_UP = os.environ.get("DASHBOARD_CACHE_WARM_UP") == "1"
+RESULT_CACHE_WARM_UP_TOP = 20
+
+# --- SQLite Query Tracing ---
+# Statements slower than this are written to the slow-query log with their EXPLAIN QUERY PLAN
+# (see utils/sqlite_trace.py). The progress hook counts VM instructions in steps of SQL_PROGRESS_INTERVAL.
+SLOW_QUERY_THRESHOLD_MS = 250
+SLOW_QUERY_LOG_PATH = ROOT_DIR / "logs" / "slow_queries.jsonl"
+SQL_PROGRESS_INTERVAL = 1000
+TRACED_STATEMENTS_KEPT = 1000 # Finished statements a connection keeps for summary() (the most recent ones)
+
+# --- Memory Profiling Mode ---
+# tracemalloc-based per-step memory report (sidebar toggle). Start the app with
+# DASHBOARD_MEMORY_PROFILE=1 to profile from the first (cold) run, including data loading.
+MEMORY_PROFILING_DEFAULT = os.environ.get("DASHBOARD_MEMORY_PROFILE") == "1"
+MEMORY_PROFILE_FRAMES = 25 # Traceback depth, enough to reach the project line behind a pandas allocation
+MEMORY_PROFILE_TOP_ALLOCATIONS = 5 # Largest allocation sites reported per step
+MEMORY_PROFILE_MIN_BLOCK = 1024 # Smaller blocks count towards resident/peak memory but are not attributed to a line
+
+# --- Refresh Scheduler ---
+# refresh_scheduler.py appends the CSV files dropped in INBOX_DIR to the raw tables, then
+# refreshes the mart snapshot and publishes a new dataset version. Files are named after
+# the table they extend, like the CSVs generate_data.py writes (e.g. 'tracking_data_0801.csv').
+# ingest_daemon.py runs the same refresh as soon as a file lands, instead of on the interval.
+INBOX_DIR = ROOT_DIR / 'data' / 'inbox'
+REFRESH_INTERVAL_S = 300 # How often the inbox is checked
+INGEST_CHUNK_ROWS = 50000 # Rows parsed and appended per transaction
+INGEST_SETTLE_S = 1.0 # A file is ingested once unchanged this long (so half-copied files are not read)
+REFRESH_MAX_ATTEMPTS = 5 # A failing job is retried with exponential back-off, then dropped until the next check
+REFRESH_RETRY_BASE_S = 5 # Back-off before the first retry; doubles on each further attempt
+REFRESH_RETRY_MAX_S = 300
+REFRESH_LOG_PATH = ROOT_DIR / "logs" / "refresh_runs.jsonl"
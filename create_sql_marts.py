@@ -1,21 +1,15 @@
 import sqlite3
 import os
+from contextlib import closing
 
 # --- Database Configuration (from constants.py) ---
-from constants import DB_NAME 
+from constants import DB_NAME, SNAPSHOT_DIR, COST_OF_GOODS_PERCENTAGE
+from utils.sqlite_trace import connect # Traced sqlite3 connection with a slow-query log
+from utils.snapshot import snapshot_database # Memory-mapped columnar snapshot for the dashboard
+from utils.staging import rebuild_database # Build in a staging database, then swap it into place
+from utils.partitions import (ENRICHED_ORDERS_SQL, PARTITION_CATALOG_SQL, PAYMENTS_LOG_SQL, UNION_VIEW, # Monthly partitions of raw_tracking_data
+                              partition_tracking_data)
 
-# --- Payout Logic Constants (Needed for SQL calculations) ---
-# These constants are embedded directly into the SQL queries.
-# They must match the constants defined in your generate_data.py script.
-COMMISSION_RATE = 0.08
-PAYOUT_SEGMENTATION_THRESHOLD = 500000
-POST_PAYOUT_BASE_MULTIPLIER = 0.05
-POST_PAYOUT_PROGRESSIVE_INCREMENT = 0.01
-POST_PAYOUT_TIER_SIZE = 300000
-
-# --- Cost of Goods Constant (Used in SQL Calculations) ---
-# This constant is used for calculating Gross Profit in the influencer_performance view.
-COST_OF_GOODS_PERCENTAGE = 0.55 # 55% of revenue generated
 
 def execute_sql_query(query, db_name=DB_NAME):
     """
@@ -23,7 +17,7 @@ def execute_sql_query(query, db_name=DB_NAME):
     Commits the transaction and prints a success message or an error.
     """
     try:
-        with sqlite3.connect(db_name) as conn:
+        with closing(connect(db_name, label="create_sql_marts")) as conn, conn:
             cursor = conn.cursor()
             cursor.execute(query)
             conn.commit() # Save changes to the database
@@ -32,9 +26,116 @@ def execute_sql_query(query, db_name=DB_NAME):
         print(f"SQL Error: {e}\nQuery:\n{query}")
         raise # Re-raise the exception to stop execution if there's a critical SQL error
 
-def main():
+# --- Keys: Dimension Tables and Integer Surrogate Keys ---
+# Purpose: Joins, group-bys and dashboard filters work on dense integers instead of the
+# text identifiers of the client data ('inf_001', 'post_001', 'user_00001').
+# Each dim_* table maps a natural key to its surrogate key. Keys are only ever added
+# (INSERT OR IGNORE), so an identifier keeps its key across runs.
+# The raw tables get the integer key columns filled in from the dimensions; rows that
+# already have their keys (e.g. from an earlier run) are left alone. The post key of an
+# order is resolved here, once, from its tracking source (e.g. 'trk_inf_001_post_002'),
+# instead of being parsed on every evaluation of the views.
+# Each order also gets an order_key, in arrival order: new rows continue after the highest
+# key so far, including the keys of rows moved to monthly partitions (utils/partitions.py).
+# Only rows still missing their keys are read, so keying a batch of appended rows does not
+# rescan the identifiers of every row keyed before it.
+# Text identifiers stay in the raw and dim_* tables; the marts expose only the keys.
+# Used by main() and by refresh_scheduler.py, which keys appended rows as it ingests them.
+DIMENSION_TABLES_SQL = [
+    "CREATE TABLE IF NOT EXISTS dim_influencer (influencer_key INTEGER PRIMARY KEY, influencer_id TEXT NOT NULL UNIQUE);",
+    """
+    INSERT OR IGNORE INTO dim_influencer (influencer_id)
+    SELECT influencer_id FROM raw_influencers WHERE influencer_key IS NULL
+    UNION SELECT influencer_id FROM raw_posts WHERE influencer_key IS NULL
+    UNION SELECT influencer_id FROM raw_tracking_data WHERE influencer_id IS NOT NULL AND influencer_key IS NULL
+    ORDER BY 1;
+    """,
+    "CREATE TABLE IF NOT EXISTS dim_post (post_key INTEGER PRIMARY KEY, post_id TEXT NOT NULL UNIQUE);",
+    "INSERT OR IGNORE INTO dim_post (post_id) SELECT post_id FROM raw_posts WHERE post_key IS NULL ORDER BY post_id;",
+    "CREATE TABLE IF NOT EXISTS dim_user (user_key INTEGER PRIMARY KEY, user_id TEXT NOT NULL UNIQUE);",
+    """
+    INSERT OR IGNORE INTO dim_user (user_id)
+    SELECT DISTINCT user_id FROM raw_tracking_data WHERE user_id IS NOT NULL AND user_key IS NULL ORDER BY user_id;
+    """,
+]
+RAW_KEY_COLUMNS = {
+    'raw_influencers': ['influencer_key'],
+    'raw_posts': ['post_key', 'influencer_key'],
+    'raw_tracking_data': ['influencer_key', 'post_key', 'user_key', 'order_key'],
+}
+FILL_KEYS_SQL = [
+    """
+    UPDATE raw_influencers SET influencer_key = D.influencer_key
+    FROM dim_influencer AS D
+    WHERE raw_influencers.influencer_id = D.influencer_id AND raw_influencers.influencer_key IS NULL;
+    """,
+    """
+    UPDATE raw_posts SET post_key = D.post_key
+    FROM dim_post AS D
+    WHERE raw_posts.post_id = D.post_id AND raw_posts.post_key IS NULL;
+    """,
+    """
+    UPDATE raw_posts SET influencer_key = D.influencer_key
+    FROM dim_influencer AS D
+    WHERE raw_posts.influencer_id = D.influencer_id AND raw_posts.influencer_key IS NULL;
+    """,
+    """
+    UPDATE raw_tracking_data SET influencer_key = D.influencer_key
+    FROM dim_influencer AS D
+    WHERE raw_tracking_data.influencer_id = D.influencer_id AND raw_tracking_data.influencer_key IS NULL;
+    """,
+    # Only influenced orders carry a post in their source ('organic' has none)
+    """
+    UPDATE raw_tracking_data SET post_key = D.post_key
+    FROM dim_post AS D
+    WHERE raw_tracking_data.source LIKE 'trk_%'
+      AND D.post_id = SUBSTR(raw_tracking_data.source, INSTR(raw_tracking_data.source, 'post_'))
+      AND raw_tracking_data.post_key IS NULL;
+    """,
+    """
+    UPDATE raw_tracking_data SET user_key = D.user_key
+    FROM dim_user AS D
+    WHERE raw_tracking_data.user_id = D.user_id AND raw_tracking_data.user_key IS NULL;
+    """,
+    # The subqueries are evaluated once: rows keyed by this statement get consecutive keys
+    """
+    UPDATE raw_tracking_data SET order_key = rowid + MAX(
+        (SELECT COALESCE(MAX(order_key), 0) FROM raw_tracking_data),
+        (SELECT COALESCE(MAX(max_order_key), 0) FROM tracking_partitions)
+    ) - (SELECT MIN(rowid) FROM raw_tracking_data WHERE order_key IS NULL) + 1
+    WHERE order_key IS NULL;
+    """,
+    # Join keys of the views
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_influencers_influencer_key ON raw_influencers (influencer_key);",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_posts_post_key ON raw_posts (post_key);",
+    "CREATE INDEX IF NOT EXISTS idx_raw_posts_influencer_key ON raw_posts (influencer_key);",
+    "CREATE INDEX IF NOT EXISTS idx_raw_tracking_data_influencer_key ON raw_tracking_data (influencer_key);",
+]
+
+
+def assign_surrogate_keys(conn):
+    """
+    Adds any new natural keys to the dim_* tables and fills in the missing integer keys of
+    the raw tables, on the given connection. The caller commits, so rows appended in the
+    same transaction are never visible without their keys.
+    """
+    for table, columns in RAW_KEY_COLUMNS.items():
+        # generate_data.py replaces the raw tables on every run, so the columns are re-added then
+        existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        for column in columns:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    conn.execute(PARTITION_CATALOG_SQL) # Read by the order_key statement
+    for statement in DIMENSION_TABLES_SQL:
+        conn.execute(statement)
+    for statement in FILL_KEYS_SQL:
+        conn.execute(statement)
+
+
+def main(db_name=DB_NAME, snapshot=True):
     """
     Orchestrates the creation of cleaned and transformed data marts (views) in SQLite.
+    db_name is the database to build in (the staging database when run as a script).
     
     This script relies on raw data tables (raw_influencers, raw_posts, raw_tracking_data)
     being already populated in 'data.db' by running generate_data.py.
@@ -42,83 +143,35 @@ def main():
     """
     print("--- Creating SQL Data Marts in SQLite ---")
 
+    print("\n[Keys] Assigning integer surrogate keys...")
+    with closing(connect(db_name, label="create_sql_marts:keys")) as conn, conn:
+        assign_surrogate_keys(conn)
+    print("[Keys] dim_influencer, dim_post and dim_user up to date; raw tables keyed.")
+
+    # --- Partitions: closed months of raw_tracking_data in tables of their own ---
+    # Purpose: The marts read tracking_data_all, the union of raw_tracking_data and its monthly
+    # partitions, and date-range queries read only the months they need (see utils/partitions.py).
+    print("\n[Partitions] Moving closed months of raw_tracking_data into monthly partitions...")
+    with closing(connect(db_name, label="create_sql_marts:partitions")) as conn, conn:
+        moved = partition_tracking_data(conn)
+    print(f"[Partitions] {sum(moved.values()):,} rows moved into {len(moved)} partitions; {UNION_VIEW} refreshed.")
+
     # --- Mart 1: payments_log View ---
     # Purpose: To create a complete, itemized log of all payment events.
     # This view fully reconstructs the payment logic from original cleaning_functions/payments_log.py
     # by joining raw tables and calculating payouts within SQL.
-    # It includes post_id and invoice_date, which are critical for dashboard filtering.
+    # It includes post_key and invoice_date, which are critical for dashboard filtering.
     # It uses UNION ALL to combine 'Post'-based and 'Order'-based payments.
 
     # Split DROP VIEW and CREATE VIEW into separate statements for sqlite3.ProgrammingError
     drop_payments_log_sql = "DROP VIEW IF EXISTS payments_log;"
     payments_log_create_sql = f"""
-    CREATE VIEW payments_log AS
-    
-    -- Part 1: Calculate Payments for 'Post'-based Influencers
-    -- This section processes posts made by influencers whose payout_basis is 'Post'.
-    -- Each post from such an influencer generates a payment.
-    SELECT
-        -- Generate a unique payment_log_id for each post-based payment entry.
-        -- Using a combination of 'plog_post_' and the post_id for uniqueness.
-        'plog_post_' || P.post_id AS payment_log_id,
-        P.influencer_id,
-        I.payout_basis AS payment_basis, -- This will be 'Post'
-        P.post_id,
-        P.platform AS source, -- The platform where the post was made is considered the source.
-        P.date AS invoice_date, -- The date of the post is the invoice date.
-        -- Calculate payment_amount for Post-based influencers:
-        -- ROUND(follower_count * (BASE_MULTIPLIER + (tiers_above_base * PROGRESSIVE_INCREMENT)), 2)
-        -- Note: SQLite's math functions are basic. CAST(... AS REAL) for float division.
-        -- MAX(0, ...) is used to ensure 'tiers_above_base' is not negative.
-        ROUND(
-            I.follower_count * (
-                {POST_PAYOUT_BASE_MULTIPLIER} +
-                -- Calculate 'tiers_above_base': (follower_count - THRESHOLD) / TIER_SIZE
-                MAX(0, CAST((I.follower_count - {PAYOUT_SEGMENTATION_THRESHOLD}) AS REAL) / {POST_PAYOUT_TIER_SIZE}) * {POST_PAYOUT_PROGRESSIVE_INCREMENT}
-            ), 2
-        ) AS payment_amount
-    FROM
-        raw_posts AS P -- Start with the raw_posts table
-    JOIN
-        raw_influencers AS I ON P.influencer_id = I.influencer_id -- Join to get influencer details (like payout_basis, follower_count)
-    WHERE
-        I.payout_basis = 'Post' -- Filter only for influencers whose payout basis is 'Post'
-        -- This SQL reflects the rule: payments are generated for ALL posts by 'Post'-based influencers,
-        -- regardless of whether the post has a 'brand' associated with it.
-    
-    UNION ALL -- Combine the results of 'Post'-based payments with 'Order'-based payments
-    
-    -- Part 2: Calculate Payments for 'Order'-based Influencers
-    -- This section processes tracking data for 'Influenced' orders by 'Order'-based influencers.
-    -- Each such order generates a payment.
-    SELECT
-        -- Generate a unique payment_log_id for each order-based payment entry.
-        -- We combine 'plog_order_', user_id, product (cleaned), and date for uniqueness.
-        -- REPLACE(T.product, ' ', '_') is used to make product names URL-safe for ID.
-        'plog_order_' || T.user_id || '_' || REPLACE(T.product, ' ', '_') || '_' || T.date AS payment_log_id,
-        T.influencer_id,
-        I.payout_basis AS payment_basis, -- This will be 'Order'
-        -- Extract 'post_id' from the 'source' column (e.g., 'trk_inf_001_post_002' -> 'post_002').
-        -- SUBSTR and INSTR are SQLite string functions.
-        CASE
-            WHEN T.source LIKE 'trk_%' THEN SUBSTR(T.source, INSTR(T.source, 'post_'))
-            ELSE NULL
-        END AS post_id,
-        T.source, -- Original source from tracking_data (e.g., tracking link or 'organic').
-        T.date AS invoice_date, -- The order date is the invoice date.
-        -- Calculate payment_amount for Order-based influencers: ROUND(revenue * COMMISSION_RATE, 2)
-        ROUND(T.revenue * {COMMISSION_RATE}, 2) AS payment_amount
-    FROM
-        raw_tracking_data AS T -- Start with the raw_tracking_data table (orders)
-    JOIN
-        raw_influencers AS I ON T.influencer_id = I.influencer_id -- Join to get influencer details (like payout_basis)
-    WHERE
-        T.attribution_type = 'Influenced' AND I.payout_basis = 'Order'; -- Filter for 'Influenced' orders and 'Order'-based influencers
+    CREATE VIEW payments_log AS {PAYMENTS_LOG_SQL.format(tracking=UNION_VIEW)};
     """
 
     print("\n[Mart 1/3] Creating payments_log view...")
-    execute_sql_query(drop_payments_log_sql) # Execute DROP VIEW first
-    execute_sql_query(payments_log_create_sql) # Then execute CREATE VIEW
+    execute_sql_query(drop_payments_log_sql, db_name) # Execute DROP VIEW first
+    execute_sql_query(payments_log_create_sql, db_name) # Then execute CREATE VIEW
     print("[Mart 1/3] payments_log view created.")
 
 
@@ -128,46 +181,11 @@ def main():
     # Split DROP VIEW and CREATE VIEW into separate statements
     drop_enriched_orders_sql = "DROP VIEW IF EXISTS enriched_orders;"
     enriched_orders_create_sql = f"""
-    CREATE VIEW enriched_orders AS
-    SELECT
-        T1.campaign,
-        T1.influencer_id,
-        T1.product,
-        T1.date AS order_date, -- Renamed from 'date' in raw_tracking_data
-        T1.orders,
-        COALESCE(T1.revenue, 0) AS revenue_generated, -- Renamed from 'revenue' in raw_tracking_data
-        CAST(COALESCE(T1.revenue, 0) * {COST_OF_GOODS_PERCENTAGE} AS INTEGER) AS cost_of_goods, -- Calculated: revenue * 0.55
-        (COALESCE(T1.revenue, 0) - CAST(COALESCE(T1.revenue, 0) * {COST_OF_GOODS_PERCENTAGE} AS INTEGER)) AS gross_profit, -- Calculated: revenue - cogs
-        T1.attribution_type,
-        -- Extract post_id from source if it's an influenced order (matches Python logic)
-        CASE
-            WHEN T1.source LIKE 'trk_%' THEN SUBSTR(T1.source, INSTR(T1.source, 'post_'))
-            ELSE NULL
-        END AS post_id,
-        P.platform AS platform, -- CORRECTED: Pulled from raw_posts (P)
-        P.date AS post_date, -- Post date from raw_posts (original 'date_y' in Python merge)
-        P.reach,
-        P.likes,
-        P.comments,
-        T1.brand AS brand, -- EXPLICIT ALIAS for brand
-        I.name AS name, -- EXPLICIT ALIAS for name
-        I.category,
-        I.gender,
-        I.follower_count,
-        I.payout_basis AS "Payout Type" -- Payout basis from raw_influencers, renamed
-    FROM
-        raw_tracking_data AS T1 -- Start with raw_tracking_data (orders)
-    LEFT JOIN
-        raw_posts AS P ON T1.influencer_id = P.influencer_id AND
-                           (CASE WHEN T1.source LIKE 'trk_%' THEN SUBSTR(T1.source, INSTR(T1.source, 'post_')) ELSE NULL END) = P.post_id
-    LEFT JOIN
-        raw_influencers AS I ON T1.influencer_id = I.influencer_id
-    ORDER BY
-        order_date ASC;
+    CREATE VIEW enriched_orders AS {ENRICHED_ORDERS_SQL.format(tracking=UNION_VIEW)};
     """
     print("\n[Mart 2/3] Creating enriched_orders view...")
-    execute_sql_query(drop_enriched_orders_sql) # Execute DROP VIEW first
-    execute_sql_query(enriched_orders_create_sql) # Then execute CREATE VIEW
+    execute_sql_query(drop_enriched_orders_sql, db_name) # Execute DROP VIEW first
+    execute_sql_query(enriched_orders_create_sql, db_name) # Then execute CREATE VIEW
     print("[Mart 2/3] enriched_orders view created.")
 
 
@@ -180,7 +198,7 @@ def main():
     influencer_performance_create_sql = f"""
     CREATE VIEW influencer_performance AS
     SELECT
-        I.influencer_id,
+        I.influencer_key,
         I.name AS Influencer,
         I.payout_basis AS "Payout Type",
         -- Posts, Reach, Likes, Comments (aggregated from raw_posts, all posts)
@@ -214,31 +232,41 @@ def main():
         raw_influencers AS I
     LEFT JOIN (
         -- Subquery to aggregate post metrics per influencer
-        SELECT influencer_id, COUNT(post_id) AS posts_count, SUM(reach) AS reach, SUM(likes) AS likes, SUM(comments) AS comments
+        SELECT influencer_key, COUNT(post_key) AS posts_count, SUM(reach) AS reach, SUM(likes) AS likes, SUM(comments) AS comments
         FROM raw_posts
-        GROUP BY influencer_id
-    ) AS P_agg ON I.influencer_id = P_agg.influencer_id
+        GROUP BY influencer_key
+    ) AS P_agg ON I.influencer_key = P_agg.influencer_key
     LEFT JOIN (
         -- Subquery to aggregate tracking data (orders, revenue) per influencer for 'Influenced' attribution
-        SELECT influencer_id, SUM(orders) AS orders_count, SUM(revenue) AS revenue_sum
-        FROM raw_tracking_data
+        SELECT influencer_key, SUM(orders) AS orders_count, SUM(revenue) AS revenue_sum
+        FROM tracking_data_all -- raw_tracking_data and its monthly partitions
         WHERE attribution_type = 'Influenced'
-        GROUP BY influencer_id
-    ) AS T_agg ON I.influencer_id = T_agg.influencer_id
+        GROUP BY influencer_key
+    ) AS T_agg ON I.influencer_key = T_agg.influencer_key
     LEFT JOIN (
         -- Subquery to aggregate total payout per influencer from the payments_log view
-        SELECT influencer_id, SUM(payment_amount) AS total_payout_sum
+        SELECT influencer_key, SUM(payment_amount) AS total_payout_sum
         FROM payments_log -- Use the newly created payments_log view
-        GROUP BY influencer_id
-    ) AS PL_agg ON I.influencer_id = PL_agg.influencer_id
+        GROUP BY influencer_key
+    ) AS PL_agg ON I.influencer_key = PL_agg.influencer_key
     GROUP BY
-        I.influencer_id, I.name, I.payout_basis;
+        I.influencer_key, I.name, I.payout_basis;
     """
     print("\n[Mart 3/3] Creating influencer_performance view...")
-    execute_sql_query(drop_influencer_performance_sql) # Execute DROP VIEW first
-    execute_sql_query(influencer_performance_create_sql) # Then execute CREATE VIEW
+    execute_sql_query(drop_influencer_performance_sql, db_name) # Execute DROP VIEW first
+    execute_sql_query(influencer_performance_create_sql, db_name) # Then execute CREATE VIEW
     print("[Mart 3/3] influencer_performance view created.")
 
+    # --- Snapshot: memory-mapped columnar copy of the marts ---
+    # Purpose: The dashboard maps these files instead of querying and parsing the views on
+    # every cold start, and all server processes share one copy through the OS page cache.
+    # A staging build skips it: rebuild_database snapshots the database once it is in place.
+    if snapshot:
+        print("\n[Snapshot] Writing columnar snapshot of the marts...")
+        manifest = snapshot_database(db_name)
+        rows = ", ".join(f"{mart}: {details['rows']:,} rows" for mart, details in manifest["marts"].items())
+        print(f"[Snapshot] Written to {SNAPSHOT_DIR} ({rows}).")
+
     print("\n--- SQL Data Marts Created Successfully ---")
 
 
@@ -248,4 +276,5 @@ if __name__ == "__main__":
     if not os.path.exists(DB_NAME):
         print(f"Error: Database file '{DB_NAME}' not found. Please run generate_data.py first to populate raw data.")
     else:
-        main()
+        # The marts are rebuilt in a copy of the database, which then replaces the live one
+        rebuild_database(lambda staging_path: main(staging_path, snapshot=False), "create_sql_marts", from_live=True)
@@ -1,9 +1,14 @@
 import streamlit as st
 import pandas as pd
 import os
+from urllib.parse import urlencode
 
 from utils.utils import load_css, format_indian_currency
-from utils.data_loader import load_all_data, filter_dataframes # filter_dataframes is still used here
+from utils.reruns import section_result
+from utils.kpis import overview_kpis
+from utils.export import EXPORT_FORMATS
+from utils.instrumentation import start_run, track, count_rows, set_memory_profiling, render_performance_panel
+from utils.data_loader import current_dataset_version, load_shared_data, load_all_data, load_time_index, load_leaderboard, load_influencer_table, load_sketches, load_order_sample, filter_dataframes, filter_by_influencers, filter_orders # filter_dataframes is still used here
 
 # REMOVED: from utils.kpi_calculator import calculate_kpis # No longer needed
 # REMOVED: from utils.filters import setup_sidebar_filters # No longer needed
@@ -11,7 +16,7 @@ from utils.data_loader import load_all_data, filter_dataframes # filter_datafram
 from components.overview_tab import render_overview_tab
 from components.detailed_analysis_tab import render_detailed_analysis_tab
 from components.influencer_analysis_tab import render_influencer_analysis_tab
-from constants import PAGE_ICON_PATH, CSS_PATH, PROFIT_MARGIN_FACTOR # Import constants
+from constants import PAGE_ICON_PATH, CSS_PATH, MEMORY_PROFILING_DEFAULT, DATASET_POLL_S, EXPORT_SERVICE_URL # Import constants
 
 # --- Page Configuration and Styling ---
 st.set_page_config(
@@ -21,8 +26,33 @@ st.set_page_config(
 )
 load_css(CSS_PATH)
 
+# Per-step timings for the performance panel and log (fragment reruns add to this run's records)
+start_run()
+# Memory profiling uses the sidebar toggle's value from the previous run, so that data loading is profiled too
+set_memory_profiling(st.session_state.get("memory_profiling", MEMORY_PROFILING_DEFAULT))
+
 # --- Load Data ---
-performance_df, orders_df, payment_log_df = load_all_data()
+# Copy-on-write views of the frames every session shares (see utils/data_loader.py).
+# The cached data and the section results below are keyed on the dataset version, so a
+# refresh published by refresh_scheduler.py shows up on the next rerun.
+dataset_version = current_dataset_version()
+
+# --- Live Refresh ---
+# Reruns the dashboard when a newer dataset version is published (e.g. by ingest_daemon.py),
+# so open sessions pick it up within DATASET_POLL_S without any interaction. Each poll
+# reruns only this fragment: one small query.
+@st.fragment(run_every=DATASET_POLL_S)
+def watch_dataset_version():
+    if current_dataset_version() != dataset_version:
+        st.rerun()
+
+watch_dataset_version()
+with track("load_all_data") as step:
+    performance_df, orders_df, payment_log_df = load_all_data(dataset_version)
+    step.produced(performance_df, orders_df, payment_log_df)
+time_index = load_time_index(dataset_version)
+leaderboard = load_leaderboard(dataset_version)
+influencer_table = load_influencer_table(dataset_version)
 
 # ADDED: Check to ensure data was loaded successfully.
 if orders_df.empty or performance_df.empty:
@@ -65,69 +95,108 @@ platform = st.sidebar.multiselect(
     default=platform_options
 )
 
-# --- Filter DataFrames based on sidebar selections ---
-filtered_performance_df, filtered_orders_df, filtered_payment_log_df = \
-    filter_dataframes(performance_df, orders_df, payment_log_df, start_date, end_date, brand, product, platform)
+# Export of the filtered data: streamed in chunks by kpi_service.py (see utils/export.py),
+# since st.download_button would build the whole file in this server's memory first
+with st.sidebar.expander("Export Filtered Data"):
+    export_format = st.radio("Format", list(EXPORT_FORMATS), format_func=str.upper, horizontal=True, key="export_format")
+    export_query = urlencode(
+        [("start_date", start_date), ("end_date", end_date)] +
+        [(name, value) for name, values in (("brand", brand), ("product", product), ("platform", platform)) for value in values]
+    )
+    for table, label in [("orders", "Orders"), ("payments", "Payments"), ("influencers", "Influencer Metrics")]:
+        st.link_button(label, f"{EXPORT_SERVICE_URL}/export/{table}.{export_format}?{export_query}", width="stretch")
+    st.caption("Served by kpi_service.py, which must be running.")
+
+# Approximate Mode (opt-in): sketch- and sample-based estimates for very large datasets
+approximate_mode = st.sidebar.toggle(
+    "Approximate Mode",
+    value=False,
+    help="Estimate distinct counts with HyperLogLog sketches and revenue breakdowns from a stratified sample. "
+         "Faster on very large datasets; estimates are shown with 95% confidence intervals."
+)
 
-# --- Data Cleaning (Post-Filtering) ---
-# Force-fill any potential NaN values in revenue to prevent KPI calculation errors.
-filtered_orders_df['revenue_generated'] = filtered_orders_df['revenue_generated'].fillna(0)
+# Debug panel with per-step timings of the latest run (logged to PERF_LOG_PATH with DASHBOARD_PERF_LOG=1)
+show_performance_panel = st.sidebar.toggle("Performance Panel", value=False, key="show_performance_panel")
+memory_profiling = st.sidebar.toggle(
+    "Memory Profiling",
+    value=MEMORY_PROFILING_DEFAULT,
+    key="memory_profiling",
+    help="Traces allocations with tracemalloc and adds resident/peak memory and the largest allocations "
+         "of each step to the Performance Panel and log. While any session has it on, every rerun "
+         "of this server is traced and slower."
+)
+
+# --- Filter DataFrames based on sidebar selections ---
+# Reused from this session's previous run while the sidebar selection is unchanged (e.g. on tab switches)
+with track("filter_dataframes", rows_in=count_rows(performance_df, orders_df, payment_log_df)) as step:
+    if approximate_mode:
+        # The orders are not filtered: the KPIs and charts come from the time index and the
+        # sketches, the breakdowns from the order sample, and the influencers of the
+        # selection (for payments and the influencer tab) from the time index
+        filtered_orders_df = None
+        influencer_keys = time_index.influencers(start_date, end_date, brand, product, platform)
+        filtered_performance_df, filtered_payment_log_df = section_result(
+            "influencer_frames", (dataset_version, start_date, end_date, brand, product, platform),
+            lambda: filter_by_influencers(performance_df, payment_log_df, start_date, end_date, influencer_keys)
+        )
+    else:
+        filtered_performance_df, filtered_orders_df, filtered_payment_log_df = section_result(
+            "filtered_frames", (dataset_version, start_date, end_date, brand, product, platform),
+            lambda: filter_dataframes(performance_df, orders_df, payment_log_df, start_date, end_date, brand, product, platform)
+        )
+        influencer_keys = filtered_orders_df['influencer_key'].unique()
+    step.produced(filtered_performance_df, filtered_orders_df, filtered_payment_log_df)
 
 # --- Calculate KPIs (after filtering) ---
 # KPIs are now directly available in filtered_performance_df from SQL marts
 # We need to extract them or pass filtered_performance_df directly to tabs
 # For overview tab, we need specific aggregated KPIs. Let's calculate them here.
 
-# Calculate KPIs from filtered data for Overview Tab
-total_revenue = filtered_orders_df['revenue_generated'].sum()
-total_payout = filtered_payment_log_df['payment_amount'].sum()
-net_profit = (total_revenue * PROFIT_MARGIN_FACTOR) - total_payout
-
-# Calculate Baseline Revenue (Organic Sales) - Corrected Logic
-baseline_revenue = filtered_orders_df[filtered_orders_df['attribution_type'] != 'Influenced']['revenue_generated'].sum()
-
-# Calculate Influencer-Driven Revenue - Corrected Logic
-influencer_driven_revenue = filtered_orders_df[filtered_orders_df['attribution_type'] == 'Influenced']['revenue_generated'].sum()
-
-# Calculate Incremental ROAS
-incremental_roas = influencer_driven_revenue / total_payout if total_payout > 0 else 0
-
-# Calculate new KPIs
-roi = (net_profit / total_payout) * 100 if total_payout > 0 else 0
-num_campaigns = filtered_orders_df['campaign'].dropna().nunique()
-total_orders = len(filtered_orders_df)
-
-# Orders by Attribution Type
-influenced_orders_count = filtered_orders_df[filtered_orders_df['attribution_type'] == 'Influenced'].shape[0]
-organic_orders_count = filtered_orders_df[filtered_orders_df['attribution_type'] != 'Influenced'].shape[0] # Changed from platform.isna() to attribution_type
-
-# Package KPIs for Overview tab
-kpis_for_overview = {
-    "total_revenue": total_revenue,
-    "total_payout": total_payout,
-    "net_profit": net_profit,
-    "baseline_revenue": baseline_revenue,
-    "influencer_driven_revenue": influencer_driven_revenue,
-    "incremental_roas": incremental_roas,
-    "roi": roi,
-    "num_campaigns": num_campaigns,
-    "total_orders": total_orders,
-    "influenced_orders_count": influenced_orders_count,
-    "organic_orders_count": organic_orders_count,
-    "overall_net_profit_percentage": (net_profit / total_revenue) if total_revenue > 0 else 0
+# The sidebar selection, shared by the index-backed KPIs and charts.
+# Payments are restricted to the influencers present in the filtered orders.
+selection = {
+    "start_date": start_date,
+    "end_date": end_date,
+    "brand": brand,
+    "product": product,
+    "platform": platform,
+    "influencer_keys": influencer_keys,
 }
 
+# The KPI block is timed as one step
+with track("kpis", rows_in=count_rows(filtered_orders_df)):
+    # Calculated by utils/kpis.py, which the KPI service (kpi_service.py) shares.
+    # Approximate mode estimates the distinct counts from merged daily HyperLogLog sketches.
+    sketches = load_sketches(dataset_version) if approximate_mode else None
+    kpis_for_overview = overview_kpis(time_index, filtered_orders_df, selection, sketches)
+    if approximate_mode:
+        filtered_sample_df = section_result(
+            "filtered_sample", (dataset_version, start_date, end_date, brand, product, platform),
+            lambda: filter_orders(load_order_sample(dataset_version), start_date, end_date, brand, product, platform)
+        )
+    else:
+        filtered_sample_df = None
+
 
 # --- Main Dashboard Tabs ---
-tab1, tab2, tab3 = st.tabs(["📈 Overview", "📄 Detailed Analysis", "🧑‍💻 Influencer Analysis"])
+# Switching tabs reruns the script, and only the open tab is rendered
+tab1, tab2, tab3 = st.tabs(["📈 Overview", "📄 Detailed Analysis", "🧑‍💻 Influencer Analysis"], key="dashboard_tab", on_change="rerun")
 
 # --- Render Tab Content ---
-with tab1:
-    render_overview_tab(kpis_for_overview, filtered_orders_df, filtered_payment_log_df)
-
-with tab2:
-    render_detailed_analysis_tab(filtered_orders_df, kpis_for_overview) # Pass kpis_for_overview for overall_net_profit_percentage
-
-with tab3:
-    # Pass all filtered DFs as component tabs might need them for various charts/tables
-    render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df, filtered_payment_log_df, kpis_for_overview)
+# Each tab is a fragment: its own widgets rerun the tab, not the whole dashboard
+if tab1.open:
+    with tab1:
+        render_overview_tab(kpis_for_overview, filtered_orders_df, filtered_payment_log_df, time_index, selection)
+
+if tab2.open:
+    with tab2:
+        render_detailed_analysis_tab(filtered_orders_df, kpis_for_overview, filtered_sample_df) # Pass kpis_for_overview for overall_net_profit_percentage
+
+if tab3.open:
+    with tab3:
+        # Pass all filtered DFs as component tabs might need them for various charts/tables
+        render_influencer_analysis_tab(filtered_performance_df, filtered_orders_df, filtered_payment_log_df, kpis_for_overview, leaderboard, influencer_table,
+                                       time_index, selection)
+
+if show_performance_panel:
+    render_performance_panel(shared_frames=load_shared_data(dataset_version))
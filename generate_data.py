@@ -5,6 +5,7 @@ import datetime
 import math
 import os
 import sqlite3 # NEW: To interact with SQLite database
+from contextlib import closing
 import pandas as pd # NEW: To use pandas for easier SQL loading
 
 # --- Configuration Constants ---
@@ -30,8 +31,32 @@ BRANDS = {
     "Gritzo": {"campaigns": ["Gritzo_Kids_Health", "Gritzo_Active_Growth"], "products": {"SuperMilk for Kids": 900, "Mighty Munchies": 350, "Kids Protein Peanut Butter": 450}}
 }
 
+# --- Raw Table Layout ---
+# Columns of each raw data file, in the order save_to_csv writes them to data/<name>.csv,
+# with the SQLite type they have in the raw_<name> table. import_csv.py checks the headers
+# of CSV files against these and loads them into tables of these types.
+RAW_TABLE_COLUMNS = {
+    "influencers": [("influencer_id", "TEXT"), ("name", "TEXT"), ("category", "TEXT"), ("gender", "TEXT"),
+                    ("follower_count", "INTEGER"), ("platform", "TEXT"), ("payout_basis", "TEXT")],
+    "posts": [("post_id", "TEXT"), ("influencer_id", "TEXT"), ("platform", "TEXT"), ("date", "TEXT"), ("brand", "TEXT"),
+              ("campaign", "TEXT"), ("reach", "INTEGER"), ("likes", "INTEGER"), ("comments", "INTEGER")],
+    "tracking_data": [("source", "TEXT"), ("campaign", "TEXT"), ("influencer_id", "TEXT"), ("user_id", "TEXT"),
+                      ("product", "TEXT"), ("date", "TEXT"), ("orders", "INTEGER"), ("revenue", "INTEGER"),
+                      ("attribution_type", "TEXT"), ("brand", "TEXT")],
+    # post_id and invoice_date are NOT included, as per client data constraint
+    "payouts": [("payout_id", "TEXT"), ("influencer_id", "TEXT"), ("basis", "TEXT"), ("rate", "REAL"),
+                ("orders", "INTEGER"), ("total_payout", "REAL")],
+}
+
+def fieldnames(name):
+    """CSV header of a raw data file (see RAW_TABLE_COLUMNS)."""
+    return [column for column, _ in RAW_TABLE_COLUMNS[name]]
+
 # --- Database Configuration (from constants.py) ---
 from constants import DB_NAME # Import DB_NAME from constants.py
+from utils.sqlite_trace import connect # Traced sqlite3 connection with a slow-query log
+from utils.partitions import LANDING_TABLE, drop_partitions # Monthly partitions of raw_tracking_data
+from utils.staging import rebuild_database # Build in a staging database, then swap it into place
 
 def create_influencers(count):
     """Creates a list of synthetic influencer dictionaries."""
@@ -221,7 +246,7 @@ def load_data_into_sqlite(data_list, table_name, db_name=DB_NAME):
     """
     print(f"Loading data into SQLite table: {table_name}...")
     try:
-        with sqlite3.connect(db_name) as conn:
+        with closing(connect(db_name, label=f"load_data_into_sqlite:{table_name}")) as conn, conn:
             df = pd.DataFrame(data_list)
             # Ensure date columns are strings before loading to SQLite if they are datetime objects
             # SQLite stores dates as TEXT by default, so string format is best for direct loading.
@@ -229,6 +254,9 @@ def load_data_into_sqlite(data_list, table_name, db_name=DB_NAME):
                 if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
                     df[col] = df[col].dt.strftime('%Y-%m-%d')
             
+            if table_name == LANDING_TABLE:
+                # A complete history: monthly partitions left in the database would double it
+                drop_partitions(conn)
             # Use if_exists='replace' to ensure a clean table on each run
             df.to_sql(table_name, conn, if_exists='replace', index=False)
         print(f"Successfully loaded data into {table_name} table.")
@@ -236,10 +264,11 @@ def load_data_into_sqlite(data_list, table_name, db_name=DB_NAME):
         print(f"Error loading data into SQLite table {table_name}: {e}")
         raise # Re-raise the exception to stop the script if loading fails
 
-def main():
+def main(db_name=DB_NAME):
     """
     The main function to orchestrate the entire raw data generation process.
-    It generates data in memory, saves it to CSVs, and loads it into SQLite tables.
+    It generates data in memory, saves it to CSVs, and loads it into SQLite tables
+    in db_name (the staging database when run as a script).
     """
     print("--- Starting Raw Data Generation and SQLite Loading ---")
     
@@ -257,22 +286,30 @@ def main():
     # Save each generated dataset to its respective CSV file in the 'data' directory.
     # This serves as a raw data backup.
     print("Saving raw data to CSVs...")
-    save_to_csv(influencers, "influencers.csv", ["influencer_id", "name", "category", "gender", "follower_count", "platform", "payout_basis"], directory='data')
-    save_to_csv(posts, "posts.csv", ["post_id", "influencer_id", "platform", "date", "brand", "campaign", "reach", "likes", "comments"], directory='data')
-    save_to_csv(tracking, "tracking_data.csv", ["source", "campaign", "influencer_id", "user_id", "product", "date", "orders", "revenue", "attribution_type", "brand"], directory='data')
+    save_to_csv(influencers, "influencers.csv", fieldnames("influencers"), directory='data')
+    save_to_csv(posts, "posts.csv", fieldnames("posts"), directory='data')
+    save_to_csv(tracking, "tracking_data.csv", fieldnames("tracking_data"), directory='data')
     # IMPORTANT: payouts.csv fieldnames do NOT include post_id or invoice_date, as per client data constraint.
-    save_to_csv(payouts, "payouts.csv", ["payout_id", "influencer_id", "basis", "rate", "orders", "total_payout"], directory='data')
+    save_to_csv(payouts, "payouts.csv", fieldnames("payouts"), directory='data')
 
     # Load the generated data into SQLite tables.
     print("Loading raw data into SQLite tables...")
-    load_data_into_sqlite(influencers, "raw_influencers")
-    load_data_into_sqlite(posts, "raw_posts")
-    load_data_into_sqlite(tracking, "raw_tracking_data")
-    load_data_into_sqlite(payouts, "raw_payouts") # This table will NOT have post_id or invoice_date
+    load_data_into_sqlite(influencers, "raw_influencers", db_name)
+    load_data_into_sqlite(posts, "raw_posts", db_name)
+    load_data_into_sqlite(tracking, "raw_tracking_data", db_name)
+    load_data_into_sqlite(payouts, "raw_payouts", db_name) # This table will NOT have post_id or invoice_date
 
     print("\n--- Raw data generation and SQLite loading complete. ---")
 
 # This standard Python construct ensures that the main() function is called
 # only when the script is executed directly from the command line.
+# The raw tables and the marts are built together in a staging database and swapped into
+# place once both are complete, so a running dashboard never sees raw tables without marts.
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import create_sql_marts
+
+    def build(staging_path):
+        main(staging_path)
+        create_sql_marts.main(staging_path, snapshot=False)
+
+    rebuild_database(build, "generate_data")
\ No newline at end of file
@@ -0,0 +1,196 @@
+import argparse
+import csv
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+from constants import DB_PATH, ROOT_DIR, IMPORT_CHUNK_BYTES, IMPORT_WORKERS
+from generate_data import RAW_TABLE_COLUMNS, fieldnames
+from utils.partitions import LANDING_TABLE, drop_partitions
+from utils.sqlite_trace import connect
+from utils.staging import rebuild_database
+
+# --- Parallel CSV Import ---
+# Loads existing CSV files with the layout generate_data.py writes (influencers.csv,
+# posts.csv, tracking_data.csv, payouts.csv) into typed raw tables, instead of generating
+# new random data:
+#   - every header is checked against RAW_TABLE_COLUMNS before any file is read
+#   - each file is split into byte ranges of IMPORT_CHUNK_BYTES at line boundaries, which
+#     worker processes parse in parallel (text columns stay text, numeric columns must parse
+#     as numbers) and write to a temporary SQLite file each. Converting rows to Python
+#     objects and inserting them is the expensive part, and it happens in the workers:
+#     shipping the parsed rows to another process would cost more than inserting them.
+#   - a single writer attaches the chunk files in file order and copies their rows with
+#     INSERT ... SELECT (no Python objects), while the workers parse the next ones; at most
+#     two chunks per worker are in flight, so disk and memory use stay bounded
+#   - it is a rebuild (utils/staging.py): the tables are loaded into a staging database
+#     (with journaling off: a failed import just leaves the staging file), keyed and given
+#     their marts by create_sql_marts.py, validated and swapped into place. Tables without
+#     a file are kept from the live database.
+# Splitting at line boundaries assumes no quoted field spans lines, as in these exports.
+# Rows and MB per second are printed for every file.
+#
+# Run from the project root:
+#   python import_csv.py                          # the CSV files in data/
+#   python import_csv.py --dir /path/to/exports   # e.g. a client's tracking_data.csv
+
+
+def check_header(path, name):
+    """Returns the header of a CSV file; raises ValueError unless it has exactly the columns of the raw data file name."""
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        header = next(csv.reader(csv_file), [])
+    expected = fieldnames(name)
+    missing = [column for column in expected if column not in header]
+    unexpected = [column for column in header if column not in expected]
+    if missing or unexpected:
+        raise ValueError(f"{path.name}: header does not match {name} (missing {missing}, unexpected {unexpected})")
+    return header
+
+
+def byte_ranges(path, chunk_bytes):
+    """Splits the rows of a CSV file (after its header) into (start, end) byte ranges of whole lines."""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as csv_file:
+        csv_file.readline()
+        start = csv_file.tell()
+        while start < size:
+            csv_file.seek(min(start + chunk_bytes, size))
+            csv_file.readline() # On to the end of the line the range would cut
+            end = csv_file.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def table_sql(table, columns):
+    return f"CREATE TABLE {table} ({', '.join(f'{column} {declared}' for column, declared in columns)})"
+
+
+def parse_range(path, start, end, header, columns, chunk_path):
+    """
+    Worker: parses the lines in a byte range of a CSV file into the table 'chunk' of a new
+    SQLite file at chunk_path (columns in table order, NULL for empty fields); returns the
+    row count. Raises ValueError for non-numeric values in numeric columns.
+    """
+    with open(path, 'rb') as csv_file:
+        csv_file.seek(start)
+        data = csv_file.read(end - start)
+    frame = pd.DataFrame(columns=header)
+    if data.strip():
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=header, encoding='utf-8',
+                            dtype={column: str for column, declared in columns if declared == 'TEXT'})
+    for column, declared in columns:
+        if declared != 'TEXT' and len(frame) and not pd.api.types.is_numeric_dtype(frame[column]):
+            raise ValueError(f"{Path(path).name}: non-numeric values in {column} (bytes {start:,}-{end:,})")
+    frame = frame[[column for column, _ in columns]].astype(object)
+    with closing(sqlite3.connect(chunk_path)) as conn:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(table_sql("chunk", columns))
+        with conn:
+            conn.executemany(
+                f"INSERT INTO chunk VALUES ({', '.join('?' * len(columns))})",
+                frame.where(frame.notna(), None).itertuples(index=False, name=None)
+            )
+    return len(frame)
+
+
+def import_file(conn, executor, workers, path, name, header, chunk_dir, chunk_bytes=IMPORT_CHUNK_BYTES):
+    """
+    Replaces raw_<name> on conn with the rows of a CSV file, parsed by executor's workers into
+    chunk files in chunk_dir; returns the row count.
+    """
+    columns = RAW_TABLE_COLUMNS[name]
+    table = f"raw_{name}"
+    started = time.perf_counter()
+    with conn:
+        if table == LANDING_TABLE:
+            # The file is the complete history: monthly partitions kept from the live database
+            # would double it. create_sql_marts.py partitions the imported rows again.
+            drop_partitions(conn)
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(table_sql(table, columns))
+
+    rows = 0
+    pending = deque()
+    ranges = deque(enumerate(byte_ranges(path, chunk_bytes)))
+    while ranges or pending:
+        # Keep every worker busy while the writer copies the oldest chunk
+        while ranges and len(pending) < 2 * workers:
+            number, (start, end) = ranges.popleft()
+            chunk_path = str(Path(chunk_dir) / f"{name}_{number}.db")
+            pending.append((chunk_path, executor.submit(parse_range, str(path), start, end, header, columns, chunk_path)))
+        chunk_path, future = pending.popleft()
+        rows += future.result()
+        conn.execute("ATTACH DATABASE ? AS chunk_db", (chunk_path,))
+        with conn:
+            conn.execute(f"INSERT INTO main.{table} SELECT * FROM chunk_db.chunk")
+        conn.execute("DETACH DATABASE chunk_db")
+        os.remove(chunk_path)
+
+    seconds = time.perf_counter() - started
+    megabytes = os.path.getsize(path) / 1024 ** 2
+    print(f"[Import] {path.name} -> {table}: {rows:,} rows, {megabytes:,.1f} MB in {seconds:.1f} s "
+          f"({rows / seconds:,.0f} rows/s, {megabytes / seconds:,.1f} MB/s)")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import CSV files in generate_data.py's layout into the raw tables and rebuild the marts.")
+    parser.add_argument("--dir", type=Path, default=ROOT_DIR / 'data', help="directory with influencers.csv, posts.csv, tracking_data.csv and payouts.csv")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="parser processes")
+    parser.add_argument("--chunk-mb", type=float, default=IMPORT_CHUNK_BYTES / 1024 ** 2, help="MB of CSV per parsed chunk")
+    args = parser.parse_args()
+
+    files = {name: args.dir / f"{name}.csv" for name in RAW_TABLE_COLUMNS if (args.dir / f"{name}.csv").exists()}
+    kept = [f"raw_{name}" for name in RAW_TABLE_COLUMNS if name not in files]
+    if not files:
+        raise SystemExit(f"No CSV files to import in {args.dir}.")
+    if kept and not DB_PATH.exists():
+        raise SystemExit(f"No {', '.join(f'{table[4:]}.csv' for table in kept)} in {args.dir}, and no database {DB_PATH} to keep them from.")
+    try:
+        headers = {name: check_header(path, name) for name, path in files.items()}
+    except ValueError as e:
+        raise SystemExit(f"Import aborted: {e}")
+    print(f"--- Importing {', '.join(path.name for path in files.values())} with {args.workers} worker(s) ---")
+    if kept:
+        print(f"Keeping {', '.join(kept)} from {DB_PATH}.")
+
+    def build(staging_path):
+        import create_sql_marts
+
+        started = time.perf_counter()
+        total_rows = 0
+        total_bytes = sum(os.path.getsize(path) for path in files.values())
+        # Chunk files go next to the staging database, on the same disk
+        chunk_dir = tempfile.mkdtemp(prefix="import_chunks_", dir=Path(staging_path).parent)
+        try:
+            with ProcessPoolExecutor(args.workers) as executor, closing(connect(staging_path, label="import_csv")) as conn:
+                # The staging database is thrown away if anything fails, so it needs no rollback journal
+                conn.execute("PRAGMA journal_mode=OFF")
+                conn.execute("PRAGMA synchronous=OFF")
+                for name, path in files.items():
+                    total_rows += import_file(conn, executor, args.workers, path, name, headers[name], chunk_dir,
+                                              int(args.chunk_mb * 1024 ** 2))
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+        seconds = time.perf_counter() - started
+        print(f"[Import] {total_rows:,} rows, {total_bytes / 1024 ** 2:,.1f} MB in {seconds:.1f} s "
+              f"({total_rows / seconds:,.0f} rows/s, {total_bytes / 1024 ** 2 / seconds:,.1f} MB/s)")
+        create_sql_marts.main(staging_path, snapshot=False)
+
+    rebuild_database(build, "import_csv", from_live=bool(kept))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from constants import DB_PATH, INBOX_DIR, INGEST_SETTLE_S, REFRESH_INTERVAL_S, REFRESH_LOG_PATH
+from refresh_scheduler import RefreshScheduler
+
+# --- Streaming Ingestion Daemon ---
+# Runs the refresh of refresh_scheduler.py (streamed, chunked appends to the raw tables,
+# then the snapshot and a new dataset version) as soon as a CSV file lands in INBOX_DIR,
+# instead of at the next scheduled check. Files use the layout generate_data.py's
+# save_to_csv writes and are named after the table they extend (e.g. 'tracking_data_0801.csv',
+# 'posts_0801.csv', 'payouts_0801.csv').
+#   - watchdog reports files created, written, closed or moved into the inbox; each event
+#     asks the scheduler for a refresh, which starts once the inbox has been quiet for
+#     INGEST_SETTLE_S, so a file still being copied in is read once, when complete
+#   - the scheduler's interval check still runs, as a fallback for missed events (e.g. on
+#     network file systems, which do not report changes)
+#   - retries, back-off and the run log (REFRESH_LOG_PATH) are the scheduler's
+# Open dashboards poll the dataset version (DATASET_POLL_S) and map the new snapshot on
+# their next rerun: new orders show up within seconds of the file landing, without a rebuild.
+# Run it instead of refresh_scheduler.py, not next to it: both ingest the same inbox.
+#
+# Run from the project root:
+#   python ingest_daemon.py
+
+
+class InboxEventHandler(FileSystemEventHandler):
+    """Asks the scheduler for a refresh whenever a CSV file in the inbox changes."""
+
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type in ("deleted", "opened", "closed_no_write"):
+            return
+        # A move into the inbox (e.g. an atomic rename after the copy) is reported with the new
+        # path; the scheduler's own moves to processed/ and failed/ end up outside it
+        path = Path(os.fsdecode(getattr(event, "dest_path", "") or event.src_path))
+        if path.suffix == ".csv" and path.parent == self.scheduler.inbox_dir:
+            self.scheduler.request_refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest CSV files as soon as they land in the inbox and publish them to the dashboard.")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL_S, help="seconds between fallback inbox checks")
+    args = parser.parse_args()
+
+    scheduler = RefreshScheduler(interval_s=args.interval)
+    INBOX_DIR.mkdir(parents=True, exist_ok=True)
+    observer = Observer()
+    observer.schedule(InboxEventHandler(scheduler), str(INBOX_DIR), recursive=False)
+    observer.start()
+    print(f"Ingest daemon: {DB_PATH}, watching {INBOX_DIR} (settle {INGEST_SETTLE_S:g} s, fallback check every {args.interval:g} s). "
+          f"Runs are logged to {REFRESH_LOG_PATH}.")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("Ingest daemon stopped.")
+    finally:
+        observer.stop()
+        observer.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import json
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import closing
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from constants import DB_PATH, KPI_CACHE_MAX_ENTRIES, KPI_SERVICE_HOST, KPI_SERVICE_PORT, RESULT_CACHE_WARM_UP_TOP
+from utils.data_loader import filter_dataframes
+from utils.dataset_version import current_version, read_dataset_version
+from utils.export import EXPORT_FORMATS, EXPORT_TABLES, iter_export, read_export_rows
+from utils.kpis import BREAKDOWN_DIMENSIONS, breakdown, influencer_breakdown, overview_kpis
+from utils.reruns import inputs_digest
+from utils.result_cache import ResultCache
+from utils.snapshot import load_marts
+from utils.sqlite_trace import connect
+from utils.time_index import TimeIndex
+
+# --- KPI Service ---
+# A local HTTP/JSON service with the dashboard's numbers, for teams that need them without
+# Streamlit. It shares the dashboard's data layer: the same snapshot (or marts), the same
+# filtering (filter_dataframes) and the same calculations (utils/kpis.py).
+#   GET /kpis                    kpis_for_overview
+#   GET /breakdowns/<dimension>  revenue, orders and net profit per brand, product,
+#                                campaign or influencer (payout and ROAS too)
+#   GET /export/<table>.<format> the filtered orders, payments or influencers as csv or
+#                                parquet, streamed in chunks (see utils/export.py)
+#   GET /health                  the dataset version being served
+# Filters are the sidebar's, as query parameters: start_date and end_date (YYYY-MM-DD), and
+# brand, product and platform (repeated, or comma-separated). A filter left out means the
+# dashboard's default: the whole date range, every value.
+#   - filters are normalized (sorted, duplicates dropped, defaults filled in), so equivalent
+#     requests share one cache entry; the normalized filters are echoed in every response
+#   - responses are cached by (dataset version, path, filters), least recently used evicted
+#     after KPI_CACHE_MAX_ENTRIES; concurrent requests for an uncached response wait for one
+#     computation instead of each running it
+#   - behind the in-memory cache, results are kept in the persistent result cache
+#     (utils/result_cache.py), so a restarted service, or another process, does not recompute
+#     them; warm_up() precomputes the most requested selections there after a refresh
+#   - the ETag is derived from the same key, so a client revalidating with If-None-Match
+#     gets 304 Not Modified without anything being computed, until a new version is published
+#   - the dataset version is read on every request (one small query); a new version is
+#     loaded once, and the cache entries of the old one are dropped
+#   - requests are handled on a thread each; the frames and the time index are read-only.
+#     An export reads the orders of its date range from SQLite, from only the monthly
+#     partitions the range overlaps (utils/partitions.py), instead of masking the full
+#     frames; it then writes one chunk at a time and yields between chunks, so a large one
+#     neither fills the server's memory nor holds up other requests. Exports are never cached.
+#
+# Run from the project root:
+#   python kpi_service.py                       # http://127.0.0.1:8502
+#   curl 'http://127.0.0.1:8502/kpis?start_date=2025-03-01&end_date=2025-03-31&brand=HKVitals'
+#   curl -OJ 'http://127.0.0.1:8502/export/orders.parquet?platform=Instagram'
+#   python kpi_service.py --warm-up             # precompute the most requested selections, then exit
+
+LIST_FILTERS = ['brand', 'product', 'platform']
+DATE_FILTERS = ['start_date', 'end_date']
+BREAKDOWNS = BREAKDOWN_DIMENSIONS + ['influencer']
+
+
+class BadRequest(ValueError):
+    """A request with filters the service cannot apply (unknown filter, bad date)."""
+
+
+class NotFound(LookupError):
+    """A request for a path the service does not serve."""
+
+
+def requested_filters(query):
+    """
+    The filters of a parsed query string as requested, without defaults: validated dates,
+    and list filters split, stripped, deduplicated and sorted (same shape as the query).
+    """
+    unknown = set(query) - set(LIST_FILTERS) - set(DATE_FILTERS)
+    if unknown:
+        raise BadRequest(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+    filters = {}
+    for name in DATE_FILTERS:
+        if name in query:
+            try:
+                filters[name] = [date.fromisoformat(query[name][-1]).isoformat()]
+            except ValueError:
+                raise BadRequest(f"{name} must be a date (YYYY-MM-DD), not {query[name][-1]!r}")
+    for name in LIST_FILTERS:
+        values = {value.strip() for item in query.get(name, []) for value in item.split(',') if value.strip()}
+        if values:
+            filters[name] = sorted(values)
+    return filters
+
+
+class Dataset:
+    """The frames, time index and filter options of one dataset version."""
+
+    def __init__(self, version, db_path):
+        self.version = version
+        self.performance_df, self.orders_df, self.payment_log_df = load_marts(db_path, label="kpi_service")
+        self.time_index = TimeIndex(self.orders_df, self.payment_log_df)
+        # The sidebar's options and defaults
+        self.min_date = self.orders_df['order_date'].min().date()
+        self.max_date = self.orders_df['order_date'].max().date()
+        self.options = {
+            'brand': self.orders_df['brand'].dropna().unique().tolist(),
+            'product': self.orders_df['product'].dropna().unique().tolist(),
+            'platform': self.orders_df['platform'].fillna('Organic').unique().tolist(),
+        }
+
+    def normalize_filters(self, query):
+        """Filters of a parsed query string as a tuple of (name, value) pairs, defaults filled in."""
+        requested = requested_filters(query)
+        filters = {
+            'start_date': requested.get('start_date', [self.min_date.isoformat()])[0],
+            'end_date': requested.get('end_date', [self.max_date.isoformat()])[0],
+        }
+        if filters['start_date'] > filters['end_date']:
+            raise BadRequest("start_date is after end_date")
+        for name in LIST_FILTERS:
+            filters[name] = tuple(requested.get(name) or sorted(set(self.options[name])))
+        return tuple((name, filters[name]) for name in DATE_FILTERS + LIST_FILTERS)
+
+    @staticmethod
+    def selection(filters):
+        """Normalized filters as the arguments of filter_dataframes: (start_date, end_date, brand, product, platform)."""
+        selection = dict(filters)
+        return (date.fromisoformat(selection['start_date']), date.fromisoformat(selection['end_date']),
+                *(list(selection[name]) for name in LIST_FILTERS))
+
+    def compute(self, path, filters):
+        """The JSON-ready payload of a path for normalized filters."""
+        start_date, end_date, brand, product, platform = self.selection(filters)
+        filtered_performance_df, filtered_orders_df, filtered_payment_log_df = filter_dataframes(
+            self.performance_df, self.orders_df, self.payment_log_df, start_date, end_date, brand, product, platform
+        )
+        selection = dict(start_date=start_date, end_date=end_date, brand=brand, product=product, platform=platform,
+                         influencer_keys=filtered_orders_df['influencer_key'].unique())
+        kpis = overview_kpis(self.time_index, filtered_orders_df, selection)
+        payload = {"dataset_version": self.version, "filters": {name: value for name, value in filters}}
+        if path == "/kpis":
+            payload["kpis"] = {name: json_value(value) for name, value in kpis.items()}
+            return payload
+        dimension = path.rsplit('/', 1)[1]
+        if dimension == 'influencer':
+            table = influencer_breakdown(filtered_orders_df, filtered_payment_log_df)
+        else:
+            table = breakdown(filtered_orders_df, dimension, kpis['overall_net_profit_percentage'])
+        payload["rows"] = [{name: json_value(value) for name, value in row.items()} for row in table.to_dict('records')]
+        return payload
+
+
+def json_value(value):
+    """A JSON-serializable Python value for a KPI or table cell (NaN and missing become null)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+class KpiService:
+    """Loads the current dataset version and answers requests from a version-keyed response cache."""
+
+    def __init__(self, db_path=DB_PATH, max_entries=KPI_CACHE_MAX_ENTRIES, results=None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.results = results if results is not None else ResultCache()
+        self.dataset = None
+        self.load_lock = threading.Lock() # One thread loads a new version; the others wait for it
+        self.cache_lock = threading.Lock()
+        self.cache = OrderedDict() # (version, path, filters) -> Future of the JSON body
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def current_dataset(self):
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"Database {self.db_path} not found")
+        version = read_dataset_version(self.db_path)
+        dataset = self.dataset
+        if dataset is not None and dataset.version == version:
+            return dataset
+        with self.load_lock:
+            if self.dataset is None or self.dataset.version != version:
+                print(f"Loading dataset version {version} from {self.db_path}...")
+                self.dataset = Dataset(version, self.db_path)
+                with self.cache_lock:
+                    for key in [key for key in self.cache if key[0] != version]:
+                        del self.cache[key]
+            return self.dataset
+
+    @staticmethod
+    def etag(version, path, filters):
+        return f'"v{version}-{inputs_digest((path, filters))}"'
+
+    def response(self, path, query, record=True):
+        """
+        (ETag, JSON body, where it came from: 'memory', 'disk' or 'computed') of a request;
+        raises BadRequest or NotFound. With record, the request is counted for warm_up().
+        """
+        if path != "/kpis" and not (path.startswith("/breakdowns/") and path.rsplit('/', 1)[1] in BREAKDOWNS):
+            raise NotFound(f"Unknown path {path}; try /kpis or /breakdowns/<{'|'.join(BREAKDOWNS)}>")
+        dataset = self.current_dataset()
+        filters = dataset.normalize_filters(query)
+        if record:
+            self.results.record_request(path, json.dumps(requested_filters(query), sort_keys=True))
+        key = (dataset.version, path, filters)
+        with self.cache_lock:
+            future = self.cache.get(key)
+            source = "memory" if future is not None else None
+            if source:
+                self.cache.move_to_end(key)
+                self.hits += 1
+            else:
+                # Requests arriving while this one computes wait on the same future
+                future = self.cache[key] = Future()
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+        if not source:
+            digest = inputs_digest((path, filters))
+            try:
+                body = self.results.get(dataset.version, digest)
+                source = "disk" if body is not None else "computed"
+                if body is None:
+                    body = json.dumps(dataset.compute(path, filters)).encode('utf-8')
+                    self.results.put(dataset.version, digest, path, body)
+                future.set_result(body)
+            except Exception as e:
+                with self.cache_lock:
+                    if self.cache.get(key) is future:
+                        del self.cache[key]
+                future.set_exception(e)
+            with self.cache_lock:
+                if source == "disk":
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+        return self.etag(*key), future.result(), source
+
+
+def warm_up(db_path=DB_PATH, top=RESULT_CACHE_WARM_UP_TOP):
+    """
+    Precomputes the results of the current dataset version for the most requested
+    selections, plus the unfiltered /kpis and breakdowns, into the persistent result cache.
+    Returns the number of results computed (the others were cached already).
+    """
+    service = KpiService(db_path)
+    selections = [(path, "{}") for path in ["/kpis"] + [f"/breakdowns/{name}" for name in BREAKDOWNS]]
+    selections += [selection for selection in service.results.popular_selections(top) if selection not in selections]
+    computed = 0
+    for path, query in selections:
+        try:
+            _, _, source = service.response(path, json.loads(query), record=False)
+        except (BadRequest, NotFound) as e: # Filters the new version cannot apply
+            print(f"Warm-up skipped {path} {query}: {e}")
+            continue
+        computed += source == "computed"
+    service.results.close()
+    print(f"[Warm-up] {computed} of {len(selections)} results computed for dataset version {service.dataset.version}.")
+    return computed
+
+
+class KpiRequestHandler(BaseHTTPRequestHandler):
+    server_version = "KpiService/1.0"
+
+    def send_json(self, status, body, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, json.dumps({"error": message}).encode('utf-8'))
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        try:
+            if path == "/health":
+                dataset = service.current_dataset()
+                body = {"dataset_version": dataset.version, "cache_entries": len(service.cache),
+                        "cache_hits": service.hits, "disk_cache_hits": service.disk_hits, "cache_misses": service.misses,
+                        "disk_cache": service.results.stats()}
+                self.send_json(200, json.dumps(body).encode('utf-8'), [("Cache-Control", "no-store")])
+                return
+            query = parse_qs(url.query)
+            if path.startswith("/export/"):
+                self.send_export(service, path, query)
+                return
+            # Revalidation is answered from the key alone, before any computation
+            dataset = service.current_dataset()
+            etag = None
+            try:
+                etag = service.etag(dataset.version, path, dataset.normalize_filters(query))
+            except BadRequest:
+                pass # Reported by service.response below
+            if etag is not None and etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(',')]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                return
+            etag, body, source = service.response(path, query)
+            self.send_json(200, body, [("ETag", etag), ("Cache-Control", "no-cache"), ("X-Cache", source)])
+        except BadRequest as e:
+            self.send_error_json(400, str(e))
+        except NotFound as e:
+            self.send_error_json(404, str(e))
+        except FileNotFoundError as e:
+            self.send_error_json(503, f"No data to serve: {e}")
+        except Exception as e:
+            self.send_error_json(500, f"{type(e).__name__}: {e}")
+
+
+    def send_export(self, service, path, query):
+        """Streams an export chunk by chunk (HTTP/1.0: the body ends when the connection closes)."""
+        table, _, file_format = path.rsplit('/', 1)[1].partition('.')
+        if table not in EXPORT_TABLES or file_format not in EXPORT_FORMATS:
+            raise NotFound(f"Unknown export {path}; try /export/<{'|'.join(EXPORT_TABLES)}>.<{'|'.join(EXPORT_FORMATS)}>")
+        dataset = service.current_dataset()
+        filters = dataset.normalize_filters(query)
+        start_date, end_date, brand, product, platform = dataset.selection(filters)
+        # One read transaction: the orders and payments of one version, the version reported
+        with closing(connect(service.db_path, label="kpi_service_export")) as conn, conn:
+            conn.execute("BEGIN")
+            version = current_version(conn)
+            frame, positions = read_export_rows(conn, table, dataset.performance_df, start_date, end_date,
+                                                brand, product, platform)
+        chunks = iter_export(file_format, frame, positions)
+
+        self.send_response(200)
+        self.send_header("Content-Type", EXPORT_FORMATS[file_format])
+        self.send_header("Content-Disposition", f'attachment; filename="{table}_{start_date}_{end_date}.{file_format}"')
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("X-Dataset-Version", str(version))
+        self.end_headers()
+        # The status line is sent: failures from here on can only cut the download short
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"Export {path} cancelled by the client.")
+        except Exception as e:
+            print(f"Export {path} failed after the response started: {type(e).__name__}: {e}")
+        finally:
+            chunks.close()
+
+
+class KpiServer(ThreadingHTTPServer):
+    daemon_threads = True # Do not wait for open connections on shutdown
+
+    def __init__(self, address, service):
+        super().__init__(address, KpiRequestHandler)
+        self.service = service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard's KPIs and breakdowns as JSON, and exports of the filtered data, over HTTP.")
+    parser.add_argument("--host", default=KPI_SERVICE_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=KPI_SERVICE_PORT, help="port to listen on")
+    parser.add_argument("--warm-up", action="store_true", help="precompute the most requested selections into the result cache and exit")
+    args = parser.parse_args()
+
+    if not DB_PATH.exists():
+        raise SystemExit(f"Database {DB_PATH} not found; run generate_data.py first.")
+    if args.warm_up:
+        warm_up()
+        return
+    service = KpiService()
+    service.current_dataset() # Load before taking requests
+    server = KpiServer((args.host, args.port), service)
+    print(f"KPI service: {DB_PATH} on http://{args.host}:{args.port} (/kpis, /breakdowns/<{'|'.join(BREAKDOWNS)}>, /export/<table>.<format>, /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("KPI service stopped.")
+    finally:
+        server.server_close()
+        server.service.results.close() # Writes the request counts not written yet
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+from contextlib import closing
+
+from constants import DB_PATH, PARTITION_ARCHIVE_DIR, RESULT_CACHE_WARM_UP
+from utils.dataset_version import publish_version
+from utils.partitions import (archive_partition, compact_partition, live_partitions, partition_tracking_data,
+                              read_partition_catalog, restore_partition)
+from utils.snapshot import SNAPSHOT_MARTS, read_marts, write_snapshot
+from utils.sqlite_trace import connect
+
+# --- Partition Maintenance ---
+# Maintenance of the monthly partitions of raw_tracking_data (see utils/partitions.py) on the
+# live database. create_sql_marts.py and the refresh scheduler partition closed months on
+# their own; this script lists them and archives, restores or compacts them by hand.
+#   - list and compact leave the marts as they are, so they publish nothing
+#   - archive and restore change which orders the marts show: each publishes a new dataset
+#     version with a full mart snapshot, in the same write transaction as the change, so
+#     open dashboards switch over on their next rerun; with RESULT_CACHE_WARM_UP, the KPI
+#     service's most requested results for that version are then precomputed (kpi_service.warm_up)
+# Writes go to the live database, which is in WAL mode: dashboard reads never wait for them.
+#
+# Run from the project root:
+#   python manage_partitions.py list
+#   python manage_partitions.py partition                  # move closed months out of raw_tracking_data now
+#   python manage_partitions.py archive 2024-01 2024-02    # or: archive --before 2025-01
+#   python manage_partitions.py restore 2024-01
+#   python manage_partitions.py compact 2024-01
+
+
+def publish_with_snapshot(source):
+    """before_commit callback: publishes a new dataset version with a full snapshot of the marts."""
+    def publish(conn):
+        frames = read_marts(conn)
+        version = publish_version(conn, source, dict(zip(SNAPSHOT_MARTS, (len(frame) for frame in frames))))
+        write_snapshot(frames, DB_PATH, dataset_version=version)
+        print(f"Published dataset version {version} with its snapshot.")
+    return publish
+
+
+def list_partitions():
+    catalog, landing_rows = read_partition_catalog(DB_PATH)
+    print(f"raw_tracking_data (landing table): {landing_rows:,} rows")
+    if not catalog:
+        print("No monthly partitions.")
+    for month, table, rows, max_order_key, archive_path in catalog:
+        where = f"archived in {archive_path}" if archive_path else "live"
+        print(f"{month}  {table:<28} {rows:>10,} rows  max order_key {max_order_key}  {where}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, archive, restore or compact the monthly partitions of raw_tracking_data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the partitions and the landing table's size")
+    commands.add_parser("partition", help="move closed months of raw_tracking_data into their partitions")
+    archive = commands.add_parser("archive", help=f"move partitions to {PARTITION_ARCHIVE_DIR} (their orders leave the marts)")
+    archive.add_argument("months", nargs="*", help="months to archive (YYYY-MM)")
+    archive.add_argument("--before", help="archive every live partition before this month (YYYY-MM)")
+    restore = commands.add_parser("restore", help="copy archived partitions back into the database")
+    restore.add_argument("months", nargs="+", help="months to restore (YYYY-MM)")
+    compact = commands.add_parser("compact", help="rewrite partitions in date order")
+    compact.add_argument("months", nargs="+", help="months to compact (YYYY-MM)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        list_partitions()
+        return
+    if not DB_PATH.exists():
+        raise SystemExit(f"Database {DB_PATH} not found; run generate_data.py first.")
+
+    with closing(connect(DB_PATH, label=f"manage_partitions:{args.command}")) as conn:
+        try:
+            if args.command == "partition":
+                with conn:
+                    moved = partition_tracking_data(conn)
+                print(f"Moved {sum(moved.values()):,} rows into {len(moved)} partitions.")
+            elif args.command == "archive":
+                months = list(args.months)
+                if args.before:
+                    months += [month for month, _ in live_partitions(conn) if month < args.before and month not in months]
+                if not months:
+                    raise SystemExit("No partitions to archive.")
+                for month in months:
+                    path = archive_partition(conn, month, before_commit=publish_with_snapshot("manage_partitions"))
+                    print(f"Archived {month} to {path}.")
+            elif args.command == "restore":
+                for month in args.months:
+                    rows = restore_partition(conn, month, before_commit=publish_with_snapshot("manage_partitions"))
+                    print(f"Restored {month}: {rows:,} rows.")
+            elif args.command == "compact":
+                for month in args.months:
+                    with conn:
+                        rows = compact_partition(conn, month)
+                    print(f"Compacted {month}: {rows:,} rows.")
+        except ValueError as e:
+            raise SystemExit(str(e))
+
+    if args.command in ("archive", "restore") and RESULT_CACHE_WARM_UP:
+        from kpi_service import warm_up # Loads the dashboard's data stack, only when warming
+        warm_up()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from constants import (DB_PATH, INBOX_DIR, INGEST_CHUNK_ROWS, INGEST_SETTLE_S, REFRESH_INTERVAL_S, REFRESH_MAX_ATTEMPTS,
+                       REFRESH_RETRY_BASE_S, REFRESH_RETRY_MAX_S, REFRESH_LOG_PATH,
+                       RESULT_CACHE_WARM_UP)
+from create_sql_marts import assign_surrogate_keys # Keys appended rows in the same transaction
+from utils.dataset_version import publish_version
+from utils.partitions import LANDING_TABLE, partition_tracking_data
+from utils.snapshot import update_snapshot
+from utils.sqlite_trace import connect
+
+# --- Background Refresh Scheduler ---
+# Long-running entry point that keeps the live database current without the manual
+# generate_data.py / create_sql_marts.py runs (those rebuild everything; see utils/staging.py).
+# Every REFRESH_INTERVAL_S, or INGEST_SETTLE_S after request_refresh() (ingest_daemon.py
+# calls it when a file lands), it queues a refresh, which runs as a chain of jobs:
+#   1. ingest: streams each new CSV file in INBOX_DIR into its raw table in chunks of
+#      INGEST_CHUNK_ROWS rows, one transaction per chunk that also keys the chunk's rows
+#      (dimension tables and surrogate keys). The marts are views over the raw tables, so
+#      this is their incremental refresh: nothing is rebuilt.
+#   2. publish: updates the memory-mapped mart snapshot (reading only the new orders when
+#      nothing else changed) and records a new dataset version, which the dashboard's caches
+#      are keyed on, in one write transaction. A dashboard that
+#      sees the new version finds its snapshot already in place and maps it instead of
+#      reading the marts from SQLite, and no other writer can publish in between.
+#   3. partition: once orders of a new month have arrived, moves the closed months of
+#      raw_tracking_data into their monthly partitions (utils/partitions.py). The marts read
+#      the same rows before and after, so it publishes no version.
+#   4. warm (only with RESULT_CACHE_WARM_UP): precomputes the KPI service's most requested
+#      results for the new version into the persistent result cache (kpi_service.warm_up).
+# Jobs run one at a time from a queue ordered by due time. A job that fails is queued again
+# with exponential back-off, up to REFRESH_MAX_ATTEMPTS attempts; the next scheduled check
+# starts over. Every attempt (duration, rows, outcome) is appended to REFRESH_LOG_PATH.
+# The ingested_files table records how many rows of each file are committed, so a file
+# whose ingest failed partway resumes after its last chunk instead of appending it twice.
+# Writes go to the live database, which is in WAL mode: dashboard reads never wait for them.
+#
+# Run from the project root:
+#   python refresh_scheduler.py                # check the inbox every REFRESH_INTERVAL_S
+#   python refresh_scheduler.py --once         # one refresh (with its retries), then exit
+#   python ingest_daemon.py                    # refresh within seconds of a file landing
+
+# Inbox file name prefix -> raw table it is appended to
+RAW_TABLES = {
+    'influencers': 'raw_influencers',
+    'posts': 'raw_posts',
+    'tracking_data': 'raw_tracking_data',
+    'payouts': 'raw_payouts',
+}
+
+
+def inbox_table(path):
+    """Raw table an inbox file belongs to, from the longest matching name prefix (None if none)."""
+    matches = [prefix for prefix in RAW_TABLES if path.stem.startswith(prefix)]
+    return RAW_TABLES[max(matches, key=len)] if matches else None
+
+
+INGESTED_FILES_SQL = """
+CREATE TABLE IF NOT EXISTS ingested_files (
+    file_name TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_mtime_ns INTEGER NOT NULL,
+    raw_table TEXT NOT NULL,
+    rows_appended INTEGER NOT NULL, -- Committed so far; a retried file resumes after them
+    completed_at TEXT, -- NULL until the whole file is appended
+    PRIMARY KEY (file_name, file_size, file_mtime_ns)
+);
+"""
+
+
+def append_csv(conn, path, table, chunk_rows=INGEST_CHUNK_ROWS):
+    """
+    Appends the rows of a CSV file to a raw table in chunks of chunk_rows, one transaction per
+    chunk that also assigns the chunk's surrogate keys and records the progress in
+    ingested_files. Yields the number of rows of each committed chunk. A file partly appended
+    by an earlier attempt resumes after its last committed chunk; a completed one yields
+    nothing. Raises ValueError when the file lacks columns of the table or cannot be parsed.
+    """
+    stat = path.stat()
+    file_id = (path.name, stat.st_size, stat.st_mtime_ns)
+    with conn:
+        conn.execute(INGESTED_FILES_SQL)
+        progress = conn.execute(
+            "SELECT rows_appended, completed_at FROM ingested_files WHERE file_name = ? AND file_size = ? AND file_mtime_ns = ?",
+            file_id
+        ).fetchone()
+    appended, completed = progress or (0, None)
+    if completed:
+        return
+
+    # The *_key columns are filled in by assign_surrogate_keys, not taken from the file
+    table_info = [row[1:3] for row in conn.execute(f"PRAGMA table_info({table})") if not row[1].endswith('_key')]
+    columns = [column for column, _ in table_info]
+    # Text columns are read as text in every chunk, whatever its values look like
+    dtypes = {column: str for column, declared in table_info if declared == 'TEXT'}
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"{path.name} is missing the {table} columns {missing}")
+    insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    progress_sql = """
+        INSERT INTO ingested_files (file_name, file_size, file_mtime_ns, raw_table, rows_appended, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (file_name, file_size, file_mtime_ns)
+        DO UPDATE SET rows_appended = excluded.rows_appended, completed_at = excluded.completed_at
+    """
+
+    # Rows committed by an earlier attempt are skipped, not parsed (line 0 is the header)
+    reader = pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_rows, skiprows=range(1, appended + 1))
+    for chunk in reader:
+        chunk = chunk[columns].astype(object)
+        with conn:
+            conn.executemany(insert_sql, chunk.where(chunk.notna(), None).itertuples(index=False, name=None))
+            assign_surrogate_keys(conn)
+            appended += len(chunk)
+            conn.execute(progress_sql, file_id + (table, appended, None))
+        yield len(chunk)
+    with conn:
+        conn.execute(progress_sql, file_id + (table, appended, datetime.now(timezone.utc).isoformat(timespec="seconds")))
+
+
+def move_file(path, directory):
+    """Moves a handled inbox file into a subdirectory, keeping earlier files of the same name."""
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / path.name
+    if target.exists():
+        target = directory / f"{datetime.now():%Y%m%d_%H%M%S}_{path.name}"
+    shutil.move(str(path), str(target))
+
+
+class Job:
+    """A queued unit of work: the job's name and which attempt this is."""
+
+    def __init__(self, name, attempt=1):
+        self.name = name
+        self.attempt = attempt
+
+
+class RefreshScheduler:
+    """Work queue of refresh jobs (ingest -> publish -> partition -> warm) with retries and back-off."""
+
+    def __init__(self, db_path=DB_PATH, inbox_dir=INBOX_DIR, interval_s=REFRESH_INTERVAL_S):
+        self.db_path = db_path
+        self.inbox_dir = inbox_dir
+        self.interval_s = interval_s
+        self.queue = [] # Heap of (due time, sequence, Job)
+        self.sequence = itertools.count()
+        self.cycle = 0 # Number of the current refresh, shared by its jobs in the log
+        self.appended = {} # Rows appended per raw table since the last published version
+        self.version = None
+        self.handlers = {"ingest": self.ingest, "publish": self.publish, "partition": self.partition, "warm": self.warm}
+        # Set from other threads by request_refresh(); wakes the queue loop early
+        self.lock = threading.Lock()
+        self.requested_at = None
+        self.wake = threading.Event()
+
+    def enqueue(self, name, delay_s=0, attempt=1):
+        heapq.heappush(self.queue, (time.monotonic() + delay_s, next(self.sequence), Job(name, attempt)))
+
+    def queued(self, name):
+        return any(job.name == name for _, _, job in self.queue)
+
+    def request_refresh(self):
+        """
+        Asks for a refresh once the inbox has been quiet for INGEST_SETTLE_S (each call
+        restarts the wait), instead of at the next scheduled check. Safe to call from any thread.
+        """
+        with self.lock:
+            self.requested_at = time.monotonic()
+        self.wake.set()
+
+    def take_request(self, now):
+        """Clears and returns True if a requested refresh is due at now."""
+        with self.lock:
+            due = self.requested_at is not None and now >= self.requested_at + INGEST_SETTLE_S
+            if due:
+                self.requested_at = None
+            return due
+
+    # --- Jobs: each returns the rows it handled and queues the jobs that follow it ---
+    def ingest(self):
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"Database {self.db_path} not found; run generate_data.py first.")
+        rows = {}
+        with closing(connect(self.db_path, label="refresh_scheduler:ingest")) as conn, conn:
+            for path in sorted(self.inbox_dir.glob('*.csv')):
+                table = inbox_table(path)
+                if table is None:
+                    print(f"Skipping {path.name}: no raw table matches its name.")
+                    continue
+                if time.time() - path.stat().st_mtime < INGEST_SETTLE_S:
+                    # Possibly still being written or copied in: look again once it has settled
+                    self.request_refresh()
+                    continue
+                count = 0
+                try:
+                    # Counted per chunk: chunks committed before a failure are published too
+                    for chunk_rows in append_csv(conn, path, table):
+                        count += chunk_rows
+                        rows[table] = rows.get(table, 0) + chunk_rows
+                        self.appended[table] = self.appended.get(table, 0) + chunk_rows
+                except ValueError as e: # Bad file: retrying will not help
+                    print(f"Rejected {path.name} after {count:,} rows: {e}")
+                    move_file(path, self.inbox_dir / 'failed')
+                    continue
+                move_file(path, self.inbox_dir / 'processed')
+                print(f"Appended {count:,} rows from {path.name} to {table}.")
+        # Also after a retry that found nothing new: the failed attempt may have appended files
+        if self.appended:
+            self.enqueue("publish")
+        return rows
+
+    def publish(self):
+        with closing(connect(self.db_path, label="refresh_scheduler:publish")) as conn, conn:
+            # The write lock is taken first, so the marts read below are exactly the data of
+            # the version published; the snapshot is in place before the version commits.
+            conn.execute("BEGIN IMMEDIATE")
+            self.version = publish_version(conn, "refresh_scheduler", self.appended)
+            update_snapshot(conn, self.db_path, self.version, self.appended)
+        rows, self.appended = self.appended, {}
+        print(f"Published dataset version {self.version} with its snapshot.")
+        if LANDING_TABLE in rows:
+            self.enqueue("partition")
+        if RESULT_CACHE_WARM_UP:
+            self.enqueue("warm")
+        return rows
+
+    def partition(self):
+        with closing(connect(self.db_path, label="refresh_scheduler:partition")) as conn, conn:
+            moved = partition_tracking_data(conn)
+        if moved:
+            print(f"Moved {sum(moved.values()):,} rows of {', '.join(moved)} into monthly partitions.")
+        return moved
+
+    def warm(self):
+        from kpi_service import warm_up # Loads the dashboard's data stack, only when warming
+        return warm_up(self.db_path)
+
+    # --- Queue ---
+    def run_job(self, job):
+        record = {
+            "cycle": self.cycle,
+            "job": job.name,
+            "attempt": job.attempt,
+            "started": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        }
+        start = time.perf_counter()
+        try:
+            record["rows"] = self.handlers[job.name]()
+            record["status"] = "ok"
+            if job.name == "publish":
+                record["version"] = self.version
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            if job.attempt < REFRESH_MAX_ATTEMPTS:
+                delay_s = min(REFRESH_RETRY_BASE_S * 2 ** (job.attempt - 1), REFRESH_RETRY_MAX_S)
+                record["status"] = "retrying"
+                record["retry_in_s"] = delay_s
+                self.enqueue(job.name, delay_s, job.attempt + 1)
+                print(f"{job.name} attempt {job.attempt} failed: {e} (retrying in {delay_s:g} s)")
+            else:
+                record["status"] = "failed"
+                print(f"{job.name} attempt {job.attempt} failed: {e} (giving up until the next check)")
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        REFRESH_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(REFRESH_LOG_PATH, "a", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(record) + "\n")
+        return record
+
+    def run(self, once=False):
+        """Runs scheduled refreshes until interrupted (with once, until the first refresh is done)."""
+        self.inbox_dir.mkdir(parents=True, exist_ok=True)
+        next_check = time.monotonic()
+        while True:
+            self.wake.clear()
+            now = time.monotonic()
+            scheduled = now >= next_check
+            if (self.take_request(now) or scheduled) and not (once and self.cycle):
+                # A refresh still in progress (e.g. retrying) is not started twice
+                if not self.queued("ingest"):
+                    self.cycle += 1
+                    self.enqueue("ingest")
+            if scheduled:
+                next_check = now + self.interval_s
+            if self.queue and self.queue[0][0] <= now:
+                _, _, job = heapq.heappop(self.queue)
+                self.run_job(job)
+                continue
+            if once and not self.queue:
+                return
+            wake_at = min(next_check, self.queue[0][0]) if self.queue else next_check
+            with self.lock:
+                if self.requested_at is not None:
+                    wake_at = min(wake_at, self.requested_at + INGEST_SETTLE_S)
+            self.wake.wait(max(0, wake_at - time.monotonic()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Periodically ingest new raw data, refresh the marts and publish dataset versions.")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL_S, help="seconds between inbox checks")
+    parser.add_argument("--once", action="store_true", help="run one refresh (with its retries) and exit")
+    args = parser.parse_args()
+
+    scheduler = RefreshScheduler(interval_s=args.interval)
+    print(f"Refresh scheduler: {DB_PATH}, inbox {INBOX_DIR}, every {args.interval:g} s. Runs are logged to {REFRESH_LOG_PATH}.")
+    try:
+        scheduler.run(once=args.once)
+    except KeyboardInterrupt:
+        print("Refresh scheduler stopped.")
+
+
+if __name__ == "__main__":
+    main()
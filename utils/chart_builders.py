@@ -0,0 +1,268 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit_echarts import JsCode
+
+from constants import CHART_COLORS, CHART_CACHE_MAX_ENTRIES
+from utils.instrumentation import count_cache_lookup, count_cache_miss
+
+# --- ECharts Option Builders ---
+# Builds the option dicts passed to st_echarts:
+#   - series data is built from column arrays (zip over .tolist()), never row by row
+#   - the static parts of every option (tooltips, JS formatters, emphasis styles,
+#     toolboxes) are defined once below and shared by every payload
+#   - finished payloads are cached by a hash of the aggregated input, so a chart
+#     whose data did not change is not rebuilt on the next rerun
+# Payloads are shared between reruns and sessions: treat them as read-only.
+
+# --- Static Option Templates ---
+TOOLTIP_ITEM = {"trigger": 'item'}
+TOOLTIP_ITEM_CURRENCY = {"trigger": 'item', "formatter": "{a} <br/>{b} : ₹{c} ({d}%)"}
+PIE_LEGEND = {"orient": 'vertical', "left": 'left', "textStyle": {"fontSize": 10}}
+PIE_EMPHASIS = {
+    "itemStyle": {
+        "shadowBlur": 10,
+        "shadowOffsetX": 0,
+        "shadowColor": 'rgba(0, 0, 0, 0.5)'
+    }
+}
+
+DONUT_TOOLBOX = {
+    "show": True,
+    "feature": {
+        "mark": {"show": True},
+        "dataView": {"show": True, "readOnly": False},
+        "restore": {"show": True},
+        "saveAsImage": {"show": True}
+    }
+}
+DONUT_SERIES_STYLE = {
+    "type": 'pie',
+    "radius": ['35%', '60%'],
+    "center": ['50%', '50%'],
+    "avoidLabelOverlap": True,
+    "borderRadius": 10,
+    "itemStyle": {
+        "borderRadius": 10,
+        "borderColor": '#fff',
+        "borderWidth": 2
+    },
+    "label": {
+        "show": True,
+        "position": 'outside',
+        "formatter": '{b}: {d}%',
+        "fontSize": 11
+    },
+    "emphasis": {
+        "label": {
+            "show": True,
+            "fontSize": 14,
+            "fontWeight": 'bold'
+        }
+    },
+    "labelLine": {
+        "show": True
+    }
+}
+
+STACKED_BAR_TOOLTIP = {"trigger": 'axis', "axisPointer": {"type": 'shadow'}}
+STACKED_BAR_GRID = {"left": '10%', "right": '4%', "bottom": '3%', "containLabel": True}
+
+# Indian digit grouping for the time chart tooltip (e.g. ₹1,23,456.78)
+TIME_SERIES_TOOLTIP = {
+    "trigger": 'axis',
+    "axisPointer": {"type": 'shadow'},
+    "formatter": "function (params) { let tooltipContent = params[0].name + '<br/>'; params.forEach(function (item) { let value = item.value; if (value === 0) value = '0'; let parts = value.toString().split('.'); let integer = parts[0]; let decimal = parts.length > 1 ? '.' + parts[1] : ''; let lastThree = integer.substring(integer.length - 3); let otherNumbers = integer.substring(0, integer.length - 3); if (otherNumbers != '') { lastThree = ',' + lastThree; } let formatted = otherNumbers.replace(/\\B(?=(\\d{2})+(?!\\d))/g, \",\") + lastThree; tooltipContent += item.marker + item.seriesName + ': ₹' + formatted + decimal + '<br/>'; }); return tooltipContent; }"
+}
+TIME_SERIES_LEGEND = {"data": ['Revenue', 'Payout', 'Net Profit']}
+TIME_SERIES_DATA_ZOOM = [{
+    "type": 'inside',
+    "start": 0,
+    "end": 100
+}, {
+    "start": 0,
+    "end": 10,
+    "bottom": 0, # Add bottom to the scrollbar to prevent overlap
+    "height": 20 # Add height to the scrollbar for better visibility
+}]
+
+RANKED_BAR_GRID = {"left": '3%', "right": '4%', "bottom": '3%', "containLabel": True}
+RANKED_BAR_TOOLTIP_REVENUE = {
+    "trigger": 'axis',
+    "axisPointer": {"type": 'shadow'},
+    "formatter": JsCode("function (params) { return params[0].name + '<br/>Revenue: ' + params[0].data.revenue_formatted; }").js_code
+}
+RANKED_BAR_AXIS_REVENUE = {
+    "type": 'value',
+    "axisLabel": {
+        "formatter": JsCode("function (value) { return '₹' + new Intl.NumberFormat('en-IN').format(value); }").js_code
+    }
+}
+RANKED_BAR_TOOLTIP_ROI = {
+    "trigger": 'axis',
+    "axisPointer": {"type": 'shadow'},
+    "formatter": JsCode("function (params) { return params[0].name + '<br/>ROI: ' + params[0].data.roi_formatted; }").js_code
+}
+RANKED_BAR_AXIS_ROI = {
+    "type": 'value',
+    "axisLabel": {
+        "formatter": JsCode("function (value) { return value.toFixed(2) + '%'; }").js_code
+    }
+}
+
+
+# --- Series Data from Columns ---
+
+def _to_list(values):
+    """Converts a column (Series, array or list) to a list of plain Python values for JSON."""
+    return np.asarray(values).tolist()
+
+def name_value_data(names, values):
+    """Builds [{'value': v, 'name': n}, ...] for pie and donut series from two columns."""
+    return [{"value": value, "name": name} for name, value in zip(_to_list(names), _to_list(values))]
+
+
+# --- Option Builders ---
+
+def pie_options(series_name, names, values, legend=True, currency_tooltip=False):
+    """Builds a plain pie chart (overview and platform pies)."""
+    options = {"tooltip": TOOLTIP_ITEM_CURRENCY if currency_tooltip else TOOLTIP_ITEM}
+    if legend:
+        options["legend"] = PIE_LEGEND
+    options["series"] = [{
+        "name": series_name,
+        "type": 'pie',
+        "radius": '50%',
+        "data": name_value_data(names, values),
+        "emphasis": PIE_EMPHASIS
+    }]
+    return options
+
+def donut_options(series_name, names, values, toolbox=False):
+    """Builds a donut chart (detailed analysis breakdowns); the toolbox variant also uses CHART_COLORS."""
+    options = {"tooltip": TOOLTIP_ITEM_CURRENCY}
+    if toolbox:
+        options["toolbox"] = DONUT_TOOLBOX
+        options["color"] = CHART_COLORS
+    options["series"] = [{"name": series_name, **DONUT_SERIES_STYLE, "data": name_value_data(names, values)}]
+    return options
+
+def stacked_bar_options(categories, series_names, values):
+    """Builds a horizontal stacked bar chart; values is a (category x series) matrix."""
+    values = np.asarray(values)
+    return {
+        "tooltip": STACKED_BAR_TOOLTIP,
+        "legend": {"data": _to_list(series_names), "textStyle": {"fontSize": 10}},
+        "grid": STACKED_BAR_GRID,
+        "xAxis": {"type": 'value', "axisLabel": {"textStyle": {"fontSize": 8}}},
+        "yAxis": {"type": 'category', "data": _to_list(categories), "axisLabel": {"textStyle": {"fontSize": 10}}},
+        "series": [
+            {
+                "name": name,
+                "type": 'bar',
+                "stack": 'total',
+                "emphasis": {"focus": 'series'},
+                "data": _to_list(values[:, position]),
+                "barWidth": 15
+            }
+            for position, name in enumerate(_to_list(series_names))
+        ]
+    }
+
+def time_series_options(dates, revenue, payout, net_profit):
+    """Builds the Revenue, Payout & Net Profit line chart."""
+    return {
+        "tooltip": TIME_SERIES_TOOLTIP,
+        "legend": TIME_SERIES_LEGEND,
+        "xAxis": {"type": 'category', "data": _to_list(dates)},
+        "yAxis": {"type": 'value'},
+        "series": [
+            {"name": 'Revenue', "data": _to_list(revenue), "type": 'line', "smooth": True},
+            {"name": 'Payout', "data": _to_list(payout), "type": 'line', "smooth": True, "itemStyle": {"color": '#FF0000'}},
+            {"name": 'Net Profit', "data": _to_list(net_profit), "type": 'line', "smooth": True, "itemStyle": {"color": '#008000'}}
+        ],
+        "dataZoom": TIME_SERIES_DATA_ZOOM
+    }
+
+def top_revenue_bar_options(names, revenue, revenue_formatted):
+    """Builds the Top Influencers by Revenue horizontal bar chart."""
+    return {
+        "tooltip": RANKED_BAR_TOOLTIP_REVENUE,
+        "grid": RANKED_BAR_GRID,
+        "xAxis": RANKED_BAR_AXIS_REVENUE,
+        "yAxis": {"type": 'category', "data": _to_list(names), "axisLabel": {"interval": 0, "rotate": 0}},
+        "series": [{
+            "name": 'Revenue',
+            "type": 'bar',
+            "encode": {"x": 'Revenue', "y": 'Influencer'},
+            "data": [
+                {"value": value, "revenue_formatted": label}
+                for value, label in zip(_to_list(revenue), _to_list(revenue_formatted))
+            ],
+            "itemStyle": {"color": CHART_COLORS[2]},
+            "barWidth": "20%"
+        }]
+    }
+
+def worst_roi_bar_options(names, roi, roi_formatted):
+    """Builds the Worst Influencers by ROI horizontal bar chart with its red gradient."""
+    roi = _to_list(roi)
+    return {
+        "tooltip": RANKED_BAR_TOOLTIP_ROI,
+        "grid": RANKED_BAR_GRID,
+        "xAxis": RANKED_BAR_AXIS_ROI,
+        "yAxis": {"type": 'category', "data": _to_list(names), "axisLabel": {"interval": 0, "rotate": 0}},
+        "visualMap": { # Visual map for color gradient
+            "orient": 'horizontal',
+            "left": 'center',
+            "bottom": '0',
+            "min": min(roi),
+            "max": max(roi), # This will still be negative, but closer to 0
+            "text": ['High Negative ROI', 'Low Negative ROI'], # Labels for the gradient
+            "inRange": {
+                "color": ['#FF0000', "#FFB09D"] # Red to DarkOrange gradient (adjust as needed)
+            }
+        },
+        "series": [{
+            "name": 'ROI',
+            "type": 'bar',
+            "encode": {"x": 'ROI', "y": 'Influencer'},
+            "data": [
+                {"value": value, "roi_formatted": label}
+                for value, label in zip(roi, _to_list(roi_formatted))
+            ],
+            "itemStyle": {"color": '#FF0000'}, # Color is set by visualMap; this is the fallback
+            "barWidth": "20%"
+        }]
+    }
+
+
+# --- Payload Cache ---
+
+def data_digest(*columns):
+    """Hashes the aggregated input columns of a chart into a short hex digest."""
+    digest = hashlib.blake2b(digest_size=16)
+    for column in columns:
+        array = np.asarray(column)
+        if array.dtype.kind not in 'biufM':
+            array = array.astype(object)
+        digest.update(str(array.shape).encode())
+        digest.update(pd.util.hash_array(array.ravel()).tobytes())
+    return digest.hexdigest()
+
+@st.cache_resource(max_entries=CHART_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_payload(chart_key, digest, _build, _columns):
+    """Builds a payload once per (chart, input digest); the builder and columns are not hashed."""
+    count_cache_miss("chart_payloads")
+    return _build(*_columns)
+
+def cached_options(chart_key, build, *columns):
+    """
+    Returns the option payload for a chart, calling build(*columns) only when the
+    aggregated input differs from the last time this chart was drawn with it.
+    chart_key must identify the chart and any static arguments bound into build.
+    """
+    count_cache_lookup("chart_payloads")
+    return _cached_payload(chart_key, data_digest(*columns), build, columns)
@@ -1,46 +1,114 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 
 # Import the robust DB_PATH from the corrected constants.py
 from constants import DB_PATH
+from utils.snapshot import load_marts
+from utils.dataset_version import read_dataset_version
+from utils.instrumentation import count_cache_lookup, count_cache_miss
+from utils.time_index import TimeIndex
+from utils.sketches import DailySketches, stratified_sample
+from utils.rankings import Leaderboard
+from utils.influencer_table import InfluencerTable
 
-@st.cache_data
-def load_all_data():
+# The loaded frames are shared by every session (st.cache_resource, one copy per process).
+# Callers get copy-on-write views from load_all_data(), so a session that modifies its
+# frames copies only the columns it changes and never touches the shared data.
+# pandas 3 always copies on write; pandas 2 needs the option.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Every cached loader takes the dataset version (see utils/dataset_version.py) as its key,
+# so data published by a refresh is loaded on the next rerun. Only the latest version is
+# kept (max_entries=1): the previous one is released once no session uses it.
+
+def current_dataset_version():
+    """Dataset version of the database, read on every rerun (one small query)."""
+    return read_dataset_version(DB_PATH)
+
+@st.cache_resource(max_entries=1)
+def load_shared_data(version):
     """
     Loads performance, orders, and payment log data from the SQLite database
     using the correct table names.
+    Loaded once per process and dataset version; the returned frames are shared and must not be modified.
     """
+    count_cache_miss("shared_dataset")
     if not DB_PATH.exists():
         st.error(f"Error: Database file not found at {DB_PATH}.")
         st.info("Please ensure 'data.db' is in the project's root directory.")
         st.stop()
 
-    print(f"Attempting to load data from SQLite database: {DB_PATH}")
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            # CHANGE: The SQL queries now use the original table names from your database.
-            performance_df = pd.read_sql_query("SELECT * FROM influencer_performance", conn)
-            
-            orders_df = pd.read_sql_query("SELECT * FROM enriched_orders", conn)
-            orders_df['order_date'] = pd.to_datetime(orders_df['order_date'])
-            orders_df['revenue_generated'] = pd.to_numeric(orders_df['revenue_generated'], errors='coerce').fillna(0)
-            
-            payment_log_df = pd.read_sql_query("SELECT * FROM payments_log", conn)
-            # Your original code used 'invoice_date'. This is preserved.
-            payment_log_df['invoice_date'] = pd.to_datetime(payment_log_df['invoice_date'])
-
-            return performance_df, orders_df, payment_log_df
+        # The snapshot when current, otherwise the marts read from SQLite (shared with kpi_service.py)
+        return load_marts(DB_PATH)
             
     except Exception as e:
         st.error(f"An error occurred while loading data: {e}")
         st.info("Please ensure the database file is not corrupted and the tables 'influencer_performance', 'enriched_orders', and 'payments_log' exist.")
         st.stop()
 
-def filter_dataframes(performance_df, orders_df, payment_log_df, start_date, end_date, brand, product, platform):
+def load_all_data(version):
     """
-    Filters the DataFrames based on the provided sidebar selections.
-    Your original filtering logic is preserved.
+    Returns the shared performance, orders and payment log frames as copy-on-write views
+    (shallow copies: no data is copied unless the caller modifies a column).
+    """
+    count_cache_lookup("shared_dataset")
+    return tuple(frame.copy(deep=False) for frame in load_shared_data(version))
+
+@st.cache_resource(max_entries=1)
+def load_time_index(version):
+    """
+    Builds the prefix-sum time index over the loaded orders and payments.
+    Cached as a resource so every rerun shares one read-only index.
+    """
+    performance_df, orders_df, payment_log_df = load_shared_data(version)
+    return TimeIndex(orders_df, payment_log_df)
+
+@st.cache_resource(max_entries=1)
+def load_leaderboard(version):
+    """
+    Sorts the influencer performance table once per ranking metric.
+    Top-K / bottom-K charts read from these orderings instead of sorting on every rerun.
+    """
+    performance_df, orders_df, payment_log_df = load_shared_data(version)
+    return Leaderboard(performance_df)
+
+@st.cache_resource(max_entries=1)
+def load_influencer_table(version):
+    """Orders the influencer performance table by every sortable column for server-side paging."""
+    performance_df, orders_df, payment_log_df = load_shared_data(version)
+    return InfluencerTable(performance_df)
+
+@st.cache_resource(max_entries=1)
+def load_sketches(version):
+    """
+    Builds the daily HyperLogLog sketches used by the approximate mode.
+    Only built the first time a user turns approximate mode on.
+    """
+    performance_df, orders_df, payment_log_df = load_shared_data(version)
+    return DailySketches(orders_df)
+
+@st.cache_resource(max_entries=1)
+def load_order_sample(version):
+    """Draws the stratified order sample used for revenue breakdowns in approximate mode."""
+    performance_df, orders_df, payment_log_df = load_shared_data(version)
+    return stratified_sample(orders_df)
+
+def select_rows(frame, mask):
+    """
+    Returns the rows of frame where mask is True as a new frame. When every row is kept
+    (e.g. the default, unfiltered selection) it is a copy-on-write view instead, so the
+    session holds no copy of the shared data.
+    """
+    if mask.all():
+        return frame.copy(deep=False)
+    return frame[mask].copy()
+
+def orders_mask(orders_df, start_date, end_date, brand, product, platform):
+    """
+    Boolean mask of the orders (or sampled orders) matching the date range, brand, product
+    and platform selections. Your original filtering logic is preserved.
     """
     # Platform filter logic
     if 'Organic' in platform:
@@ -49,29 +117,61 @@ def filter_dataframes(performance_df, orders_df, payment_log_df, start_date, end
     else:
         platform_mask = orders_df['platform'].isin(platform)
 
-    # Filter orders_df
-    filtered_orders_df = orders_df[
+    return (
         (orders_df['order_date'].dt.date >= start_date) &
         (orders_df['order_date'].dt.date <= end_date) &
         (orders_df['brand'].isin(brand)) &
         (orders_df['product'].isin(product)) &
         platform_mask
-    ].copy()
-
-    # Get the list of influencers who match the order filters
-    filtered_influencers = filtered_orders_df['influencer_id'].unique()
+    )
 
-    # Filter performance_df
-    filtered_performance_df = performance_df[
-        (performance_df['influencer_id'].isin(filtered_influencers))
-    ].copy()
-
-    # Filter payment_log_df by date range and influencer_id
+def payments_mask(payment_log_df, start_date, end_date, influencer_keys):
+    """Boolean mask of the payments in the date range made to the given influencers."""
     # Your original code used 'invoice_date'. This is preserved.
-    filtered_payment_log_df = payment_log_df[
+    return (
         (payment_log_df['invoice_date'].dt.date >= start_date) &
         (payment_log_df['invoice_date'].dt.date <= end_date) &
-        (payment_log_df['influencer_id'].isin(filtered_influencers))
-    ].copy()
+        (payment_log_df['influencer_key'].isin(influencer_keys))
+    )
+
+def filter_orders(orders_df, start_date, end_date, brand, product, platform):
+    """
+    Filters an orders DataFrame (or a sample of it) by date range, brand, product and platform.
+    Your original filtering logic is preserved.
+    """
+    return select_rows(orders_df, orders_mask(orders_df, start_date, end_date, brand, product, platform))
+
+def filter_dataframes(performance_df, orders_df, payment_log_df, start_date, end_date, brand, product, platform):
+    """
+    Filters the DataFrames based on the provided sidebar selections.
+    Your original filtering logic is preserved.
+    """
+    # Filter orders_df
+    filtered_orders_df = filter_orders(orders_df, start_date, end_date, brand, product, platform)
+
+    # Get the list of influencers who match the order filters
+    filtered_influencers = filtered_orders_df['influencer_key'].unique()
+
+    filtered_performance_df, filtered_payment_log_df = filter_by_influencers(
+        performance_df, payment_log_df, start_date, end_date, filtered_influencers
+    )
 
     return filtered_performance_df, filtered_orders_df, filtered_payment_log_df
+
+def filter_by_influencers(performance_df, payment_log_df, start_date, end_date, influencer_keys):
+    """
+    Filters the performance and payment log DataFrames to the given influencers (those of
+    the filtered orders), as filter_dataframes does. Approximate mode, which does not filter
+    the orders, passes the influencers found by the time index.
+    """
+    # Filter performance_df
+    filtered_performance_df = select_rows(performance_df,
+        (performance_df['influencer_key'].isin(influencer_keys))
+    )
+
+    # Filter payment_log_df by date range and influencer_key
+    filtered_payment_log_df = select_rows(payment_log_df,
+        payments_mask(payment_log_df, start_date, end_date, influencer_keys)
+    )
+
+    return filtered_performance_df, filtered_payment_log_df
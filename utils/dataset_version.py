@@ -0,0 +1,54 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+
+# --- Dataset Version ---
+# Every refresh that changes what the dashboard shows publishes a new version in the
+# dataset_versions table, as the last step of the refresh. The dashboard reads the latest
+# version on each rerun and keys its caches on it (the shared frames and indexes, and each
+# session's section results), so a refresh is picked up on the next rerun and never mixed
+# with data cached from before it.
+# The version lives in the database itself, so it is swapped in together with the data
+# (see utils/staging.py) and a database copied elsewhere keeps its version.
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    version INTEGER PRIMARY KEY,
+    published_at TEXT NOT NULL,
+    source TEXT NOT NULL, -- What published it, e.g. 'generate_data' or 'refresh_scheduler'
+    row_counts TEXT -- JSON object: rows per mart for a rebuild, rows appended per raw table for a refresh
+);
+"""
+
+
+def current_version(conn):
+    """Latest published version of the database on conn; 0 when none was ever published."""
+    try:
+        version = conn.execute("SELECT MAX(version) FROM dataset_versions").fetchone()[0]
+    except sqlite3.OperationalError: # No dataset_versions table yet
+        return 0
+    return version or 0
+
+
+def publish_version(conn, source, row_counts=None, at_least=0):
+    """
+    Records a new dataset version on conn and returns it. at_least lets a database built
+    from scratch continue the numbering of the database it replaces. The caller commits.
+    """
+    conn.execute(VERSION_TABLE_SQL)
+    version = max(current_version(conn), at_least) + 1
+    conn.execute(
+        "INSERT INTO dataset_versions (version, published_at, source, row_counts) VALUES (?, ?, ?, ?)",
+        (version, datetime.now(timezone.utc).isoformat(timespec="seconds"), source, json.dumps(row_counts or {}))
+    )
+    return version
+
+
+def read_dataset_version(db_path):
+    """Latest published version of the database at db_path (0 when none, or no database)."""
+    if not os.path.exists(db_path):
+        return 0
+    with closing(sqlite3.connect(db_path)) as conn:
+        return current_version(conn)
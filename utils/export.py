@@ -0,0 +1,115 @@
+import io
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from constants import EXPORT_CHUNK_ROWS
+from utils.data_loader import orders_mask, payments_mask
+from utils.snapshot import read_mart_range, to_arrow
+
+# --- Chunked Export ---
+# Filtered orders, payments and influencer metrics as CSV or Parquet, produced in chunks of
+# EXPORT_CHUNK_ROWS rows so that the full file never exists in memory:
+#   - the orders and payments of the date range are read from SQLite (read_export_rows),
+#     from only the monthly partitions of raw_tracking_data the range overlaps, so a narrow
+#     range stays as fast however long the history; the other filters are applied as boolean
+#     masks over what was read (the same masks as filter_dataframes), and only the matching
+#     row positions are kept; each chunk is taken from those frames when it is written
+#   - CSV chunks are encoded rows (the header goes with the first); Parquet chunks are row
+#     groups, flushed from the writer as they are finished, with the footer in the last chunk
+# kpi_service.py streams these chunks to the client as they are produced. st.download_button
+# is no use for this: Streamlit converts whatever it is given to one bytes object in memory.
+
+EXPORT_TABLES = ['orders', 'payments', 'influencers']
+EXPORT_FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+
+def export_rows(table, performance_df, orders_df, payment_log_df, start_date, end_date, brand, product, platform):
+    """
+    The frame an export reads from and the positions of its rows matching the sidebar
+    selections, as filter_dataframes would select them: (frame, positions).
+    """
+    mask = orders_mask(orders_df, start_date, end_date, brand, product, platform).to_numpy()
+    if table == 'orders':
+        return orders_df, np.flatnonzero(mask)
+    influencer_keys = orders_df['influencer_key'].to_numpy()[mask]
+    influencer_keys = np.unique(influencer_keys[~np.isnan(influencer_keys)])
+    if table == 'payments':
+        return payment_log_df, np.flatnonzero(payments_mask(payment_log_df, start_date, end_date, influencer_keys).to_numpy())
+    if table == 'influencers':
+        return performance_df, np.flatnonzero(performance_df['influencer_key'].isin(influencer_keys).to_numpy())
+    raise ValueError(f"Unknown export table {table!r}; expected one of {', '.join(EXPORT_TABLES)}")
+
+
+def read_export_rows(conn, table, performance_df, start_date, end_date, brand, product, platform):
+    """
+    export_rows for the marts in SQLite on conn: the orders (and, for the payments export,
+    the payments) dated within the range are read from the partitions it overlaps, instead
+    of masking the full frames. performance_df is the influencer_performance mart, which
+    has no dates.
+    """
+    orders_df = read_mart_range(conn, 'enriched_orders', start_date, end_date)
+    payment_log_df = read_mart_range(conn, 'payments_log', start_date, end_date) if table == 'payments' else None
+    return export_rows(table, performance_df, orders_df, payment_log_df, start_date, end_date, brand, product, platform)
+
+
+def iter_chunks(frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """The rows of frame at positions, as frames of at most chunk_rows rows."""
+    for start in range(0, len(positions), chunk_rows):
+        yield frame.take(positions[start:start + chunk_rows])
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that keeps what was written until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_csv(frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yields the rows of frame at positions as UTF-8 CSV, one bytes object per chunk."""
+    if len(positions) == 0:
+        yield frame.iloc[:0].to_csv(index=False).encode('utf-8')
+        return
+    for number, chunk in enumerate(iter_chunks(frame, positions, chunk_rows)):
+        yield chunk.to_csv(index=False, header=number == 0).encode('utf-8')
+
+
+def iter_parquet(frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yields the rows of frame at positions as a Parquet file, one row group per chunk."""
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, to_arrow(frame.iloc[:0]).schema)
+    try:
+        for chunk in iter_chunks(frame, positions, chunk_rows):
+            writer.write_table(to_arrow(chunk))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(file_format, frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yields an export in the given format ('csv' or 'parquet') chunk by chunk."""
+    if file_format == 'csv':
+        return iter_csv(frame, positions, chunk_rows)
+    if file_format == 'parquet':
+        return iter_parquet(frame, positions, chunk_rows)
+    raise ValueError(f"Unknown export format {file_format!r}; expected one of {', '.join(EXPORT_FORMATS)}")
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from utils.rankings import row_positions
+
+# --- Paginated Influencer Metrics Table ---
+# Sorting, searching and page slicing for the Detailed Influencer Metrics table
+# run on the server, so only the visible page is sent to the browser:
+#   - every sortable column is ordered once at load time
+#   - a sorted page for a filtered subset is a masked walk down that ordering
+#   - search is a case-insensitive substring match on the influencer name
+
+# Columns of influencer_performance the table can be sorted by (text columns sort alphabetically)
+TABLE_SORT_COLUMNS = [
+    'Influencer', 'Payout Type', 'Posts', 'Reach', 'Likes', 'Comments', 'Engagement Rate',
+    'Orders', 'Revenue', 'Payout', 'Net Profit'
+]
+TEXT_COLUMNS = ['Influencer', 'Payout Type']
+
+
+class InfluencerTable:
+    """
+    Sorted orderings of the influencer performance table for server-side paging.
+
+    Rows are identified by the performance frame's index labels, like the
+    leaderboard, so the index of a filtered copy selects the table's rows.
+    """
+
+    def __init__(self, performance_df, sort_columns=TABLE_SORT_COLUMNS):
+        self.frame = performance_df
+        self.search_keys = performance_df['Influencer'].fillna('').astype(str).str.lower().to_numpy(dtype=object)
+        self.orderings = {}
+        for column in sort_columns:
+            if column not in performance_df.columns:
+                continue
+            if column in TEXT_COLUMNS:
+                values = performance_df[column].fillna('').astype(str).str.lower().to_numpy(dtype=object)
+                valid = len(values)
+            else:
+                values = pd.to_numeric(performance_df[column], errors='coerce').to_numpy(dtype=np.float64)
+                valid = len(values) - int(np.isnan(values).sum())
+            # Missing numbers sort last in both directions, as in pandas.
+            self.orderings[column] = (np.argsort(values, kind='stable'), valid)
+
+    def _ordering(self, column, descending):
+        order, valid = self.orderings[column]
+        if not descending:
+            return order
+        return np.concatenate([order[:valid][::-1], order[valid:]])
+
+    def page(self, rows=None, sort_column=None, descending=False, search='', page_number=1, page_size=25):
+        """
+        Returns (page_df, total_rows, page_number): one page of the performance frame
+        restricted to rows (index labels), matching the search text and sorted by
+        sort_column. With no sort column the frame's own order is kept. A page number
+        past the end returns the last page. page_df is a new frame.
+        """
+        member = np.zeros(len(self.frame), dtype=bool)
+        if rows is None:
+            member[:] = True
+        else:
+            member[row_positions(self.frame.index, rows)] = True
+
+        search = search.strip().lower()
+        if search:
+            candidates = np.flatnonzero(member)
+            matches = pd.Series(self.search_keys[candidates]).str.contains(search, regex=False).to_numpy()
+            member[candidates[~matches]] = False
+
+        if sort_column is None:
+            positions = np.flatnonzero(member)
+        else:
+            order = self._ordering(sort_column, descending)
+            positions = order[member[order]]
+
+        page_count = max(-(-len(positions) // page_size), 1)
+        page_number = min(max(page_number, 1), page_count)
+        start = (page_number - 1) * page_size
+        return self.frame.iloc[positions[start:start + page_size]].copy(), len(positions), page_number
@@ -0,0 +1,419 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from constants import PERF_LOG_ENABLED, PERF_LOG_MAX_BYTES, PERF_LOG_PATH, ROOT_DIR, MEMORY_PROFILE_FRAMES, MEMORY_PROFILE_TOP_ALLOCATIONS, MEMORY_PROFILE_MIN_BLOCK
+
+# --- Rerun Instrumentation ---
+# Lightweight timing of the dashboard's steps (data loading, filtering, KPIs and
+# every render_* function). Each step records:
+#   - wall_ms: wall time of the step, including nested steps
+#   - rows_in: total rows of the DataFrames it was given
+#   - bytes_out: bytes of the messages it sent to the browser (render steps) or
+#     the in-memory size of the DataFrames it returned (data steps)
+# Records of the current run are kept in session state for the sidebar panel and, with
+# DASHBOARD_PERF_LOG=1, appended to a JSON-lines log (PERF_LOG_PATH, rotated at
+# PERF_LOG_MAX_BYTES) for aggregation across sessions.
+#
+# Memory profiling mode (tracemalloc, meant for local profiling) adds to every step of the
+# sessions that turned it on:
+#   - resident_bytes: traced memory still held when the step ends (its net growth)
+#   - peak_bytes: highest traced memory during the step, above the level at its start
+#   - pandas_bytes: deep pandas memory usage of the frames a data step produced
+#   - top_allocations: the project source lines whose large blocks (array buffers,
+#     copies) grew the most during the step
+# tracemalloc is process-wide: it runs while at least one session profiles (so every
+# session's reruns are traced, and slower, meanwhile) and stops with the last one.
+
+_log_lock = threading.Lock()
+# Steps currently open in this thread (fragments run in the script thread)
+_local = threading.local()
+_PROJECT_PREFIX = str(ROOT_DIR)
+# Process-wide cache counters: name -> [lookups, misses]
+_cache_lock = threading.Lock()
+_cache_counts = defaultdict(lambda: [0, 0])
+# Sessions with memory profiling on; tracemalloc runs while there is any
+_profiling_lock = threading.Lock()
+_profiling_sessions = set()
+
+
+def _frames(values):
+    """Yields the DataFrames among values (and inside tuples, lists and dicts one level deep)."""
+    for value in values:
+        if isinstance(value, pd.DataFrame):
+            yield value
+        elif isinstance(value, (tuple, list)):
+            yield from (item for item in value if isinstance(item, pd.DataFrame))
+        elif isinstance(value, dict):
+            yield from (item for item in value.values() if isinstance(item, pd.DataFrame))
+
+
+def count_rows(*values):
+    """Total rows of the DataFrames among values."""
+    return sum(len(frame) for frame in _frames(values))
+
+
+def frame_bytes(*values, deep=False):
+    """In-memory size of the DataFrames among values; deep=True also counts the contents of object columns."""
+    return int(sum(frame.memory_usage(index=True, deep=deep).sum() for frame in _frames(values)))
+
+
+def _state_frames(value, seen):
+    """Yields the DataFrames reachable from a session state value (through dicts, lists and tuples), once each."""
+    if id(value) in seen:
+        return
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _state_frames(item, seen)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _state_frames(item, seen)
+
+
+def _buffer_addresses(series):
+    """Addresses of the memory buffers behind a column (its Arrow buffers, or its numpy data pointer)."""
+    array = series.array
+    if hasattr(array, "__arrow_array__"):
+        arrow_array = array.__arrow_array__()
+        chunks = getattr(arrow_array, "chunks", [arrow_array])
+        return frozenset(buffer.address for chunk in chunks for buffer in chunk.buffers() if buffer is not None and buffer.size)
+    values = np.asarray(array)
+    return frozenset([values.__array_interface__["data"][0]]) if values.size else frozenset()
+
+
+def session_memory(shared_frames=()):
+    """
+    Returns (frame count, bytes) of the DataFrames held in this session's state: the
+    filtered slices and section results each session adds on top of the shared frames.
+    Columns that still use the shared frames' buffers (copy-on-write views) are not counted.
+    """
+    shared = set()
+    for frame in shared_frames:
+        for position in range(frame.shape[1]):
+            shared |= _buffer_addresses(frame.iloc[:, position])
+
+    seen = set()
+    frames = [frame for key in list(st.session_state.keys()) for frame in _state_frames(st.session_state[key], seen)]
+    total = 0
+    for frame in frames:
+        total += int(frame.index.memory_usage(deep=True))
+        for position in range(frame.shape[1]):
+            column = frame.iloc[:, position]
+            addresses = _buffer_addresses(column)
+            if not addresses or not addresses <= shared:
+                total += int(column.memory_usage(index=False, deep=True))
+    return len(frames), total
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def set_memory_profiling(enabled):
+    """
+    Turns memory profiling on or off for the current session. tracemalloc starts with the
+    first profiling session and stops once no session profiles any more (sessions that have
+    closed are dropped), so it never stops in the middle of another session's steps.
+    """
+    session_id = _session_id()
+    with _profiling_lock:
+        if enabled:
+            _profiling_sessions.add(session_id)
+        else:
+            _profiling_sessions.discard(session_id)
+        if runtime.exists():
+            instance = runtime.get_instance()
+            _profiling_sessions.difference_update(
+                [other for other in _profiling_sessions if other is not None and not instance.is_active_session(other)]
+            )
+        if _profiling_sessions and not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_PROFILE_FRAMES)
+        elif not _profiling_sessions and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def _session_profiling():
+    """Whether the current session's steps are profiled."""
+    return tracemalloc.is_tracing() and _session_id() in _profiling_sessions
+
+
+def _short_path(filename):
+    """Shows project files relative to the project root and library files from their package."""
+    path = Path(filename)
+    try:
+        return path.resolve().relative_to(ROOT_DIR).as_posix()
+    except ValueError:
+        return "/".join(path.parts[-2:])
+
+
+def _project_frame(traceback):
+    """Innermost (filename, lineno) of a traceback that lies in the project (outside installed packages), or None."""
+    for frame in reversed(traceback): # Oldest frame first
+        if frame.filename.startswith(_PROJECT_PREFIX) and "site-packages" not in frame.filename:
+            return frame.filename, frame.lineno
+    return None
+
+
+def _allocation_sites():
+    """
+    Bytes and blocks currently allocated per project source line, for blocks of at least
+    MEMORY_PROFILE_MIN_BLOCK bytes (array buffers, i.e. where frame copies show up).
+    """
+    sites = defaultdict(lambda: [0, 0])
+    # The size is checked before anything else: Snapshot.filter_traces() matches every trace
+    # in Python (over 10x slower per rerun here), while few traces are large blocks.
+    for trace in tracemalloc.take_snapshot().traces:
+        if trace.size >= MEMORY_PROFILE_MIN_BLOCK:
+            site = _project_frame(trace.traceback)
+            if site is not None:
+                sites[site][0] += trace.size
+                sites[site][1] += 1
+    return sites
+
+
+def _top_allocations(before, after, limit=MEMORY_PROFILE_TOP_ALLOCATIONS):
+    """Source lines whose large allocations grew the most between two _allocation_sites() results."""
+    growth = []
+    for site, (size, count) in after.items():
+        previous_size, previous_count = before.get(site, (0, 0))
+        if size > previous_size:
+            growth.append((size - previous_size, count - previous_count, site))
+    growth.sort(reverse=True)
+    return [
+        {"line": f"{_short_path(filename)}:{lineno}", "bytes": size, "blocks": count}
+        for size, count, (filename, lineno) in growth[:limit]
+    ]
+
+
+def count_cache_lookup(name, miss=False):
+    """Counts one lookup in a named cache (chart payloads, section results, ...), and whether it missed."""
+    with _cache_lock:
+        counts = _cache_counts[name]
+        counts[0] += 1
+        counts[1] += int(miss)
+
+
+def count_cache_miss(name):
+    """Marks the latest lookup in a named cache as a miss (for caches that only know inside the cached function)."""
+    with _cache_lock:
+        _cache_counts[name][1] += 1
+
+
+def cache_stats():
+    """Returns {cache name: {'lookups', 'hits', 'hit_rate'}} of this process."""
+    with _cache_lock:
+        counts = {name: tuple(values) for name, values in _cache_counts.items()}
+    return {
+        name: {"lookups": lookups, "hits": lookups - misses, "hit_rate": round((lookups - misses) / lookups, 4) if lookups else None}
+        for name, (lookups, misses) in counts.items()
+    }
+
+
+def start_run():
+    """Starts a new set of records; called once at the top of every full script run."""
+    st.session_state["_perf_run_id"] = uuid.uuid4().hex[:12]
+    st.session_state["_perf_records"] = []
+
+
+def run_records():
+    """Returns the records of the latest full run (plus any fragment reruns since)."""
+    return st.session_state.get("_perf_records", [])
+
+
+def _write_log(record):
+    PERF_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with _log_lock:
+        with open(PERF_LOG_PATH, "a", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(record) + "\n")
+            full = log_file.tell() >= PERF_LOG_MAX_BYTES
+        if full: # One previous log is kept
+            os.replace(PERF_LOG_PATH, PERF_LOG_PATH.with_name(PERF_LOG_PATH.name + ".1"))
+
+
+class _Step:
+    """Mutable record of one step; data steps report their output frames with produced()."""
+
+    def __init__(self, component, rows_in):
+        self.component = component
+        self.rows_in = rows_in
+        self.bytes_out = 0
+        self.frames = ()
+        # Memory profiling state
+        self.sites = None
+        self.start_memory = 0
+        self.peak_memory = 0
+
+    def produced(self, *frames):
+        """Records the frames a data step returns; their deep usage is measured after the memory window."""
+        self.bytes_out += frame_bytes(*frames)
+        self.frames += frames
+
+    def start_memory_window(self, parent):
+        """Records the allocation sites and starts a fresh peak for this step (the parent keeps its peak so far)."""
+        self.sites = _allocation_sites()
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent.peak_memory = max(parent.peak_memory, peak)
+        tracemalloc.reset_peak()
+        self.start_memory = self.peak_memory = current
+
+    def end_memory_window(self, parent, record):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_memory = max(self.peak_memory, peak)
+        after = _allocation_sites()
+        record["resident_bytes"] = current - self.start_memory
+        record["peak_bytes"] = self.peak_memory - self.start_memory
+        record["top_allocations"] = _top_allocations(self.sites, after)
+        self.sites = None
+        if parent is not None:
+            tracemalloc.reset_peak()
+            parent.peak_memory = max(parent.peak_memory, self.peak_memory)
+
+
+@contextmanager
+def track(component, rows_in=0):
+    """
+    Times the enclosed block as one step. Bytes sent to the browser inside the
+    block are counted; data steps report their output with step.produced(frames).
+    While memory profiling is on, the step's memory window is measured as well.
+    """
+    step = _Step(component, rows_in)
+    ctx = get_script_run_ctx()
+    stack = _local.__dict__.setdefault("stack", [])
+    parent = stack[-1] if stack else None
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "session_id": ctx.session_id if ctx is not None else None,
+        "run_id": st.session_state.get("_perf_run_id") if ctx is not None else None,
+        "component": component,
+        "parent": parent.component if parent is not None else None,
+        "depth": len(stack),
+    }
+    # Added on entry, so a parent is listed before its children
+    if ctx is not None:
+        st.session_state.setdefault("_perf_records", []).append(record)
+
+    # Count the bytes of every message this step enqueues for the browser.
+    # Nested steps wrap the enqueue of their parent, so a parent's count includes its children.
+    if ctx is not None:
+        enqueue = ctx.enqueue
+
+        def counting_enqueue(msg):
+            step.bytes_out += msg.ByteSize()
+            enqueue(msg)
+
+        ctx.enqueue = counting_enqueue
+
+    profiling = _session_profiling()
+    if profiling:
+        step.start_memory_window(parent)
+    stack.append(step)
+    started = time.perf_counter()
+    try:
+        yield step
+    finally:
+        record["wall_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        record["rows_in"] = int(step.rows_in)
+        record["bytes_out"] = int(step.bytes_out)
+        stack.pop()
+        if profiling and tracemalloc.is_tracing():
+            step.end_memory_window(parent, record)
+            record["pandas_bytes"] = frame_bytes(*step.frames, deep=True) if step.frames else None
+        step.frames = ()
+        if ctx is not None:
+            ctx.enqueue = enqueue
+        if PERF_LOG_ENABLED:
+            _write_log(record)
+
+
+def timed(component=None):
+    """
+    Decorator form of track(). rows_in counts the DataFrames passed to the function;
+    any DataFrames it returns are recorded with step.produced().
+    """
+    def decorator(func):
+        name = component or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(name, rows_in=count_rows(*args, *kwargs.values())) as step:
+                result = func(*args, **kwargs)
+                step.produced(result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def render_performance_panel(shared_frames=()):
+    """
+    Renders the latest run's records as a table in the sidebar (with memory columns while profiling),
+    and the memory this session holds next to the process-wide shared frames.
+    """
+    records = run_records()
+    with st.sidebar.expander("Performance", expanded=True):
+        frame_count, session_bytes = session_memory(shared_frames)
+        st.caption(
+            f"Session state: {frame_count} frames, {session_bytes / 2**20:,.1f} MB "
+            f"(shared by all sessions: {frame_bytes(*shared_frames, deep=True) / 2**20:,.1f} MB)"
+        )
+        if not records:
+            st.caption("No timings recorded yet.")
+            return
+        panel_df = pd.DataFrame(records)
+        # Indent nested steps with em spaces, which the table does not collapse
+        panel_df["component"] = ["\u2003" * depth + name for depth, name in zip(panel_df["depth"], panel_df["component"])]
+        top_level_ms = panel_df.loc[panel_df["depth"] == 0, "wall_ms"].sum()
+        st.caption(f"Run {records[0]['run_id']}: {top_level_ms:,.1f} ms across top-level steps")
+
+        columns = ["component", "wall_ms", "rows_in", "bytes_out"]
+        column_config = {
+            "component": st.column_config.TextColumn("Step"),
+            "wall_ms": st.column_config.NumberColumn("Wall (ms)", format="%.1f"),
+            "rows_in": st.column_config.NumberColumn("Rows In", format="%d"),
+            "bytes_out": st.column_config.NumberColumn("Bytes Out", format="%d"),
+        }
+        profiled = "peak_bytes" in panel_df.columns
+        if profiled:
+            for column, label in [("resident_bytes", "Resident (MB)"), ("peak_bytes", "Peak (MB)"), ("pandas_bytes", "Pandas (MB)")]:
+                panel_df[column] = panel_df[column] / 2**20
+                column_config[column] = st.column_config.NumberColumn(label, format="%.2f")
+            columns += ["resident_bytes", "peak_bytes", "pandas_bytes"]
+        st.dataframe(panel_df[columns], use_container_width=True, hide_index=True, column_config=column_config)
+
+        if profiled:
+            allocations_df = pd.DataFrame([
+                {"step": record["component"], "line": allocation["line"], "mb": allocation["bytes"] / 2**20}
+                for record in records for allocation in record.get("top_allocations") or []
+            ])
+            if not allocations_df.empty:
+                st.caption("Largest allocations per step")
+                st.dataframe(
+                    allocations_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "step": st.column_config.TextColumn("Step"),
+                        "line": st.column_config.TextColumn("Allocated At"),
+                        "mb": st.column_config.NumberColumn("MB", format="%.2f"),
+                    }
+                )
@@ -0,0 +1,129 @@
+import pandas as pd
+
+from constants import PROFIT_MARGIN_FACTOR
+from utils.time_index import ORGANIC_PLATFORM
+
+# --- KPIs and Breakdowns ---
+# The numbers of the Overview tab and the revenue breakdowns, computed from the filtered
+# frames and the time index. The dashboard and the KPI service (kpi_service.py) both call
+# these, so the two always report the same values for the same filters.
+
+BREAKDOWN_DIMENSIONS = ['brand', 'product', 'campaign']
+
+
+def overview_kpis(time_index, filtered_orders_df, selection, sketches=None):
+    """
+    Returns the Overview KPIs (kpis_for_overview) for a sidebar selection: the dict with
+    start_date, end_date, brand, product, platform and influencer_keys. Distinct counts are
+    exact scans of the filtered orders, or merged daily HyperLogLog sketches with sketches
+    (approximate mode, where filtered_orders_df may be None: the orders are not filtered);
+    each comes with the half-width of its 95% confidence interval (None when exact).
+    """
+    start_date, end_date = selection['start_date'], selection['end_date']
+    brand, product, platform = selection['brand'], selection['product'], selection['platform']
+
+    # Date-range sums come from the prefix-sum time index (two binary searches and a
+    # subtraction per cell) instead of re-summing the filtered rows.
+    order_kpis = time_index.order_kpis(start_date, end_date, brand, product, platform)
+    total_revenue = order_kpis['revenue']
+    total_payout = time_index.total_payout(start_date, end_date, selection['influencer_keys'])
+    net_profit = (total_revenue * PROFIT_MARGIN_FACTOR) - total_payout
+
+    # Calculate Baseline Revenue (Organic Sales) - Corrected Logic
+    baseline_revenue = order_kpis['revenue'] - order_kpis['influenced_revenue']
+
+    # Calculate Influencer-Driven Revenue - Corrected Logic
+    influencer_driven_revenue = order_kpis['influenced_revenue']
+
+    # Calculate Incremental ROAS
+    incremental_roas = influencer_driven_revenue / total_payout if total_payout > 0 else 0
+
+    # Calculate new KPIs
+    roi = (net_profit / total_payout) * 100 if total_payout > 0 else 0
+    total_orders = order_kpis['orders']
+
+    # Orders by Attribution Type
+    influenced_orders_count = order_kpis['influenced_orders']
+    organic_orders_count = order_kpis['orders'] - order_kpis['influenced_orders'] # attribution_type != 'Influenced'
+
+    distinct_counts = {}
+    if sketches is not None:
+        for name, column in [('num_campaigns', 'campaign'), ('active_influencers', 'influencer_key'), ('unique_customers', 'user_key')]:
+            estimate, ci = sketches.distinct(column, start_date, end_date, brand, product, platform)
+            distinct_counts[name] = int(round(estimate)) if estimate is not None else None
+            distinct_counts[name + '_ci'] = ci
+    else:
+        distinct_counts['num_campaigns'] = filtered_orders_df['campaign'].dropna().nunique()
+
+    return {
+        "total_revenue": total_revenue,
+        "total_payout": total_payout,
+        "net_profit": net_profit,
+        "baseline_revenue": baseline_revenue,
+        "influencer_driven_revenue": influencer_driven_revenue,
+        "incremental_roas": incremental_roas,
+        "roi": roi,
+        "num_campaigns": distinct_counts['num_campaigns'],
+        "num_campaigns_ci": distinct_counts.get('num_campaigns_ci'),
+        "active_influencers": distinct_counts.get('active_influencers'),
+        "active_influencers_ci": distinct_counts.get('active_influencers_ci'),
+        "unique_customers": distinct_counts.get('unique_customers'),
+        "unique_customers_ci": distinct_counts.get('unique_customers_ci'),
+        "total_orders": total_orders,
+        "influenced_orders_count": influenced_orders_count,
+        "organic_orders_count": organic_orders_count,
+        "overall_net_profit_percentage": (net_profit / total_revenue) if total_revenue > 0 else 0
+    }
+
+
+def revenue_by_cells(time_index, selection, dimension):
+    """
+    Revenue per brand, product or platform (every combination, for a list of dimensions)
+    over a sidebar selection, from the time index's cells instead of the filtered orders,
+    which approximate mode does not build. Exact; values without orders in the selection
+    are left out, and missing platforms are 'Organic Sales', as grouped from the orders.
+    """
+    selected = (selection['start_date'], selection['end_date'], selection['brand'], selection['product'], selection['platform'])
+    revenue = time_index.range_sum_by(dimension, 'revenue', *selected)
+    revenue = revenue[time_index.range_sum_by(dimension, 'orders', *selected) > 0].rename('revenue_generated')
+    if 'platform' in revenue.index.names:
+        revenue = revenue.rename({ORGANIC_PLATFORM: 'Organic Sales'}, level='platform')
+    return revenue
+
+
+def breakdown(filtered_orders_df, dimension, overall_net_profit_percentage):
+    """
+    Revenue, number of orders and net profit per brand, product or campaign, highest revenue
+    first, as in the Detailed Analysis tables (orders without a campaign are 'No Campaign').
+    """
+    values = filtered_orders_df[dimension]
+    if dimension == 'campaign':
+        values = values.fillna('No Campaign')
+    grouped = filtered_orders_df.groupby(values.rename(dimension))['revenue_generated'].agg(['sum', 'size'])
+    table = pd.DataFrame({
+        dimension: grouped.index,
+        'revenue': grouped['sum'].to_numpy(),
+        'orders': grouped['size'].to_numpy(),
+    })
+    table['net_profit'] = table['revenue'] * overall_net_profit_percentage
+    return table.sort_values('revenue', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def influencer_breakdown(filtered_orders_df, filtered_payment_log_df):
+    """
+    Revenue, orders, payout, net profit and ROAS per influencer over the filtered orders and
+    payments, highest revenue first. Organic orders (no influencer) are left out.
+    """
+    attributed = filtered_orders_df[filtered_orders_df['influencer_key'].notna()]
+    keys = attributed['influencer_key'].astype('int64')
+    orders = attributed.groupby(keys).agg(
+        name=('name', 'first'),
+        revenue=('revenue_generated', 'sum'),
+        orders=('revenue_generated', 'size'),
+    )
+    payout = filtered_payment_log_df.groupby('influencer_key')['payment_amount'].sum()
+    table = orders.join(payout.rename('payout'), how='left').fillna({'payout': 0})
+    table['net_profit'] = table['revenue'] * PROFIT_MARGIN_FACTOR - table['payout']
+    table['roas'] = (table['revenue'] / table['payout']).where(table['payout'] > 0)
+    table.index.name = 'influencer_key'
+    return table.sort_values('revenue', ascending=False, kind='stable').reset_index()
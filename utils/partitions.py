@@ -0,0 +1,391 @@
+import sqlite3
+from contextlib import closing
+
+from constants import (COMMISSION_RATE, COST_OF_GOODS_PERCENTAGE, PARTITION_ARCHIVE_DIR, PAYOUT_SEGMENTATION_THRESHOLD,
+                       POST_PAYOUT_BASE_MULTIPLIER, POST_PAYOUT_PROGRESSIVE_INCREMENT, POST_PAYOUT_TIER_SIZE)
+
+# --- Monthly Partitions of raw_tracking_data ---
+# raw_tracking_data is the landing table: every loader writes to it (generate_data.py,
+# import_csv.py, the refresh scheduler's appends) and rows are keyed there. Once a month is
+# closed (an order of a later month has arrived), partition_tracking_data moves its rows
+# into a table of their own, raw_tracking_data_YYYY_MM, so the landing table only holds the
+# current month (and rows not yet partitioned).
+#   - tracking_data_all is the UNION ALL of the landing table and the live partitions; the
+#     marts read it, so partitioning changes where rows are stored, not what the marts show
+#   - tracking_source() lists only the partitions a read needs, from the catalog: those of
+#     the months a date range overlaps (the KPI service's exports of a date range, see
+#     mart_query) and those that can hold orders above an order_key (the incremental
+#     snapshot update reads the landing table and the partitions that received late rows),
+#     so these reads cost the same however long the history
+#   - the tracking_partitions catalog records each partition's rows and highest order_key
+#     (order keys keep increasing across partitions, see create_sql_marts.py)
+#   - closed months can be compacted (rewritten in date order) or archived: moved to a
+#     SQLite file of their own in PARTITION_ARCHIVE_DIR and dropped from the database, which
+#     takes their orders out of the marts until they are restored. The current month is
+#     never a partition, so none of this touches it.
+# Rows of an archived month that arrive late stay in the landing table until it is restored.
+# Dates are ISO strings ('2025-03-14'), so a month is the first seven characters.
+
+LANDING_TABLE = 'raw_tracking_data'
+UNION_VIEW = 'tracking_data_all'
+PARTITION_CATALOG_SQL = """
+CREATE TABLE IF NOT EXISTS tracking_partitions (
+    month TEXT PRIMARY KEY, -- 'YYYY-MM'
+    table_name TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    max_order_key INTEGER,
+    archive_path TEXT -- Set while the partition is archived (not in the database)
+);
+"""
+
+
+def partition_table(month):
+    """Name of the partition table of a month ('2025-03' -> 'raw_tracking_data_2025_03')."""
+    return f"{LANDING_TABLE}_{month.replace('-', '_')}"
+
+
+def table_columns(conn, table, schema='main'):
+    """(name, declared type) of each column of a table."""
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def create_partition(conn, table, columns, schema='main'):
+    """Creates an empty partition table with the given columns, unless it exists; adds any columns it lacks."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} ({', '.join(f'{name} {declared}' for name, declared in columns)})")
+    existing = {name for name, _ in table_columns(conn, table, schema)}
+    for name, declared in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {declared}")
+    if schema == 'main':
+        # Join key of the marts, like the landing table's
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_influencer_key ON {table} (influencer_key)")
+
+
+def live_partitions(conn):
+    """(month, table) of the partitions in the database, oldest first."""
+    try:
+        return conn.execute(
+            "SELECT month, table_name FROM tracking_partitions WHERE archive_path IS NULL ORDER BY month"
+        ).fetchall()
+    except sqlite3.OperationalError: # Never partitioned: no tracking_partitions table
+        return []
+
+
+def _union_sql(conn, tables):
+    columns = ', '.join(name for name, _ in table_columns(conn, LANDING_TABLE))
+    return " UNION ALL ".join(f"SELECT {columns} FROM {table}" for table in tables)
+
+
+def refresh_union_view(conn):
+    """(Re)creates tracking_data_all over the landing table and the live partitions. The caller commits."""
+    columns = table_columns(conn, LANDING_TABLE)
+    tables = [LANDING_TABLE]
+    for _, table in live_partitions(conn):
+        create_partition(conn, table, columns) # The landing table may have gained columns
+        tables.append(table)
+    conn.execute(f"DROP VIEW IF EXISTS {UNION_VIEW}")
+    conn.execute(f"CREATE VIEW {UNION_VIEW} AS {_union_sql(conn, tables)}")
+
+
+def partition_tracking_data(conn):
+    """
+    Moves the keyed rows of every month before the latest one from the landing table into
+    their partitions and refreshes tracking_data_all. Returns the rows moved per month.
+    The caller commits.
+    """
+    conn.execute(PARTITION_CATALOG_SQL)
+    columns = table_columns(conn, LANDING_TABLE)
+    column_list = ', '.join(name for name, _ in columns)
+    latest = conn.execute(f"""
+        SELECT MAX(month) FROM (
+            SELECT MAX(SUBSTR(date, 1, 7)) AS month FROM {LANDING_TABLE}
+            UNION ALL SELECT MAX(month) FROM tracking_partitions
+        )
+    """).fetchone()[0]
+    archived = {row[0] for row in conn.execute("SELECT month FROM tracking_partitions WHERE archive_path IS NOT NULL")}
+    closed = conn.execute(f"""
+        SELECT SUBSTR(date, 1, 7) AS month, COUNT(*), MAX(order_key) FROM {LANDING_TABLE}
+        WHERE SUBSTR(date, 1, 7) < ? AND order_key IS NOT NULL
+        GROUP BY month ORDER BY month
+    """, (latest,)).fetchall() if latest else []
+
+    moved = {}
+    for month, rows, max_order_key in closed:
+        if month in archived:
+            continue
+        table = partition_table(month)
+        create_partition(conn, table, columns)
+        month_filter = "WHERE SUBSTR(date, 1, 7) = ? AND order_key IS NOT NULL"
+        conn.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {LANDING_TABLE} {month_filter}", (month,))
+        conn.execute(f"DELETE FROM {LANDING_TABLE} {month_filter}", (month,))
+        conn.execute("""
+            INSERT INTO tracking_partitions (month, table_name, row_count, max_order_key) VALUES (?, ?, ?, ?)
+            ON CONFLICT (month) DO UPDATE SET
+                row_count = row_count + excluded.row_count,
+                max_order_key = MAX(COALESCE(max_order_key, 0), excluded.max_order_key)
+        """, (month, table, rows, max_order_key))
+        moved[month] = rows
+    refresh_union_view(conn)
+    return moved
+
+
+def tracking_source(conn, start_date=None, end_date=None, after_order_key=None):
+    """
+    FROM-clause source holding the tracking rows of [start_date, end_date] (ISO dates or
+    date objects, None for an open end) with an order_key above after_order_key (None for
+    any): the landing table and only the live partitions whose month is in the range and
+    whose highest order_key is above it, per the catalog. Rows outside these bounds may be
+    included; the caller filters.
+    """
+    conditions = ["archive_path IS NULL"]
+    params = []
+    if start_date is not None:
+        conditions.append("month >= ?")
+        params.append(str(start_date)[:7])
+    if end_date is not None:
+        conditions.append("month <= ?")
+        params.append(str(end_date)[:7])
+    if after_order_key is not None:
+        conditions.append("max_order_key > ?")
+        params.append(after_order_key)
+    try:
+        tables = [row[0] for row in conn.execute(
+            f"SELECT table_name FROM tracking_partitions WHERE {' AND '.join(conditions)} ORDER BY month", params
+        )]
+    except sqlite3.OperationalError: # Never partitioned: no tracking_partitions table
+        tables = []
+    if not tables:
+        return LANDING_TABLE
+    return f"({_union_sql(conn, [LANDING_TABLE] + tables)})"
+
+
+# --- Mart Queries ---
+# The SELECTs behind the payments_log and enriched_orders views (create_sql_marts.py creates
+# them). {tracking} is the source of the tracking rows: tracking_data_all (every partition)
+# in the views, or only the partitions a read needs in mart_query() (a date range) and
+# new_orders_query() (the orders appended since a snapshot).
+PAYMENTS_LOG_SQL = f"""
+    -- Part 1: Calculate Payments for 'Post'-based Influencers
+    -- This section processes posts made by influencers whose payout_basis is 'Post'.
+    -- Each post from such an influencer generates a payment.
+    SELECT
+        -- Each post-based payment is identified by its post_key.
+        P.influencer_key,
+        I.payout_basis AS payment_basis, -- This will be 'Post'
+        P.post_key,
+        P.platform AS source, -- The platform where the post was made is considered the source.
+        P.date AS invoice_date, -- The date of the post is the invoice date.
+        -- Calculate payment_amount for Post-based influencers:
+        -- ROUND(follower_count * (BASE_MULTIPLIER + (tiers_above_base * PROGRESSIVE_INCREMENT)), 2)
+        -- Note: SQLite's math functions are basic. CAST(... AS REAL) for float division.
+        -- MAX(0, ...) is used to ensure 'tiers_above_base' is not negative.
+        ROUND(
+            I.follower_count * (
+                {POST_PAYOUT_BASE_MULTIPLIER} +
+                -- Calculate 'tiers_above_base': (follower_count - THRESHOLD) / TIER_SIZE
+                MAX(0, CAST((I.follower_count - {PAYOUT_SEGMENTATION_THRESHOLD}) AS REAL) / {POST_PAYOUT_TIER_SIZE}) * {POST_PAYOUT_PROGRESSIVE_INCREMENT}
+            ), 2
+        ) AS payment_amount
+    FROM
+        raw_posts AS P -- Start with the raw_posts table
+    JOIN
+        raw_influencers AS I ON P.influencer_key = I.influencer_key -- Join to get influencer details (like payout_basis, follower_count)
+    WHERE
+        I.payout_basis = 'Post' -- Filter only for influencers whose payout basis is 'Post'
+        -- This SQL reflects the rule: payments are generated for ALL posts by 'Post'-based influencers,
+        -- regardless of whether the post has a 'brand' associated with it.
+    
+    UNION ALL -- Combine the results of 'Post'-based payments with 'Order'-based payments
+    
+    -- Part 2: Calculate Payments for 'Order'-based Influencers
+    -- This section processes tracking data for 'Influenced' orders by 'Order'-based influencers.
+    -- Each such order generates a payment.
+    SELECT
+        -- Each order-based payment is one tracking record (one order).
+        T.influencer_key,
+        I.payout_basis AS payment_basis, -- This will be 'Order'
+        -- post_key was resolved from the 'source' column when the keys were assigned
+        -- (e.g., 'trk_inf_001_post_002' -> the key of 'post_002').
+        T.post_key,
+        T.source, -- Original source from tracking_data (e.g., tracking link or 'organic').
+        T.date AS invoice_date, -- The order date is the invoice date.
+        -- Calculate payment_amount for Order-based influencers: ROUND(revenue * COMMISSION_RATE, 2)
+        ROUND(T.revenue * {COMMISSION_RATE}, 2) AS payment_amount
+    FROM
+        {{tracking}} AS T -- Start with the raw_tracking_data table (orders)
+    JOIN
+        raw_influencers AS I ON T.influencer_key = I.influencer_key -- Join to get influencer details (like payout_basis)
+    WHERE
+        T.attribution_type = 'Influenced' AND I.payout_basis = 'Order' -- Filter for 'Influenced' orders and 'Order'-based influencers
+"""
+ENRICHED_ORDERS_SQL = f"""
+    SELECT
+        T1.order_key, -- Appended orders get higher keys (incremental snapshots, see utils/snapshot.py)
+        T1.campaign,
+        T1.influencer_key,
+        T1.user_key, -- Exposed for distinct-customer counts (approximate mode sketches)
+        T1.product,
+        T1.date AS order_date, -- Renamed from 'date' in raw_tracking_data
+        T1.orders,
+        COALESCE(T1.revenue, 0) AS revenue_generated, -- Renamed from 'revenue' in raw_tracking_data
+        CAST(COALESCE(T1.revenue, 0) * {COST_OF_GOODS_PERCENTAGE} AS INTEGER) AS cost_of_goods, -- Calculated: revenue * 0.55
+        (COALESCE(T1.revenue, 0) - CAST(COALESCE(T1.revenue, 0) * {COST_OF_GOODS_PERCENTAGE} AS INTEGER)) AS gross_profit, -- Calculated: revenue - cogs
+        T1.attribution_type,
+        T1.post_key, -- Resolved from source for influenced orders, NULL for organic ones
+        P.platform AS platform, -- CORRECTED: Pulled from raw_posts (P)
+        P.date AS post_date, -- Post date from raw_posts (original 'date_y' in Python merge)
+        P.reach,
+        P.likes,
+        P.comments,
+        T1.brand AS brand, -- EXPLICIT ALIAS for brand
+        I.name AS name, -- EXPLICIT ALIAS for name
+        I.category,
+        I.gender,
+        I.follower_count,
+        I.payout_basis AS "Payout Type" -- Payout basis from raw_influencers, renamed
+    FROM
+        {{tracking}} AS T1 -- Start with raw_tracking_data (orders)
+    LEFT JOIN
+        raw_posts AS P ON T1.post_key = P.post_key
+    LEFT JOIN
+        raw_influencers AS I ON T1.influencer_key = I.influencer_key
+    ORDER BY
+        order_date ASC
+"""
+
+
+MART_DATE_COLUMNS = {'payments_log': 'invoice_date', 'enriched_orders': 'order_date'}
+
+
+def mart_query(conn, mart, start_date=None, end_date=None):
+    """
+    SQL and parameters selecting the rows of the payments_log or enriched_orders mart dated
+    within [start_date, end_date] (either may be None), reading only the monthly partitions
+    of raw_tracking_data that the range overlaps.
+    """
+    template = {'payments_log': PAYMENTS_LOG_SQL, 'enriched_orders': ENRICHED_ORDERS_SQL}[mart]
+    date_column = MART_DATE_COLUMNS[mart]
+    conditions = []
+    params = []
+    if start_date is not None:
+        conditions.append(f"{date_column} >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append(f"{date_column} <= ?")
+        params.append(str(end_date))
+    query = f"SELECT * FROM ({template.format(tracking=tracking_source(conn, start_date, end_date))})"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if mart == 'enriched_orders':
+        query += " ORDER BY order_date ASC"
+    return query, params
+
+
+def new_orders_query(conn, after_order_key):
+    """
+    SQL and parameters selecting the enriched_orders rows with an order_key above
+    after_order_key (the orders appended since a snapshot), reading the landing table and
+    only the partitions that can hold them instead of every partition.
+    """
+    tracking = tracking_source(conn, after_order_key=after_order_key)
+    query = f"SELECT * FROM ({ENRICHED_ORDERS_SQL.format(tracking=tracking)}) WHERE order_key > ? ORDER BY order_date ASC"
+    return query, (after_order_key,)
+
+
+def compact_partition(conn, month):
+    """Rewrites a partition in date order (e.g. after late rows were added to it); returns its row count. The caller commits."""
+    table = dict(live_partitions(conn)).get(month)
+    if table is None:
+        raise ValueError(f"No partition for {month} in the database.")
+    columns = ', '.join(name for name, _ in table_columns(conn, table))
+    conn.execute("DROP TABLE IF EXISTS temp.compact_rows")
+    conn.execute(f"CREATE TEMP TABLE compact_rows AS SELECT {columns} FROM {table} ORDER BY date, order_key")
+    conn.execute(f"DELETE FROM {table}")
+    conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM temp.compact_rows")
+    conn.execute("DROP TABLE temp.compact_rows")
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def archive_partition(conn, month, archive_dir=PARTITION_ARCHIVE_DIR, before_commit=None):
+    """
+    Copies a partition to archive_dir/<table>.db, then drops it from the database (its orders
+    leave the marts) and commits. before_commit(conn) runs in the dropping transaction, e.g.
+    to publish the new dataset version. Returns the archive path.
+    """
+    table = dict(live_partitions(conn)).get(month)
+    if table is None:
+        raise ValueError(f"No partition for {month} in the database.")
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{table}.db"
+    # The database is the source of truth while the partition is live: an archive left by
+    # an earlier, interrupted run is replaced
+    path.unlink(missing_ok=True)
+    conn.commit()
+    conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+    try:
+        with conn:
+            create_partition(conn, table, table_columns(conn, table), schema='archive')
+            conn.execute(f"INSERT INTO archive.{table} SELECT * FROM main.{table}")
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute("UPDATE tracking_partitions SET archive_path = ? WHERE month = ?", (str(path), month))
+        refresh_union_view(conn)
+        if before_commit:
+            before_commit(conn)
+    return path
+
+
+def restore_partition(conn, month, before_commit=None):
+    """
+    Copies an archived partition back into the database and commits; the archive file is
+    kept. before_commit(conn) runs in the restoring transaction. Returns the rows restored.
+    """
+    conn.execute(PARTITION_CATALOG_SQL)
+    found = conn.execute(
+        "SELECT table_name, archive_path FROM tracking_partitions WHERE month = ? AND archive_path IS NOT NULL", (month,)
+    ).fetchone()
+    if found is None:
+        raise ValueError(f"No archived partition for {month}.")
+    table, path = found
+    conn.commit()
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            create_partition(conn, table, table_columns(conn, table, schema='archive'))
+            rows = conn.execute(f"INSERT INTO main.{table} SELECT * FROM archive.{table}").rowcount
+            conn.execute("UPDATE tracking_partitions SET archive_path = NULL WHERE month = ?", (month,))
+            refresh_union_view(conn)
+            if before_commit:
+                before_commit(conn)
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return rows
+
+
+def drop_partitions(conn):
+    """
+    Drops every partition and the catalog (archive files are left on disk), for loaders that
+    replace raw_tracking_data with a complete history. The caller commits.
+    """
+    for _, table in live_partitions(conn):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute("DROP TABLE IF EXISTS tracking_partitions")
+    conn.execute(f"DROP VIEW IF EXISTS {UNION_VIEW}")
+
+
+def read_partition_catalog(db_path):
+    """The tracking_partitions catalog of the database at db_path (empty if never partitioned), plus the landing table's row count."""
+    with closing(sqlite3.connect(db_path)) as conn:
+        try:
+            catalog = conn.execute(
+                "SELECT month, table_name, row_count, max_order_key, archive_path FROM tracking_partitions ORDER BY month"
+            ).fetchall()
+        except sqlite3.OperationalError: # No tracking_partitions table yet
+            catalog = []
+        landing_rows = conn.execute(f"SELECT COUNT(*) FROM {LANDING_TABLE}").fetchone()[0]
+    return catalog, landing_rows
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# --- Influencer Leaderboards ---
+# Each ranking metric is sorted once at load time. Top-K / bottom-K for any
+# filtered influencer subset is then answered without sorting again:
+#   - large subsets: a partial scan down the sorted ordering that stops after K hits
+#   - small subsets: a partial selection (argpartition) over the subset's values
+# The performance frame is shared by every rerun and is never modified.
+
+RANKING_METRICS = ['Revenue', 'ROI', 'ROAS', 'Engagement Rate', 'Payout']
+
+# Subsets smaller than 1/SMALL_SUBSET_RATIO of all influencers use the partial selection.
+SMALL_SUBSET_RATIO = 8
+
+
+def row_positions(index, rows):
+    """Maps index labels of a filtered frame to row positions in the frame with this index."""
+    if isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1:
+        # Frames read from SQL: labels are already positions
+        positions = np.asarray(rows, dtype=np.int64)
+        return positions[(positions >= 0) & (positions < len(index))]
+    positions = index.get_indexer(rows)
+    return positions[positions >= 0]
+
+
+class Leaderboard:
+    """
+    Sorted per-metric orderings of the influencer performance table.
+
+    Rows are identified by the performance frame's index labels, so the index
+    of any filtered copy (e.g. from filter_dataframes) selects a subset.
+    """
+
+    def __init__(self, performance_df, metrics=RANKING_METRICS):
+        self.frame = performance_df
+        self.orderings = {}
+        for metric in metrics:
+            if metric not in performance_df.columns:
+                continue
+            values = pd.to_numeric(performance_df[metric], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+            order = np.argsort(values, kind='stable')
+            self.orderings[metric] = (values, order, values[order])
+
+    def _select(self, metric, k, rows, threshold, largest):
+        values, order, sorted_values = self.orderings[metric]
+        if largest:
+            # Values strictly above the threshold are a suffix of the ascending ordering.
+            start = 0 if threshold is None else np.searchsorted(sorted_values, threshold, side='right')
+            candidates = order[start:][::-1]
+        else:
+            stop = len(order) if threshold is None else np.searchsorted(sorted_values, threshold, side='left')
+            candidates = order[:stop]
+
+        if rows is None:
+            return candidates[:k]
+
+        positions = row_positions(self.frame.index, rows)
+        if len(positions) * SMALL_SUBSET_RATIO < len(order):
+            return self._select_from_subset(values, positions, k, threshold, largest)
+
+        member = np.zeros(len(order), dtype=bool)
+        member[positions] = True
+        # Scan the ordering in growing blocks until K members have been seen.
+        hits, found, start, block = [], 0, 0, max(4 * k, 64)
+        while found < k and start < len(candidates):
+            chunk = candidates[start:start + block]
+            chunk = chunk[member[chunk]]
+            hits.append(chunk)
+            found += len(chunk)
+            start += block
+            block *= 2
+        return np.concatenate(hits)[:k] if hits else candidates[:0]
+
+    @staticmethod
+    def _select_from_subset(values, positions, k, threshold, largest):
+        """Partial selection of the K largest/smallest values among a few rows."""
+        subset = values[positions]
+        if threshold is not None:
+            keep = subset > threshold if largest else subset < threshold
+            positions, subset = positions[keep], subset[keep]
+        keys = -subset if largest else subset
+        if len(keys) > k:
+            nearest = np.argpartition(keys, k - 1)[:k]
+            positions, keys = positions[nearest], keys[nearest]
+        return positions[np.argsort(keys, kind='stable')]
+
+    def _rows(self, metric, selected):
+        """Returns the selected rows with the metric as a clean number (a new, small frame)."""
+        ranked = self.frame.iloc[selected].copy()
+        ranked[metric] = self.orderings[metric][0][selected]
+        return ranked
+
+    def top_k(self, metric, k=10, rows=None, above=None):
+        """
+        Returns the K rows with the largest metric, in descending order.
+        rows restricts the ranking to a subset (index labels); above keeps only
+        values strictly greater than it.
+        """
+        return self._rows(metric, self._select(metric, k, rows, above, largest=True))
+
+    def bottom_k(self, metric, k=10, rows=None, below=None):
+        """
+        Returns the K rows with the smallest metric, in ascending order.
+        rows restricts the ranking to a subset (index labels); below keeps only
+        values strictly less than it.
+        """
+        return self._rows(metric, self._select(metric, k, rows, below, largest=False))
@@ -0,0 +1,37 @@
+import hashlib
+import pickle
+
+import streamlit as st
+
+from utils.instrumentation import count_cache_lookup
+
+# --- Partial Reruns ---
+# Keeps each interaction from recomputing the whole dashboard:
+#   - tabs are rendered only while open (st.tabs(..., on_change="rerun")),
+#     so a rerun computes the visible tab and nothing else
+#   - tabs and sections with their own widgets are st.fragment functions, so
+#     using those widgets reruns only that fragment
+#   - section_result() reuses a section's last result in this session while
+#     its inputs are unchanged (e.g. the filtered frames across tab switches)
+
+
+def inputs_digest(inputs):
+    """Hashes a tuple of small, picklable inputs (dates, lists, arrays) into a hex digest."""
+    return hashlib.blake2b(pickle.dumps(inputs, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16).hexdigest()
+
+
+def section_result(section, inputs, compute):
+    """
+    Returns compute(), or this session's previous result for the section if it
+    was computed from the same inputs. Only the latest result per section is kept.
+    """
+    digest = inputs_digest(inputs)
+    results = st.session_state.setdefault("_section_results", {})
+    previous = results.get(section)
+    if previous is not None and previous[0] == digest:
+        count_cache_lookup("section_results")
+        return previous[1]
+    count_cache_lookup("section_results", miss=True)
+    result = compute()
+    results[section] = (digest, result)
+    return result
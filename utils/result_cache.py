@@ -0,0 +1,197 @@
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+from constants import RESULT_CACHE_MAX_AGE_S, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_PATH
+from utils.sqlite_trace import connect
+
+# --- Persistent Result Cache ---
+# Computed aggregate results (the KPI service's JSON responses) in a sidecar SQLite file
+# next to the database, so they outlive the process: after a restart or deploy the first
+# requests are answered from disk instead of being recomputed.
+#   - results are keyed by dataset version and the digest of the normalized filters (the
+#     key of the in-memory cache); bodies are stored zlib-compressed
+#   - eviction runs after every write: entries of superseded dataset versions and entries
+#     unused for RESULT_CACHE_MAX_AGE_S go first, then the least recently used ones while
+#     the cache holds more than RESULT_CACHE_MAX_BYTES
+#   - every request for a selection is counted (path and filters as requested, without
+#     defaults), so a warm-up after a refresh can precompute the most requested ones; the
+#     counts are kept in memory and written every REQUEST_COUNT_FLUSH_S, not per request
+#   - any number of processes can share the file: it is in WAL mode, each process opens one
+#     connection (its threads take turns on it), and every change is a single statement or
+#     one IMMEDIATE transaction
+# A failing cache never fails a request: errors are reported and count as misses.
+
+RESULT_CACHE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS results (
+    dataset_version INTEGER NOT NULL,
+    digest TEXT NOT NULL, -- Digest of the path and normalized filters
+    path TEXT NOT NULL,
+    body BLOB NOT NULL, -- zlib-compressed
+    size INTEGER NOT NULL, -- Bytes stored
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (dataset_version, digest)
+);
+CREATE INDEX IF NOT EXISTS idx_results_used_at ON results (used_at);
+CREATE TABLE IF NOT EXISTS selections (
+    path TEXT NOT NULL,
+    query TEXT NOT NULL, -- Filters as requested (JSON), so they can be applied to a later version
+    requests INTEGER NOT NULL,
+    requested_at REAL NOT NULL,
+    PRIMARY KEY (path, query)
+);
+"""
+RESULT_CACHE_BUSY_TIMEOUT_S = 5 # How long a write waits for another process's
+USED_AT_RESOLUTION_S = 60 # A hit refreshes used_at at most this often (fewer writes)
+REQUEST_COUNT_FLUSH_S = 30 # Request counts are written at most this often
+
+
+class ResultCache:
+    """Sidecar SQLite cache of computed results, shared by threads and processes."""
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES, max_age_s=RESULT_CACHE_MAX_AGE_S):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.lock = threading.Lock() # Guards the connection, shared by every thread
+        self._conn = None
+        self.counts_lock = threading.Lock()
+        self.request_counts = Counter() # (path, query) -> requests not written yet
+        self.requested_at = {} # (path, query) -> time of the latest of them
+        self.flushed_at = time.monotonic()
+
+    def conn(self):
+        """The connection, opened (and the schema created) on first use. Callers hold self.lock."""
+        if self._conn is None:
+            # Autocommit: each statement is its own transaction unless one is begun explicitly
+            conn = connect(
+                self.path, label="result_cache", timeout=RESULT_CACHE_BUSY_TIMEOUT_S, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable enough for a cache
+            conn.executescript(RESULT_CACHE_SCHEMA_SQL)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Writes the pending request counts and closes the connection."""
+        self.flush()
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get(self, dataset_version, digest):
+        """The cached body of a result, or None."""
+        now = time.time()
+        try:
+            with self.lock:
+                conn = self.conn()
+                row = conn.execute(
+                    "SELECT body, used_at FROM results WHERE dataset_version = ? AND digest = ?", (dataset_version, digest)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > USED_AT_RESOLUTION_S:
+                    conn.execute("UPDATE results SET used_at = ? WHERE dataset_version = ? AND digest = ?", (now, dataset_version, digest))
+            return zlib.decompress(row[0])
+        except (sqlite3.Error, zlib.error) as e:
+            print(f"Result cache read failed: {e}")
+            return None
+
+    def put(self, dataset_version, digest, path, body):
+        """Stores a result, then evicts what no longer fits (see the notes above)."""
+        now = time.time()
+        stored = zlib.compress(body, 6)
+        try:
+            with self.lock:
+                conn = self.conn()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO results (dataset_version, digest, path, body, size, created_at, used_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (dataset_version, digest, path, stored, len(stored), now, now)
+                    )
+                    self._evict(conn, now)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"Result cache write failed: {e}")
+
+    def _evict(self, conn, now):
+        conn.execute(
+            "DELETE FROM results WHERE dataset_version < (SELECT MAX(dataset_version) FROM results) OR used_at < ?",
+            (now - self.max_age_s,)
+        )
+        # Least recently used first: drop every entry past the most recent max_bytes
+        conn.execute("""
+            DELETE FROM results WHERE rowid IN (
+                SELECT rowid FROM (SELECT rowid, SUM(size) OVER (ORDER BY used_at DESC, rowid DESC) AS kept FROM results)
+                WHERE kept > ?
+            )
+        """, (self.max_bytes,))
+        conn.execute("DELETE FROM selections WHERE requested_at < ?", (now - self.max_age_s,))
+
+    def record_request(self, path, query):
+        """Counts a request for a selection (query is the requested filters as JSON); written every REQUEST_COUNT_FLUSH_S."""
+        with self.counts_lock:
+            self.request_counts[(path, query)] += 1
+            self.requested_at[(path, query)] = time.time()
+            due = time.monotonic() - self.flushed_at >= REQUEST_COUNT_FLUSH_S
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Writes the request counts kept in memory."""
+        with self.counts_lock:
+            counts, self.request_counts = self.request_counts, Counter()
+            requested_at, self.requested_at = self.requested_at, {}
+            self.flushed_at = time.monotonic()
+        if not counts:
+            return
+        try:
+            with self.lock:
+                conn = self.conn()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany("""
+                        INSERT INTO selections (path, query, requests, requested_at) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (path, query) DO UPDATE SET
+                            requests = requests + excluded.requests,
+                            requested_at = MAX(requested_at, excluded.requested_at)
+                    """, [(path, query, count, requested_at[(path, query)]) for (path, query), count in counts.items()])
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e: # The counts only guide the warm-up: dropped, not retried
+            print(f"Result cache request count failed: {e}")
+
+    def popular_selections(self, limit):
+        """(path, query) of the most requested selections, most requested first."""
+        self.flush()
+        try:
+            with self.lock:
+                return self.conn().execute(
+                    "SELECT path, query FROM selections WHERE requested_at >= ? ORDER BY requests DESC, requested_at DESC LIMIT ?",
+                    (time.time() - self.max_age_s, limit)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Result cache read failed: {e}")
+            return []
+
+    def stats(self):
+        """Entries and bytes stored."""
+        try:
+            with self.lock:
+                entries, size = self.conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        except sqlite3.Error as e:
+            print(f"Result cache read failed: {e}")
+            return {}
+        return {"entries": entries, "bytes": size}
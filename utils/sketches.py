@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from constants import APPROX_HLL_PRECISION, APPROX_SAMPLE_FRACTION, APPROX_MIN_STRATUM_SAMPLE, APPROX_CONFIDENCE_Z
+from utils.time_index import order_cells, select_cells, to_day, to_days
+
+# --- Approximate Query Mode ---
+# Opt-in estimators for very large datasets, where exact distinct counts and
+# full scans are too slow for interactive use:
+#   - HyperLogLog sketches of campaigns, influencers and users, one per
+#     (brand, product, platform) cell and day, merged across any date range
+#   - a stratified order sample for the revenue breakdowns, with confidence
+#     intervals from the stratified variance of each group's total
+
+SKETCH_COLUMNS = ['campaign', 'influencer_key', 'user_key']
+STRATA_COLUMNS = ['brand', 'product', 'platform', 'campaign']
+
+# The register index comes from the low bits of each 64-bit hash and the rank
+# from the top 53 bits, which convert to float64 exactly.
+_RANK_BITS = 53
+
+
+def _hll_updates(values, precision):
+    """Hashes values and returns each one's register index and HyperLogLog rank."""
+    values = np.asarray(values)
+    # Integer surrogate keys hash as numbers; text values go through the object hasher
+    hashes = pd.util.hash_array(values if values.dtype.kind in 'iuf' else values.astype(object))
+    register = (hashes & np.uint64((1 << precision) - 1)).astype(np.int64)
+    word = (hashes >> np.uint64(64 - _RANK_BITS)).astype(np.float64)
+    # frexp's exponent is the bit length of the word; rank = leading zeros + 1.
+    rank = _RANK_BITS + 1 - np.frexp(word)[1]
+    return register, rank.astype(np.uint8)
+
+
+def hll_estimate(registers):
+    """Estimates the distinct count of a HyperLogLog register array."""
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = np.count_nonzero(registers == 0)
+    # Small-range correction (linear counting).
+    if raw <= 2.5 * m and zeros:
+        return m * np.log(m / zeros)
+    return raw
+
+
+class DailySketches:
+    """
+    HyperLogLog sketches of distinct campaigns, influencers and users.
+
+    One sketch is kept per (brand, product, platform) cell and day, so any
+    sidebar selection and date range is answered by taking the register-wise
+    maximum of the matching sketches.
+    """
+
+    def __init__(self, orders_df, precision=APPROX_HLL_PRECISION):
+        self.precision = precision
+        self.relative_error = 1.04 / np.sqrt(1 << precision)
+
+        cell_codes, self.cells = order_cells(orders_df)
+        days = to_days(orders_df['order_date'])
+        self.first_day = int(days.min()) if len(days) else 0
+        self.span = int(days.max()) - self.first_day + 1 if len(days) else 1
+        keys = cell_codes.astype(np.int64) * self.span + (days - self.first_day)
+
+        self.sketches = {}
+        for column in SKETCH_COLUMNS:
+            # Marts built before a column was exposed simply have no sketch for it.
+            if column not in orders_df.columns:
+                continue
+            present = orders_df[column].notna().to_numpy()
+            register, rank = _hll_updates(orders_df[column].to_numpy()[present], precision)
+            updates = pd.DataFrame({'key': keys[present], 'register': register, 'rank': rank})
+            updates = updates.groupby(['key', 'register'])['rank'].max().reset_index()
+
+            sketch_keys, positions = np.unique(updates['key'].to_numpy(), return_inverse=True)
+            registers = np.zeros((len(sketch_keys), 1 << precision), dtype=np.uint8)
+            registers[positions, updates['register'].to_numpy()] = updates['rank'].to_numpy()
+            self.sketches[column] = (sketch_keys // self.span, sketch_keys % self.span, registers)
+
+    def distinct(self, column, start_date, end_date, brand=None, product=None, platform=None):
+        """
+        Estimates the number of distinct values of a column over [start_date, end_date]
+        for the selections. Returns (estimate, half-width of the confidence interval).
+        """
+        if column not in self.sketches:
+            return None, None
+        sketch_cells, sketch_days, registers = self.sketches[column]
+        start = to_day(start_date) - self.first_day
+        end = to_day(end_date) - self.first_day
+
+        mask = np.isin(sketch_cells, select_cells(self.cells, brand, product, platform))
+        mask &= (sketch_days >= start) & (sketch_days <= end)
+        if not mask.any():
+            return 0.0, 0.0
+        estimate = hll_estimate(np.maximum.reduce(registers[mask], axis=0))
+        return estimate, APPROX_CONFIDENCE_Z * self.relative_error * estimate
+
+
+def stratified_sample(orders_df, fraction=APPROX_SAMPLE_FRACTION, min_per_stratum=APPROX_MIN_STRATUM_SAMPLE, seed=0):
+    """
+    Draws a stratified random sample of orders, stratified by brand, product,
+    platform and campaign. Each sampled row records its stratum together with the
+    stratum's population and sample sizes, so that filtered subsets of the sample
+    can be scaled back up with estimate_breakdown.
+    """
+    strata = orders_df.groupby(STRATA_COLUMNS, dropna=False, sort=False).ngroup().to_numpy()
+    sizes = np.bincount(strata)
+    targets = np.minimum(sizes, np.maximum(np.ceil(sizes * fraction), min_per_stratum)).astype(np.int64)
+
+    # Shuffle rows within each stratum and keep the first `target` rows of each.
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(strata)), strata))
+    sorted_strata = strata[order]
+    position_in_stratum = np.arange(len(order)) - np.searchsorted(sorted_strata, sorted_strata)
+    keep = np.sort(order[position_in_stratum < targets[sorted_strata]])
+
+    sample = orders_df.iloc[keep].copy()
+    sample['stratum'] = strata[keep]
+    sample['stratum_size'] = sizes[strata[keep]]
+    sample['stratum_sample_size'] = targets[strata[keep]]
+    return sample
+
+
+def estimate_breakdown(sample_df, dimension, value_column='revenue_generated'):
+    """
+    Estimates per-group totals and order counts from a (filtered) stratified sample.
+    Returns a DataFrame indexed by the dimension with the estimated total, order
+    count, and the half-widths of their confidence intervals ('<column>_ci').
+    """
+    values = sample_df[value_column].fillna(0).to_numpy(dtype=np.float64)
+    frame = pd.DataFrame({
+        'stratum': sample_df['stratum'].to_numpy(),
+        'group': sample_df[dimension].to_numpy(),
+        'total': values,
+        'total_sq': values * values,
+        'count': 1.0,
+        'N': sample_df['stratum_size'].to_numpy(dtype=np.float64),
+        'n': sample_df['stratum_sample_size'].to_numpy(dtype=np.float64),
+    })
+    per_stratum = frame.groupby(['group', 'stratum']).agg(
+        total=('total', 'sum'), total_sq=('total_sq', 'sum'), count=('count', 'sum'), N=('N', 'first'), n=('n', 'first')
+    )
+    N, n = per_stratum['N'], per_stratum['n']
+    weight = N / n
+    # Variance of a domain total within a stratum: values outside the group count as zero.
+    scale = np.where(n > 1, N * N * (1 - n / N) / (n * (n - 1)).clip(lower=1), 0)
+
+    estimates = pd.DataFrame({
+        value_column: weight * per_stratum['total'],
+        'orders': weight * per_stratum['count'],
+        value_column + '_var': scale * (per_stratum['total_sq'] - per_stratum['total'] ** 2 / n),
+        'orders_var': scale * (per_stratum['count'] - per_stratum['count'] ** 2 / n),
+    }).groupby(level='group').sum()
+
+    for column in (value_column, 'orders'):
+        estimates[column + '_ci'] = APPROX_CONFIDENCE_Z * np.sqrt(estimates.pop(column + '_var').clip(lower=0))
+    estimates.index.name = dimension
+    return estimates
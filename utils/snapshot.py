@@ -0,0 +1,217 @@
+import json
+import os
+import shutil
+from contextlib import closing
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+
+from constants import SNAPSHOT_DIR
+from utils.dataset_version import read_dataset_version
+from utils.partitions import mart_query, new_orders_query
+from utils.sqlite_trace import connect
+
+# --- Columnar Mart Snapshot ---
+# create_sql_marts.py ends by writing the loaded, typed marts to uncompressed Arrow IPC
+# files (one per mart) plus a manifest. load_all_data memory-maps them instead of querying
+# SQLite: a cold start parses nothing, and every server process maps the same files, so
+# the OS page cache holds one physical copy of the columns for all of them.
+#   - numeric and date columns map straight into pandas (zero-copy, read-only)
+#   - text columns stay Arrow strings, which pandas' str dtype wraps without copying
+#   - float NaN is stored as NaN rather than null, so float columns need no conversion
+# The manifest records the dataset version the snapshot was taken at (utils/dataset_version.py);
+# a snapshot of another version is ignored and the marts are read from SQLite. A database
+# that never published a version is compared by modification time instead: a snapshot
+# older than the database is ignored. In WAL mode a commit only touches the -wal file until
+# it is checkpointed, so the newer of the two is what counts.
+# A refresh that only appended orders updates the snapshot instead of rereading every mart
+# (update_snapshot): the orders already in the snapshot are kept and only those above its
+# highest order_key (assigned in arrival order, see create_sql_marts.py) are read from SQLite.
+
+SNAPSHOT_MARTS = ['influencer_performance', 'enriched_orders', 'payments_log']
+SNAPSHOT_FORMAT = 1
+# Raw tables whose appended rows change enriched_orders only by adding orders (raw_payouts feeds no mart)
+ORDER_APPEND_TABLES = {'raw_tracking_data', 'raw_payouts'}
+
+
+def _typed_orders(orders_df):
+    orders_df['order_date'] = pd.to_datetime(orders_df['order_date'])
+    orders_df['revenue_generated'] = pd.to_numeric(orders_df['revenue_generated'], errors='coerce').fillna(0)
+    return orders_df
+
+
+def _typed_payments(payment_log_df):
+    # Your original code used 'invoice_date'. This is preserved.
+    payment_log_df['invoice_date'] = pd.to_datetime(payment_log_df['invoice_date'])
+    return payment_log_df
+
+
+def read_marts(conn, after_order_key=None):
+    """
+    Reads and types the three marts from SQLite: (performance_df, orders_df, payment_log_df).
+    With after_order_key, orders_df holds only the orders with a higher order_key, read from
+    the monthly partitions of raw_tracking_data that can hold them (utils/partitions.py).
+    """
+    # CHANGE: The SQL queries now use the original table names from your database.
+    performance_df = pd.read_sql_query("SELECT * FROM influencer_performance", conn)
+
+    # Key columns that can be NULL (organic orders have no influencer or post) arrive as
+    # float64 with NaN; isin, unique and nunique treat them as plain numbers.
+    if after_order_key is not None:
+        query, params = new_orders_query(conn, after_order_key)
+        orders_df = pd.read_sql_query(query, conn, params=params)
+    else:
+        orders_df = pd.read_sql_query("SELECT * FROM enriched_orders", conn)
+    orders_df = _typed_orders(orders_df)
+
+    payment_log_df = _typed_payments(pd.read_sql_query("SELECT * FROM payments_log", conn))
+
+    return performance_df, orders_df, payment_log_df
+
+
+def read_mart_range(conn, mart, start_date, end_date):
+    """
+    Reads and types the rows of the enriched_orders or payments_log mart dated within
+    [start_date, end_date], typed as read_marts types them, from only the monthly
+    partitions of raw_tracking_data that the range overlaps (utils/partitions.py).
+    """
+    query, params = mart_query(conn, mart, start_date, end_date)
+    frame = pd.read_sql_query(query, conn, params=params)
+    return _typed_orders(frame) if mart == 'enriched_orders' else _typed_payments(frame)
+
+
+def to_arrow(frame):
+    """Converts a mart to an Arrow table column by column (NaN kept as NaN, NaT and missing text as null)."""
+    arrays = []
+    for name in frame.columns:
+        column = frame[name]
+        if column.dtype.kind in 'biuf':
+            arrays.append(pa.array(column.to_numpy(), from_pandas=False))
+        elif column.dtype.kind == 'M':
+            arrays.append(pa.array(column.to_numpy(), from_pandas=True))
+        else:
+            arrays.append(pa.array(column, type=pa.string(), from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(name) for name in frame.columns])
+
+
+def _source_mtime(source_path):
+    """Last modification of the database, including commits still in its write-ahead log."""
+    wal_path = f"{source_path}-wal"
+    wal_mtime = os.stat(wal_path).st_mtime_ns if os.path.exists(wal_path) else 0
+    return max(os.stat(source_path).st_mtime_ns, wal_mtime)
+
+
+def write_snapshot(frames, source_path, snapshot_dir=SNAPSHOT_DIR, dataset_version=None):
+    """
+    Writes the typed marts (in SNAPSHOT_MARTS order) as the snapshot of the database at
+    source_path. The new snapshot is built next to the old one and swapped in by renaming.
+    dataset_version defaults to the latest committed one; a writer that publishes a version
+    in the transaction it read the marts in passes that version instead.
+    """
+    staging = snapshot_dir.with_name(snapshot_dir.name + '.tmp')
+    previous = snapshot_dir.with_name(snapshot_dir.name + '.old')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "source": str(source_path),
+        "source_mtime_ns": _source_mtime(source_path),
+        "dataset_version": read_dataset_version(source_path) if dataset_version is None else dataset_version,
+        "marts": {},
+    }
+    orders_df = frames[SNAPSHOT_MARTS.index('enriched_orders')]
+    if 'order_key' in orders_df.columns and len(orders_df):
+        manifest["order_key_max"] = int(orders_df['order_key'].max())
+    for mart, frame in zip(SNAPSHOT_MARTS, frames):
+        table = to_arrow(frame)
+        with pa.OSFile(str(staging / f"{mart}.arrow"), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        manifest["marts"][mart] = {"rows": len(frame), "columns": list(table.column_names)}
+    (staging / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+
+    # Processes that mapped the old files keep reading them until they reload
+    shutil.rmtree(previous, ignore_errors=True)
+    if snapshot_dir.exists():
+        snapshot_dir.rename(previous)
+    staging.rename(snapshot_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def read_snapshot(source_path, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Maps the snapshot as (performance_df, orders_df, payment_log_df), or returns None when
+    there is no snapshot or the database changed after it was taken (see the notes above).
+    The frames are read-only views of the mapped files.
+    """
+    manifest_path = snapshot_dir / 'manifest.json'
+    if not manifest_path.exists() or not os.path.exists(source_path):
+        return None
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    version = read_dataset_version(source_path)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("dataset_version", 0) != version:
+        return None
+    # Older, not just different: the -wal file disappearing when the last connection closes
+    # must not invalidate the snapshot.
+    if version == 0 and _source_mtime(source_path) > manifest.get("source_mtime_ns", -1):
+        return None
+
+    frames = []
+    for mart in SNAPSHOT_MARTS:
+        # The table's buffers keep the mapping alive after this function returns
+        source = pa.memory_map(str(snapshot_dir / f"{mart}.arrow"), 'r')
+        table = pa.ipc.open_file(source).read_all()
+        frames.append(table.to_pandas(split_blocks=True))
+    return tuple(frames)
+
+
+def update_snapshot(conn, source_path, dataset_version, appended_tables, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Writes the snapshot of dataset_version, which the caller is publishing on conn after
+    appending to appended_tables; returns the manifest. When the current snapshot is of the
+    committed version and only orders were appended, its orders are kept and only the new
+    ones are read (see the notes above); otherwise every mart is read.
+    """
+    manifest_path = snapshot_dir / 'manifest.json'
+    frames = read_snapshot(source_path, snapshot_dir)
+    after_order_key = None
+    if frames is not None and set(appended_tables) <= ORDER_APPEND_TABLES:
+        after_order_key = json.loads(manifest_path.read_text(encoding='utf-8')).get("order_key_max")
+    if after_order_key is None:
+        return write_snapshot(read_marts(conn), source_path, snapshot_dir, dataset_version)
+
+    performance_df, new_orders_df, payment_log_df = read_marts(conn, after_order_key)
+    orders_df = frames[SNAPSHOT_MARTS.index('enriched_orders')]
+    # Same dtypes as the snapshot's, also for columns that are all NULL in the new orders
+    new_orders_df = new_orders_df.astype(orders_df.dtypes.to_dict())
+    orders_df = pd.concat([orders_df, new_orders_df], ignore_index=True)
+    orders_df = orders_df.sort_values('order_date', kind='stable', ignore_index=True)
+    return write_snapshot((performance_df, orders_df, payment_log_df), source_path, snapshot_dir, dataset_version)
+
+
+def snapshot_database(db_path, snapshot_dir=SNAPSHOT_DIR):
+    """Reads the marts of the database at db_path and writes them as its snapshot; returns the manifest."""
+    with closing(connect(db_path, label="snapshot_database")) as conn, conn:
+        frames = read_marts(conn)
+    return write_snapshot(frames, db_path, snapshot_dir)
+
+
+def load_marts(db_path, label="load_all_data"):
+    """
+    The marts of the database at db_path as (performance_df, orders_df, payment_log_df):
+    its snapshot, mapped, when current; otherwise read from SQLite. label names the caller
+    in the slow-query log.
+    """
+    # Memory-mapped snapshot written by create_sql_marts.py (shared with other server processes)
+    frames = read_snapshot(db_path)
+    if frames is not None:
+        print(f"Mapped data snapshot of SQLite database: {db_path}")
+        return frames
+
+    print(f"Attempting to load data from SQLite database: {db_path}")
+    # Traced connection: statements over SLOW_QUERY_THRESHOLD_MS go to the slow-query log
+    with closing(connect(db_path, label=label)) as conn, conn:
+        return read_marts(conn)
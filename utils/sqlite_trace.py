@@ -0,0 +1,247 @@
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from datetime import datetime, timezone
+
+from constants import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_PATH, SQL_PROGRESS_INTERVAL, TRACED_STATEMENTS_KEPT
+
+# --- SQLite Query Tracing ---
+# A drop-in sqlite3 connection that records every statement it runs:
+#   - sql: the statement text as SQLite ran it (from the trace hook, parameters expanded)
+#   - duration_ms: from execute() until the last row was fetched (or execute returned)
+#   - rows: rows fetched for queries, rows changed for INSERT/UPDATE/DELETE
+#   - vm_steps: SQLite virtual-machine instructions, counted by the progress hook
+#     (approximate, in units of SQL_PROGRESS_INTERVAL)
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are appended to a JSON-lines
+# slow-query log together with their EXPLAIN QUERY PLAN, so a mart that loses an
+# index or falls back to a full-scan join shows up in the log.
+# The hooks hold the connection weakly, so they add no reference cycle. sqlite3's statement
+# cache is one until the connection is closed, so callers close it explicitly:
+# `with closing(connect(...)) as conn, conn:` (a bare `with conn:` only commits).
+
+_log_lock = threading.Lock()
+
+
+def _first_keyword(sql):
+    """First word of a statement, upper-cased, skipping leading whitespace and -- comments."""
+    for line in sql.splitlines():
+        line = line.strip()
+        if line and not line.startswith("--"):
+            return line.split(None, 1)[0].upper()
+    return ""
+
+
+def _weak_hook(method, default=None):
+    """SQLite hook calling a connection's method without keeping the connection alive (a cycle otherwise)."""
+    method_ref = weakref.WeakMethod(method)
+
+    def hook(*args):
+        bound = method_ref()
+        return bound(*args) if bound is not None else default
+
+    return hook
+
+
+def _plan_lines(plan_rows):
+    """Formats EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as an indented tree."""
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in plan_rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return lines
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement to its TracedConnection when it finishes."""
+
+    _statement = None
+
+    def _begin(self, sql, parameters, many=False):
+        self._finish()
+        self._statement = self.connection._begin_statement(sql, parameters, many)
+
+    def _finish(self, error=None):
+        if self._statement is not None:
+            statement, self._statement = self._statement, None
+            self.connection._finish_statement(statement, error)
+
+    def _count(self, rows):
+        if self._statement is not None:
+            self._statement["rows"] += rows
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error as e:
+            self._finish(e)
+            raise
+        # Statements without a result set are complete once execute returns
+        if self.description is None:
+            self._count(max(self.rowcount, 0))
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None, many=True)
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error as e:
+            self._finish(e)
+            raise
+        self._count(max(self.rowcount, 0))
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._begin(sql_script, None, many=True)
+        try:
+            super().executescript(sql_script)
+        except sqlite3.Error as e:
+            self._finish(e)
+            raise
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is None:
+            self._finish()
+        else:
+            self._count(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count(len(rows))
+        if len(rows) < (self.arraysize if size is None else size):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count(len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        self._count(1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    sqlite3.Connection that traces the statements run through its cursors.
+    Create it with connect(); the most recent TRACED_STATEMENTS_KEPT finished statements
+    are kept in .statements.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.label = None
+        self.slow_query_ms = SLOW_QUERY_THRESHOLD_MS
+        self.statements = deque(maxlen=TRACED_STATEMENTS_KEPT)
+        self._active = None
+        self._explaining = False
+        self.set_trace_callback(_weak_hook(self._on_trace))
+        self.set_progress_handler(_weak_hook(self._on_progress, default=0), SQL_PROGRESS_INTERVAL)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # --- SQLite hooks ---
+    def _on_trace(self, sql):
+        # Keep the traced text of the active statement (parameters bound), skipping the
+        # implicit BEGIN the sqlite3 module issues before data-changing statements.
+        # executemany/executescript keep their own text rather than the first traced row.
+        active = self._active
+        if active is None or active["many"] or self._explaining or active["traced_sql"] is not None:
+            return
+        if _first_keyword(sql) == _first_keyword(active["sql"]):
+            active["traced_sql"] = sql
+
+    def _on_progress(self):
+        if self._active is not None and not self._explaining:
+            self._active["vm_steps"] += SQL_PROGRESS_INTERVAL
+        return 0 # Never interrupt the statement
+
+    # --- Statement bookkeeping (called by TracedCursor) ---
+    def _begin_statement(self, sql, parameters, many):
+        statement = {
+            "sql": sql,
+            "parameters": parameters,
+            "many": many,
+            "traced_sql": None,
+            "rows": 0,
+            "vm_steps": 0,
+            "started": time.perf_counter(),
+        }
+        self._active = statement
+        return statement
+
+    def _finish_statement(self, statement, error):
+        duration_ms = (time.perf_counter() - statement["started"]) * 1000
+        if self._active is statement:
+            self._active = None
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "label": self.label,
+            "sql": (statement["traced_sql"] or statement["sql"]).strip(),
+            "duration_ms": round(duration_ms, 3),
+            "rows": statement["rows"],
+            "vm_steps": statement["vm_steps"],
+            "error": str(error) if error is not None else None,
+        }
+        self.statements.append(record)
+        if duration_ms >= self.slow_query_ms and error is None:
+            record["plan"] = self.explain(statement["sql"], statement["parameters"]) if not statement["many"] else []
+            _write_slow_query(record)
+
+    def explain(self, sql, parameters=()):
+        """Returns the EXPLAIN QUERY PLAN of a statement as indented lines (empty if it has none)."""
+        self._explaining = True
+        try:
+            plan_rows = sqlite3.Connection.cursor(self).execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+            return _plan_lines(plan_rows)
+        except sqlite3.Error as e:
+            return [f"(no plan: {e})"]
+        finally:
+            self._explaining = False
+
+    def summary(self):
+        """Returns (statement count, total duration in ms, total rows) of the statements kept."""
+        return (
+            len(self.statements),
+            round(sum(record["duration_ms"] for record in self.statements), 3),
+            sum(record["rows"] for record in self.statements),
+        )
+
+
+def _write_slow_query(record):
+    SLOW_QUERY_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with _log_lock, open(SLOW_QUERY_LOG_PATH, "a", encoding="utf-8") as log_file:
+        log_file.write(json.dumps(record) + "\n")
+
+
+def connect(database, label=None, slow_query_ms=SLOW_QUERY_THRESHOLD_MS, **kwargs):
+    """
+    Opens a traced SQLite connection; accepts the same arguments as sqlite3.connect.
+    label names the caller in the slow-query log (e.g. 'load_all_data').
+    """
+    conn = sqlite3.connect(database, factory=TracedConnection, **kwargs)
+    conn.label = label
+    conn.slow_query_ms = slow_query_ms
+    return conn
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from constants import DB_PATH, RESULT_CACHE_WARM_UP, STAGING_DB_PATH
+from utils.dataset_version import publish_version, read_dataset_version
+from utils.snapshot import SNAPSHOT_MARTS, snapshot_database
+from utils.sqlite_trace import connect
+
+# --- Build-Then-Swap ETL ---
+# The ETL scripts never rebuild the database the dashboard is reading. They build into a
+# staging file, validate it, and only then put it in place:
+#   - no database yet: the staging file is renamed into place (atomic rename)
+#   - otherwise: the staging database is copied into the live one with SQLite's backup
+#     API, as one write transaction on a WAL-mode database
+# A WAL database cannot safely be replaced by renaming another file over it: readers that
+# still have it open keep its -wal and -shm files, which the new file would then pick up.
+# In WAL mode readers never wait for the writer and keep seeing the previous version of
+# the data until the copy commits, so the dashboard sees either the old database or the
+# new one, never a half-built one. The staging database also gets the next dataset version
+# (utils/dataset_version.py), so the dashboard's caches switch over with the swap.
+# Incremental writes to the live database (refreshes
+# that append instead of rebuilding) get the same guarantee from WAL mode.
+# With RESULT_CACHE_WARM_UP, the KPI service's most requested results for the new version
+# are then precomputed into the persistent result cache (kpi_service.warm_up).
+
+REQUIRED_TABLES = ['raw_influencers', 'raw_posts', 'raw_tracking_data', 'raw_payouts', 'dim_influencer', 'dim_post', 'dim_user']
+SWAP_BUSY_TIMEOUT_S = 30 # How long the swap waits for another writer (e.g. a running refresh)
+
+
+def enable_wal(db_path):
+    """Switches a database to WAL mode (persistent); returns the journal mode it ends up in."""
+    with closing(sqlite3.connect(db_path, timeout=SWAP_BUSY_TIMEOUT_S)) as conn:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+
+
+def validate_database(db_path):
+    """
+    Checks that a built database can be served: it passes SQLite's quick_check, has the
+    raw and dimension tables, and every mart returns rows. Returns the mart row counts;
+    raises RuntimeError with the problems found otherwise.
+    """
+    problems = []
+    counts = {}
+    with closing(connect(db_path, label="validate_database")) as conn:
+        check = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if check != 'ok':
+            problems.append(f"quick_check: {check}")
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        problems += [f"missing table or view: {name}" for name in REQUIRED_TABLES + SNAPSHOT_MARTS if name not in existing]
+        for mart in SNAPSHOT_MARTS:
+            if mart not in existing:
+                continue
+            try:
+                counts[mart] = conn.execute(f"SELECT COUNT(*) FROM {mart}").fetchone()[0]
+            except sqlite3.Error as e:
+                problems.append(f"{mart}: {e}")
+                continue
+            if counts[mart] == 0:
+                problems.append(f"{mart} is empty")
+    if problems:
+        raise RuntimeError(f"Staging database {db_path} failed validation: " + "; ".join(problems))
+    return counts
+
+
+def swap_into_place(staging_path, db_path=DB_PATH):
+    """Puts a validated staging database in place of db_path (see the notes above) and removes the staging file."""
+    if not os.path.exists(db_path):
+        os.replace(staging_path, db_path)
+        enable_wal(db_path)
+        return
+
+    if enable_wal(db_path) != 'wal':
+        # Another connection kept the switch from happening; the copy below is still one
+        # transaction, but readers may have to wait for it this time.
+        print(f"Warning: could not switch {db_path} to WAL mode; readers may block during the swap.")
+    with closing(sqlite3.connect(staging_path)) as source, closing(sqlite3.connect(db_path, timeout=SWAP_BUSY_TIMEOUT_S)) as target:
+        source.backup(target)
+        # Copy the committed pages into the main file and truncate the WAL the copy filled
+        busy = target.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+        if busy:
+            print("Note: readers kept the WAL from being fully checkpointed; it will be on a later write.")
+    os.remove(staging_path)
+
+
+def rebuild_database(build, source, db_path=DB_PATH, staging_path=STAGING_DB_PATH, from_live=False):
+    """
+    Runs build(staging_path) on a staging database, validates it, publishes the next dataset
+    version in it (source names the caller), swaps it into place and refreshes the mart snapshot. With from_live the staging database starts as a copy of
+    the live one (e.g. to rebuild only the marts); otherwise it starts empty.
+    A failed build or validation leaves the live database untouched.
+    """
+    started = time.perf_counter()
+    for path in [staging_path] + [f"{staging_path}{suffix}" for suffix in ('-journal', '-wal', '-shm')]:
+        if os.path.exists(path):
+            os.remove(path)
+    if from_live:
+        with closing(sqlite3.connect(db_path)) as live, closing(sqlite3.connect(staging_path)) as target:
+            live.backup(target)
+            # The copy inherits WAL mode; the staging file needs no -wal/-shm files of its own
+            target.execute("PRAGMA journal_mode=DELETE")
+
+    print(f"\n[Staging] Building into {staging_path}...")
+    try:
+        build(staging_path)
+        counts = validate_database(staging_path)
+    except Exception:
+        print(f"[Staging] Build failed; {db_path} was not changed. The staging file is left for inspection.")
+        raise
+    print("[Staging] Validated: " + ", ".join(f"{mart}: {rows:,} rows" for mart, rows in counts.items()))
+    with closing(sqlite3.connect(staging_path)) as conn, conn:
+        version = publish_version(conn, source, counts, at_least=read_dataset_version(db_path))
+
+    swap_into_place(staging_path, db_path)
+    print(f"[Staging] Swapped into {db_path} as dataset version {version}.")
+    manifest = snapshot_database(db_path)
+    print(f"[Staging] Snapshot refreshed ({len(manifest['marts'])} marts); done in {time.perf_counter() - started:.1f} s.")
+    if RESULT_CACHE_WARM_UP:
+        try:
+            from kpi_service import warm_up # Loads the dashboard's data stack, only when warming
+            warm_up(db_path)
+        except Exception as e: # The database is in place; a cold cache only costs the first requests
+            print(f"[Staging] Result cache warm-up failed: {e}")
@@ -0,0 +1,252 @@
+import numpy as np
+import pandas as pd
+
+# --- Prefix-Sum Time Index ---
+# Daily cumulative sums over the loaded marts, so that any [start_date, end_date]
+# KPI is answered with two binary searches and one subtraction instead of
+# re-summing every matching row on each sidebar change.
+#
+# Rows are grouped by (group, day) and stored under a single composite integer key
+# (group_code * span + day_offset). Because the keys are sorted, the days of one
+# group form a contiguous run, so a date range inside a group is found with
+# np.searchsorted and summed as cumulative[right] - cumulative[left].
+#
+# Money is stored in paise (int64) so range sums are exact and match the
+# rounded values shown on the KPI cards.
+
+ORDER_METRICS = ['revenue', 'influenced_revenue', 'orders', 'influenced_orders']
+MONEY_METRICS = {'revenue', 'influenced_revenue', 'payout'}
+ORGANIC_PLATFORM = 'Organic'
+CALENDAR_GRANULARITIES = ['day', 'week', 'month', 'quarter']
+
+
+def to_days(dates):
+    """Converts a datetime Series to integer day numbers (days since the epoch)."""
+    return dates.values.astype('datetime64[D]').astype(np.int64)
+
+
+def to_day(date):
+    """Converts a single date (date, datetime or Timestamp) to its day number."""
+    return np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64)
+
+
+def _to_minor_units(values):
+    """Converts rupee amounts to integer paise for exact cumulative sums."""
+    return np.round(pd.to_numeric(values, errors='coerce').fillna(0).to_numpy(dtype=float) * 100).astype(np.int64)
+
+
+def order_cells(orders_df):
+    """
+    Assigns every order to a (brand, product, platform) cell.
+    Returns the integer cell code of each row and a DataFrame of cell labels.
+    Missing platforms are grouped under 'Organic', mirroring the sidebar's platform filter.
+    """
+    platform = orders_df['platform'].fillna(ORGANIC_PLATFORM).replace('', ORGANIC_PLATFORM)
+    cells = pd.DataFrame({
+        'brand': orders_df['brand'].to_numpy(),
+        'product': orders_df['product'].to_numpy(),
+        'platform': platform.to_numpy(),
+    })
+    cell_codes, cell_labels = pd.MultiIndex.from_frame(cells).factorize()
+    return cell_codes, pd.DataFrame(list(cell_labels), columns=cells.columns)
+
+
+def select_cells(cells, brand=None, product=None, platform=None):
+    """Returns the codes of the cells matching the selections (None means all)."""
+    mask = np.ones(len(cells), dtype=bool)
+    for column, selection in (('brand', brand), ('product', product), ('platform', platform)):
+        if selection is not None:
+            mask &= cells[column].isin(list(selection)).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def build_calendar(first_day, last_day):
+    """
+    Builds the calendar dimension: one row per day between two day numbers with its
+    day, week, month and quarter labels, plus an integer bucket code per granularity.
+    Weeks end on Sunday, matching pandas' resample('W') labels.
+    """
+    dates = pd.date_range(pd.Timestamp(np.datetime64(int(first_day), 'D')), pd.Timestamp(np.datetime64(int(last_day), 'D')), freq='D')
+    calendar = pd.DataFrame({
+        'date': dates,
+        'day': dates.strftime('%Y-%m-%d'),
+        'week': dates.to_period('W').end_time.strftime('%Y-%m-%d'),
+        'month': dates.to_period('M').astype(str),
+        'quarter': dates.to_period('Q').astype(str),
+    })
+    for granularity in CALENDAR_GRANULARITIES:
+        calendar[granularity + '_code'] = pd.factorize(calendar[granularity])[0]
+    return calendar
+
+
+class _PrefixSums:
+    """
+    Cumulative sums of one or more metrics keyed by (group_code, day).
+    Supports range sums for any set of groups in a single vectorized lookup.
+    """
+
+    def __init__(self, group_codes, days, metrics):
+        self.first_day = int(days.min()) if len(days) else 0
+        self.span = int(days.max()) - self.first_day + 1 if len(days) else 1
+
+        keys = group_codes.astype(np.int64) * self.span + (days - self.first_day)
+        daily = pd.DataFrame(metrics).groupby(keys).sum()
+
+        self.keys = daily.index.to_numpy(dtype=np.int64)
+        self.key_groups = self.keys // self.span
+        self.key_days = self.keys % self.span
+        self.values = {name: daily[name].to_numpy(dtype=np.int64) for name in daily.columns}
+        # A leading zero lets cumulative[right] - cumulative[left] cover empty ranges.
+        self.cumulative = {
+            name: np.concatenate(([0], daily[name].to_numpy(dtype=np.int64).cumsum()))
+            for name in daily.columns
+        }
+
+    def range_sums(self, metric, group_codes, start_day, end_day):
+        """Returns a metric summed over [start_day, end_day] (inclusive) for each of the given group codes."""
+        start = max(start_day - self.first_day, 0)
+        end = min(end_day - self.first_day, self.span - 1)
+        if start > end or len(group_codes) == 0:
+            return np.zeros(len(group_codes), dtype=np.int64)
+
+        base = np.asarray(group_codes, dtype=np.int64) * self.span
+        left = np.searchsorted(self.keys, base + start, side='left')
+        right = np.searchsorted(self.keys, base + end, side='right')
+        cumulative = self.cumulative[metric]
+        return cumulative[right] - cumulative[left]
+
+    def range_sum(self, metric, group_codes, start_day, end_day):
+        """Sums a metric over [start_day, end_day] (inclusive) for the given group codes."""
+        return int(self.range_sums(metric, group_codes, start_day, end_day).sum())
+
+    def daily(self, metric, group_codes, start_day, end_day):
+        """Returns the per-day totals of a metric over [start_day, end_day] for the given group codes."""
+        length = max(end_day - start_day + 1, 0)
+        offset = start_day - self.first_day
+        mask = np.isin(self.key_groups, group_codes)
+        mask &= (self.key_days >= offset) & (self.key_days <= end_day - self.first_day)
+        return np.bincount(self.key_days[mask] - offset, weights=self.values[metric][mask], minlength=length)[:length]
+
+
+class TimeIndex:
+    """
+    Precomputed daily prefix sums for date-range KPIs.
+
+    Order metrics (revenue, influenced revenue, order counts) are kept per
+    (brand, product, platform) cell, so any combination of the sidebar's
+    multiselects is a sum over the selected cells. Payout is kept per
+    influencer, matching how filter_dataframes restricts payments_log to the
+    influencers present in the filtered orders; which influencers those are is
+    answered from order counts per (influencer, cell) pair.
+    """
+
+    def __init__(self, orders_df, payment_log_df):
+        # --- Orders: one group per (brand, product, platform) cell ---
+        cell_codes, self.cells = order_cells(orders_df)
+
+        influenced = (orders_df['attribution_type'] == 'Influenced').to_numpy()
+        revenue = _to_minor_units(orders_df['revenue_generated'])
+        self.orders = _PrefixSums(cell_codes, to_days(orders_df['order_date']), {
+            'revenue': revenue,
+            'influenced_revenue': np.where(influenced, revenue, 0),
+            'orders': np.ones(len(orders_df), dtype=np.int64),
+            'influenced_orders': influenced.astype(np.int64),
+        })
+
+        # --- Influencers with orders: one group per (influencer, cell) pair ---
+        attributed = orders_df['influencer_key'].notna().to_numpy()
+        influencer_codes, self.order_influencers = pd.factorize(orders_df['influencer_key'].to_numpy()[attributed])
+        pair_codes, pairs = pd.factorize(influencer_codes.astype(np.int64) * len(self.cells) + cell_codes[attributed])
+        self.pair_influencers, self.pair_cells = pairs // len(self.cells), pairs % len(self.cells)
+        self.influencer_orders = _PrefixSums(pair_codes, to_days(orders_df['order_date'])[attributed], {
+            'orders': np.ones(len(pair_codes), dtype=np.int64),
+        })
+
+        # --- Payments: one group per influencer ---
+        influencer_codes, influencer_labels = pd.factorize(payment_log_df['influencer_key'])
+        self.influencer_codes = pd.Series(np.arange(len(influencer_labels)), index=influencer_labels)
+        self.payments = _PrefixSums(influencer_codes, to_days(payment_log_df['invoice_date']), {
+            'payout': _to_minor_units(payment_log_df['payment_amount']),
+        })
+
+        # --- Calendar dimension covering both orders and payments ---
+        first_day = min(self.orders.first_day, self.payments.first_day)
+        last_day = max(self.orders.first_day + self.orders.span, self.payments.first_day + self.payments.span) - 1
+        self.calendar = build_calendar(first_day, last_day)
+        self.calendar_first_day = first_day
+
+    def range_sum(self, metric, start_date, end_date, brand=None, product=None, platform=None):
+        """
+        Returns an order metric over [start_date, end_date] for the selected brands,
+        products and platforms. Missing platforms are grouped under 'Organic',
+        mirroring the sidebar's platform filter.
+        """
+        codes = select_cells(self.cells, brand, product, platform)
+        total = self.orders.range_sum(metric, codes, to_day(start_date), to_day(end_date))
+        return total / 100 if metric in MONEY_METRICS else total
+
+    def range_sum_by(self, dimension, metric, start_date, end_date, brand=None, product=None, platform=None):
+        """
+        Returns an order metric over [start_date, end_date] for every brand, product or
+        platform of the selected cells (every combination, for a list of dimensions).
+        """
+        codes = select_cells(self.cells, brand, product, platform)
+        totals = pd.Series(self.orders.range_sums(metric, codes, to_day(start_date), to_day(end_date)), name=metric)
+        totals = totals.groupby([self.cells[name].to_numpy()[codes] for name in np.atleast_1d(dimension)]).sum()
+        totals.index.names = list(np.atleast_1d(dimension))
+        return totals / 100 if metric in MONEY_METRICS else totals
+
+    def influencers(self, start_date, end_date, brand=None, product=None, platform=None):
+        """
+        Returns the keys of the influencers with at least one order over [start_date, end_date]
+        for the selections: the influencers of the orders filter_dataframes would select.
+        """
+        pair_codes = np.flatnonzero(np.isin(self.pair_cells, select_cells(self.cells, brand, product, platform)))
+        counts = self.influencer_orders.range_sums('orders', pair_codes, to_day(start_date), to_day(end_date))
+        return self.order_influencers[np.unique(self.pair_influencers[pair_codes[counts > 0]])]
+
+    def _influencer_codes(self, influencer_keys=None):
+        """Returns the payment group codes of the given influencers (None means all)."""
+        if influencer_keys is None:
+            return self.influencer_codes.to_numpy()
+        return self.influencer_codes.reindex(pd.Index(influencer_keys).dropna()).dropna().to_numpy()
+
+    def total_payout(self, start_date, end_date, influencer_keys=None):
+        """Returns the payout over [start_date, end_date] for the given influencers (None means all)."""
+        codes = self._influencer_codes(influencer_keys)
+        return self.payments.range_sum('payout', codes, to_day(start_date), to_day(end_date)) / 100
+
+    def bucketed_series(self, granularity, start_date, end_date, brand=None, product=None, platform=None, influencer_keys=None):
+        """
+        Returns revenue and payout over [start_date, end_date] summed into calendar
+        buckets ('day', 'week', 'month' or 'quarter'), as a DataFrame with the bucket
+        label as 'date' and 'Revenue' and 'Payout' columns.
+        """
+        start_day = max(to_day(start_date), self.calendar_first_day)
+        end_day = min(to_day(end_date), self.calendar_first_day + len(self.calendar) - 1)
+        if start_day > end_day:
+            return pd.DataFrame({'date': [], 'Revenue': [], 'Payout': []})
+
+        cell_codes = select_cells(self.cells, brand, product, platform)
+        revenue = self.orders.daily('revenue', cell_codes, start_day, end_day)
+        payout = self.payments.daily('payout', self._influencer_codes(influencer_keys), start_day, end_day)
+
+        # Daily totals are summed into the calendar's precomputed bucket codes.
+        days = self.calendar.iloc[start_day - self.calendar_first_day:end_day - self.calendar_first_day + 1]
+        codes = days[granularity + '_code'].to_numpy()
+        codes = codes - codes[0]
+        return pd.DataFrame({
+            'date': days[granularity].drop_duplicates().to_numpy(),
+            'Revenue': np.bincount(codes, weights=revenue) / 100,
+            'Payout': np.bincount(codes, weights=payout) / 100,
+        })
+
+    def order_kpis(self, start_date, end_date, brand=None, product=None, platform=None):
+        """Returns all order metrics over [start_date, end_date] for the selections."""
+        codes = select_cells(self.cells, brand, product, platform)
+        start_day, end_day = to_day(start_date), to_day(end_date)
+        kpis = {}
+        for metric in ORDER_METRICS:
+            total = self.orders.range_sum(metric, codes, start_day, end_day)
+            kpis[metric] = total / 100 if metric in MONEY_METRICS else total
+        return kpis
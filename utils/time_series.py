@@ -0,0 +1,51 @@
+import numpy as np
+
+# --- Time-Series Downsampling ---
+# Largest-Triangle-Three-Buckets (LTTB) keeps the visual shape of a line chart
+# while capping the number of points sent to the browser, e.g. for daily
+# granularity over multi-year ranges.
+
+
+def lttb_indices(values, threshold):
+    """
+    Returns the indices of the points selected by LTTB for a series of y-values
+    (x is the position). The first and last points are always kept.
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    values = np.asarray(values, dtype=np.float64)
+    x = np.arange(n, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex.
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        average_x = x[next_start:next_end].mean()
+        average_y = values[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - average_x) * (values[start:end] - values[previous])
+            - (x[previous] - x[start:end]) * (average_y - values[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_series(chart_data, columns, max_points):
+    """
+    Caps a time-series DataFrame at max_points rows. Each column gets an equal share
+    of the points through LTTB and the union of the selected rows is kept, so spikes
+    in any one series survive on the shared x-axis.
+    """
+    if len(chart_data) <= max_points:
+        return chart_data
+    share = max(max_points // len(columns), 3)
+    keep = np.unique(np.concatenate([lttb_indices(chart_data[column].to_numpy(), share) for column in columns]))
+    return chart_data.iloc[keep].reset_index(drop=True)
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 
 def load_css(file_path):
     """
@@ -37,6 +38,88 @@ def format_indian_currency(value):
 
     return formatted_other_numbers_rev[::-1] + ',' + last_three
 
+# Largest magnitude handled by the int64 fast path of format_indian_currency_series.
+_INT64_LIMIT = 2 ** 63 - 1
+
+def _group_indian_digits(integers):
+    """
+    Formats an int64 array with Indian digit grouping in one pass over a byte matrix.
+    Mirrors format_indian_currency character for character: the last three characters
+    form one group and the rest are grouped in pairs (a leading '-' counts as a character).
+    """
+    digits = integers.astype('S20')
+    lengths = np.char.str_len(digits)
+    matrix = digits.view(np.uint8).reshape(len(digits), digits.dtype.itemsize)
+
+    out_width = digits.dtype.itemsize + (digits.dtype.itemsize - 2) // 2
+    out = np.zeros((len(digits), out_width), dtype=np.uint8)
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)[:, None]
+        # Commas go before characters length-3, length-5, ... (never before the first one)
+        comma_before = np.arange(length - 3, 0, -2)[::-1]
+        source = np.arange(length)
+        out[rows, source + np.searchsorted(comma_before, source, side='right')] = matrix[rows, source]
+        out[rows, comma_before + np.arange(len(comma_before))] = ord(',')
+    return out.view(f'S{out_width}').ravel().astype(str)
+
+def format_indian_currency_series(values, prefix=''):
+    """
+    Vectorized format_indian_currency for a whole Series or array. The optional prefix
+    (e.g. '₹') is prepended to every result, 'N/A' included. Each distinct value is formatted once and the results are
+    expanded back, so repeated values (fixed product prices) cost nothing extra.
+    Returns a Series with the same index for Series input, otherwise an object array.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    array = np.asarray(values)
+    if array.dtype.kind in 'biuf':
+        numbers = array.astype(np.float64) if array.dtype.kind in 'bf' else array
+        valid = ~pd.isna(numbers)
+    else:
+        # Object input: only real numbers are formatted, anything else is 'N/A'
+        valid = np.array([pd.api.types.is_number(v) and not pd.isna(v) for v in array], dtype=bool)
+        numbers = np.where(valid, array, 0)
+
+    result = np.full(len(array), prefix + 'N/A', dtype=object)
+    if valid.any():
+        if array.dtype.kind in 'iu':
+            truncated = numbers[valid].astype(np.int64) if array.dtype.kind == 'i' else numbers[valid]
+        elif array.dtype.kind == 'O':
+            # int() of each value, as the scalar formatter does: exact for integers beyond 2**53,
+            # which a float would round (and it raises on infinity the same way)
+            truncated = np.array([int(v) for v in numbers[valid]], dtype=object)
+        else:
+            truncated = np.trunc(numbers[valid].astype(np.float64))
+            if not np.isfinite(truncated).all():
+                raise OverflowError("cannot convert float infinity to integer")
+
+        uniques, inverse = np.unique(truncated, return_inverse=True)
+        if uniques.dtype.kind == 'O':
+            in_range = np.array([abs(v) < _INT64_LIMIT for v in uniques], dtype=bool)
+        else:
+            in_range = np.abs(uniques.astype(np.float64)) < _INT64_LIMIT
+        formatted = _group_indian_digits(uniques[in_range].astype(np.int64))
+        if not in_range.all():
+            # Magnitudes beyond int64 fall back to the scalar formatter
+            merged = np.empty(len(uniques), dtype=object)
+            merged[in_range] = formatted
+            merged[~in_range] = [format_indian_currency(int(v)) for v in uniques[~in_range]]
+            formatted = merged.astype(str)
+        if prefix:
+            formatted = np.char.add(prefix, formatted)
+        result[valid] = formatted[inverse.ravel()]
+
+    return pd.Series(result, index=index, dtype=object) if index is not None else result
+
+def format_confidence_interval(half_width, currency=False):
+    """
+    Formats the half-width of a 95% confidence interval as a small note for KPI cards.
+    Returns an empty string for exact values (half_width is None).
+    """
+    if half_width is None or pd.isna(half_width):
+        return ''
+    prefix = '₹' if currency else ''
+    return f"<small>± {prefix}{format_indian_currency(round(half_width))} (95% CI)</small>"
+
 # Your original commented-out function is preserved.
 # @st.cache_data
 # def to_csv(df):